@@ -1,17 +1,47 @@
 import cv2
 import mediapipe as mp
-import numpy as np
 from collections import defaultdict
-import time
-import base64
+import logging
+from geometry import JointGeometry, fixed, midpoint, offset
+from landmarks import (LEFT_ANKLE, LEFT_HIP, LEFT_KNEE, LEFT_SHOULDER, LEFT_WRIST, RIGHT_ANKLE,
+                       RIGHT_HIP, RIGHT_KNEE, RIGHT_SHOULDER, RIGHT_WRIST)
+from pose import PoseEstimator
+from timing import ExerciseClock
+
+logger = logging.getLogger(__name__)
+
+# Everything check_warrior_pose measures, computed in one pass per frame
+GEOMETRY = JointGeometry(
+    points={
+        "mid_hip": midpoint(LEFT_HIP, RIGHT_HIP),
+        "mid_shoulder": midpoint(LEFT_SHOULDER, RIGHT_SHOULDER),
+        "right_of_right_hip": offset(RIGHT_HIP, 1, 0),
+        "left_of_left_hip": offset(LEFT_HIP, -1, 0),
+        "vertical": fixed(0, 1),
+    },
+    angles={
+        "left_knee": (LEFT_HIP, LEFT_KNEE, LEFT_ANKLE),
+        "right_knee": (RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE),
+        # Hip line against the horizontal, with the left or the right leg in front
+        "hip_left_front": (LEFT_HIP, RIGHT_HIP, "right_of_right_hip"),
+        "hip_right_front": (RIGHT_HIP, LEFT_HIP, "left_of_left_hip"),
+        "torso": ("mid_hip", "mid_shoulder", "vertical"),
+        "shoulder_hip": (LEFT_SHOULDER, RIGHT_SHOULDER, RIGHT_HIP),
+        "left_arm": (RIGHT_SHOULDER, LEFT_SHOULDER, LEFT_WRIST),
+        "right_arm": (LEFT_SHOULDER, RIGHT_SHOULDER, RIGHT_WRIST),
+    },
+)
 
 
 class WarriorPoseAnalyzer:
-    def __init__(self, record_seconds=10, fps=30):
-        # Initialize MediaPipe Pose
+    # Payload key that carries the encoded frame
+    frame_key = "data"
+
+    def __init__(self, delay_seconds=3, pose=None):
+        # MediaPipe Pose, only loaded if this analyzer is given raw frames
         self.mp_pose = mp.solutions.pose
         self.mp_drawing = mp.solutions.drawing_utils
-        self.pose = self.mp_pose.Pose()
+        self.pose = pose or PoseEstimator(model_complexity=1)
 
         # Define adjustable thresholds
         self.THRESHOLDS = {
@@ -23,69 +53,43 @@ class WarriorPoseAnalyzer:
             "shoulder_hip_alignment": (0, 40)
         }
 
-        # Recording settings
-        self.fps = fps
-        self.delay_frames = 3 * fps  # 3 seconds delay
-        self.record_frames = record_seconds * fps  # Number of frames to record
+        # Recording settings; durations come from frame timestamps (see timing.py)
+        self.clock = ExerciseClock()
+        self.delay_seconds = delay_seconds  # Delay before recording starts
         self.frame_count = 0
+        self.start_frame = 0
         self.recording = False
         self.report = {
             "good_form_frames": 0,
-            "error_counts": defaultdict(int)  # Tracks each error's frequency
+            "error_counts": defaultdict(int),  # Tracks each error's frequency
+            "recorded_seconds": 0.0,
+            "good_form_seconds": 0.0,
+            "error_seconds": defaultdict(float)
         }
 
-    def calculate_angle(self, p1, p2, p3):
-        """Calculate the angle between three points in degrees."""
-        a = np.array(p1)
-        b = np.array(p2)
-        c = np.array(p3)
-        ba = a - b
-        bc = c - b
-        cosine_angle = np.dot(ba, bc) / (np.linalg.norm(ba) * np.linalg.norm(bc))
-        angle = np.arccos(cosine_angle) * 180 / np.pi
-        return angle
-
     def check_warrior_pose(self, landmarks):
-        """Analyze Warrior II pose and return top 3 errors."""
+        """Analyze Warrior II pose from a (33, 4) landmark array and return top 3 errors."""
         errors = []
+        angles = GEOMETRY.compute(landmarks).angles
+        l_hip_y = landmarks[LEFT_HIP, 1]
+        r_hip_y = landmarks[RIGHT_HIP, 1]
 
-        l_hip = [landmarks[self.mp_pose.PoseLandmark.LEFT_HIP].x, landmarks[self.mp_pose.PoseLandmark.LEFT_HIP].y]
-        r_hip = [landmarks[self.mp_pose.PoseLandmark.RIGHT_HIP].x, landmarks[self.mp_pose.PoseLandmark.RIGHT_HIP].y]
-        l_knee = [landmarks[self.mp_pose.PoseLandmark.LEFT_KNEE].x, landmarks[self.mp_pose.PoseLandmark.LEFT_KNEE].y]
-        r_knee = [landmarks[self.mp_pose.PoseLandmark.RIGHT_KNEE].x, landmarks[self.mp_pose.PoseLandmark.RIGHT_KNEE].y]
-        l_ankle = [landmarks[self.mp_pose.PoseLandmark.LEFT_ANKLE].x, landmarks[self.mp_pose.PoseLandmark.LEFT_ANKLE].y]
-        r_ankle = [landmarks[self.mp_pose.PoseLandmark.RIGHT_ANKLE].x, landmarks[self.mp_pose.PoseLandmark.RIGHT_ANKLE].y]
-        l_shoulder = [landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER].x, landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER].y]
-        r_shoulder = [landmarks[self.mp_pose.PoseLandmark.RIGHT_SHOULDER].x, landmarks[self.mp_pose.PoseLandmark.RIGHT_SHOULDER].y]
-        l_elbow = [landmarks[self.mp_pose.PoseLandmark.LEFT_ELBOW].x, landmarks[self.mp_pose.PoseLandmark.LEFT_ELBOW].y]
-        r_elbow = [landmarks[self.mp_pose.PoseLandmark.RIGHT_ELBOW].x, landmarks[self.mp_pose.PoseLandmark.RIGHT_ELBOW].y]
-        l_wrist = [landmarks[self.mp_pose.PoseLandmark.LEFT_WRIST].x, landmarks[self.mp_pose.PoseLandmark.LEFT_WRIST].y]
-        r_wrist = [landmarks[self.mp_pose.PoseLandmark.RIGHT_WRIST].x, landmarks[self.mp_pose.PoseLandmark.RIGHT_WRIST].y]
-
-        left_knee_angle = self.calculate_angle(l_hip, l_knee, l_ankle)
-        right_knee_angle = self.calculate_angle(r_hip, r_knee, r_ankle)
+        left_knee_angle = angles["left_knee"]
+        right_knee_angle = angles["right_knee"]
         
         if left_knee_angle < right_knee_angle:
-            front_hip, front_knee, front_ankle = l_hip, l_knee, l_ankle
-            back_hip, back_knee, back_ankle = r_hip, r_knee, r_ankle
+            front_is_left = True
             front_knee_angle = left_knee_angle
             back_leg_angle = right_knee_angle
-            hip_angle = self.calculate_angle(l_hip, r_hip, [r_hip[0] + 1, r_hip[1]])
+            hip_angle = angles["hip_left_front"]
         else:
-            front_hip, front_knee, front_ankle = r_hip, r_knee, r_ankle
-            back_hip, back_knee, back_ankle = l_hip, l_knee, l_ankle
+            front_is_left = False
             front_knee_angle = right_knee_angle
             back_leg_angle = left_knee_angle
-            hip_angle = self.calculate_angle(r_hip, l_hip, [l_hip[0] - 1, l_hip[1]])
+            hip_angle = angles["hip_right_front"]
 
-        torso_angle = self.calculate_angle(
-            [(l_hip[0] + r_hip[0]) / 2, (l_hip[1] + r_hip[1]) / 2],
-            [(l_shoulder[0] + r_shoulder[0]) / 2, (l_shoulder[1] + r_shoulder[1]) / 2],
-            [0, 1]
-        )
-        #l_arm_angle = self.calculate_angle(l_shoulder, l_elbow, l_wrist)
-        #r_arm_angle = self.calculate_angle(r_shoulder, r_elbow, r_wrist)
-        shoulder_hip_angle = self.calculate_angle(l_shoulder, r_shoulder, r_hip)
+        torso_angle = angles["torso"]
+        shoulder_hip_angle = angles["shoulder_hip"]
 
         if not self.THRESHOLDS["front_knee_angle"][0] <= front_knee_angle <= self.THRESHOLDS["front_knee_angle"][1]:
             errors.append("Bend your front knee more." if front_knee_angle > 100 else "Straighten your front knee slightly.")
@@ -93,13 +97,13 @@ class WarriorPoseAnalyzer:
             errors.append("Straighten your back leg." if back_leg_angle < 160 else "Relax your back leg slightly.")
         
         if not self.THRESHOLDS["hip_orientation"][0] <= hip_angle <= self.THRESHOLDS["hip_orientation"][1]:
-            if front_hip == r_hip:
-                if r_hip[1] > l_hip[1]:
+            if not front_is_left:
+                if r_hip_y > l_hip_y:
                     errors.append("Level your hips; right hip is too high.")
                 else:
                     errors.append("Level your hips; left hip is too high.")
             else:
-                if l_hip[1] > r_hip[1]:
+                if l_hip_y > r_hip_y:
                     errors.append("Level your hips; left hip is too high.")
                 else:
                     errors.append("Level your hips; right hip is too high.")
@@ -108,8 +112,8 @@ class WarriorPoseAnalyzer:
         #   not self.THRESHOLDS["arm_angle"][0] <= r_arm_angle <= self.THRESHOLDS["arm_angle"][1]:
         #    errors.append("Raise your arms to shoulder level." if l_arm_angle < 170 or r_arm_angle < 170 else "Extend your arms fully.")
 
-        l_arm_angle = self.calculate_angle(r_shoulder, l_shoulder, l_wrist)
-        r_arm_angle = self.calculate_angle(l_shoulder, r_shoulder, r_wrist)
+        l_arm_angle = angles["left_arm"]
+        r_arm_angle = angles["right_arm"]
         if not self.THRESHOLDS["arm_angle"][0] <= l_arm_angle <= self.THRESHOLDS["arm_angle"][1] or \
            not self.THRESHOLDS["arm_angle"][0] <= r_arm_angle <= self.THRESHOLDS["arm_angle"][1]:
             errors.append("Raise your arms to shoulder level.")
@@ -118,19 +122,28 @@ class WarriorPoseAnalyzer:
 
     def reset_counters(self):
         """Reset frame counts and report metrics for a new session."""
+        self.clock.reset()
         self.frame_count = 0
+        self.start_frame = 0
         self.recording = False
         self.report = {
             "good_form_frames": 0,
-            "error_counts": defaultdict(int)
+            "error_counts": defaultdict(int),
+            "recorded_seconds": 0.0,
+            "good_form_seconds": 0.0,
+            "error_seconds": defaultdict(float)
         }
-        print("Warrior pose analyzer counters reset")
+        logger.debug("Warrior pose analyzer counters reset")
+
+    def warm_up(self):
+        """Nothing to preload: the form checks are plain NumPy on the landmarks."""
 
     def generate_report(self):
         """Generate and return an exercise report."""
-        total_recorded_frames = self.record_frames
-        good_form_seconds = self.report["good_form_frames"] / self.fps
-        total_seconds = total_recorded_frames / self.fps
+        total_seconds = self.report["recorded_seconds"]
+        if total_seconds <= 0:
+            return "No exercise session recorded yet."
+        good_form_seconds = self.report["good_form_seconds"]
 
         report_text = "\n--- Warrior II Exercise Report ---\n"
         report_text += f"Total Recorded Time: {total_seconds:.2f} seconds\n"
@@ -138,8 +151,8 @@ class WarriorPoseAnalyzer:
         report_text += "Errors Detected:\n"
         if self.report["error_counts"]:
             for error, count in self.report["error_counts"].items():
-                error_seconds = count / self.fps
-                report_text += f"  - '{error}': {count} frames ({error_seconds:.2f} seconds, {(count / total_recorded_frames) * 100:.1f}%)\n"
+                error_seconds = self.report["error_seconds"][error]
+                report_text += f"  - '{error}': {count} frames ({error_seconds:.2f} seconds, {(error_seconds / total_seconds) * 100:.1f}%)\n"
         else:
             report_text += "  - No errors detected!\n"
         report_text += "--------------------------------\n"
@@ -148,37 +161,37 @@ class WarriorPoseAnalyzer:
         print(report_text)
         
         return report_text
-    async def process_video(self, frame):
-        """Process a single frame and return data to broadcast."""
-        # Process the frame with MediaPipe Pose
-        results = self.pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        annotated_frame = frame.copy()  # Create a copy to annotate
+    def detect_pose(self, frame):
+        """Run MediaPipe Pose on a BGR frame and return its landmarks (or None)."""
+        return self.pose.detect(frame)
+
+    def analyze(self, pose_landmarks, timestamp=None):
+        """Check form on one frame's landmarks and return the data to broadcast.
+
+        ``timestamp`` is when the frame was captured (``time.monotonic()``); now if None.
+        """
         error_text = ""
-        if results.pose_landmarks:
-            self.mp_drawing.draw_landmarks(annotated_frame, results.pose_landmarks, self.mp_pose.POSE_CONNECTIONS)
-            errors = self.check_warrior_pose(results.pose_landmarks.landmark)
+        errors = []
+        if pose_landmarks:
+            errors = self.check_warrior_pose(pose_landmarks.array)
 
             # Update frame count and recording logic
+            step = self.clock.tick(timestamp)
             self.frame_count += 1
-            if self.frame_count > self.delay_frames and not self.recording:
+            if self.clock.elapsed > self.delay_seconds and not self.recording:
                 self.recording = True
                 self.start_frame = self.frame_count
             if self.recording and (self.frame_count - self.start_frame): # <= self.record_frames: ### REMOVED BECAUSE THIS WAS FOR TESTING
+                self.report["recorded_seconds"] += step
                 if not errors:
                     self.report["good_form_frames"] += 1
+                    self.report["good_form_seconds"] += step
                 for error in errors:
                     if error not in self.report["error_counts"]:
                         self.report["error_counts"][error] = 0
                     self.report["error_counts"][error] += 1
+                    self.report["error_seconds"][error] += step
 
-            # Display errors or "Correct Form" on the frame
-            if errors:
-                for i, error in enumerate(errors):
-                    cv2.putText(annotated_frame, error, (10, 30 + i * 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-            else:
-                cv2.putText(annotated_frame, "Correct Form", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-            
-            ### TEXT TO SPEECH PORTION
             ### TEXT TO SPEECH PORTION
             if errors:
                 error_text = errors[0]
@@ -187,28 +200,41 @@ class WarriorPoseAnalyzer:
             else:
                 error_text = "You are doing well."
 
-
-
-        
-
-
-
-        # Encode frame as base64 and return data
-        frame_base64 = self._encode_frame(annotated_frame)
         return {
             "type": "frame",
-            "data": frame_base64,
             "good_form_frames": self.report["good_form_frames"],
-            "error_counts": self.report["error_counts"],
+            "error_counts": dict(self.report["error_counts"]),
             "recording": self.recording,
             "frame_count": self.frame_count - self.start_frame if self.recording else 0,
+            "recorded_seconds": round(self.report["recorded_seconds"], 2),
+            "errors": errors,
             "error_text": error_text                ## ADDED FOR TTS
         }
 
-    def _encode_frame(self, frame):
-        """Encode frame as base64."""
-        _, buffer = cv2.imencode('.jpg', frame)
-        return base64.b64encode(buffer).decode('utf-8')
+    def annotate(self, frame, pose_landmarks, data):
+        """Draw the skeleton and the feedback from ``data`` on a copy of the frame."""
+        annotated_frame = frame.copy()  # Create a copy to annotate
+        if pose_landmarks:
+            self.mp_drawing.draw_landmarks(annotated_frame, pose_landmarks.proto, self.mp_pose.POSE_CONNECTIONS)
+
+            # Display errors or "Correct Form" on the frame
+            if data["errors"]:
+                for i, error in enumerate(data["errors"]):
+                    cv2.putText(annotated_frame, error, (10, 30 + i * 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+            else:
+                cv2.putText(annotated_frame, "Correct Form", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        return annotated_frame
+
+    def _encode_jpeg(self, frame, quality=95, scale=1.0):
+        """Encode frame as raw JPEG bytes, downscaled by ``scale``."""
+        if scale < 1.0:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+        return buffer.tobytes()
+
+    def close(self):
+        """Free the MediaPipe graph, if one was loaded."""
+        self.pose.close()
 
     def __del__(self):
         self.pose.close()
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+
+class FrameSlot:
+    """Single-slot ring buffer holding only the newest captured frame.
+
+    The capture thread overwrites the slot on every frame; the reader takes
+    whatever is newest. Every frame gets a sequence number and two capture
+    stamps: epoch seconds for clients, and ``time.monotonic()`` for measuring
+    intervals, which wall-clock adjustments do not move. A gap between two
+    sequence numbers is exactly the number of frames that went stale before
+    anyone looked at them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.seq = 0
+        self.timestamp = None
+        self.monotonic = None
+        self.frame = None
+        self.taken_seq = 0
+        self.overwritten = 0
+
+    def put(self, frame, timestamp, monotonic):
+        with self.lock:
+            if self.seq > self.taken_seq:
+                self.overwritten += 1
+            self.seq += 1
+            self.timestamp = timestamp
+            self.monotonic = monotonic
+            self.frame = frame
+
+    def take(self):
+        """Return ``(seq, timestamp, monotonic, frame)`` if a frame arrived since the last take, else None."""
+        with self.lock:
+            if self.seq == self.taken_seq:
+                return None
+            self.taken_seq = self.seq
+            frame, self.frame = self.frame, None
+            return self.seq, self.timestamp, self.monotonic, frame
+
+
+class CaptureThread:
+    """Reads a camera index or video file on its own thread into a ``FrameSlot``.
+
+    Reading never waits for the pipeline, so the driver's buffer never fills
+    with old frames and the analyzers always get the latest image. Video files
+    are played back at their own frame rate by default, so a recorded clip
+    behaves like a live camera (``realtime=False`` reads them as fast as
+    possible instead).
+    """
+
+    def __init__(self, input_source=0, width=None, height=None, fourcc=None,
+                 buffer_size=None, fps=None, realtime=None, name="capture"):
+        self.input_source = input_source
+        self.width = width
+        self.height = height
+        self.fourcc = fourcc
+        self.buffer_size = buffer_size
+        self.fps = fps
+        self.realtime = realtime
+        self.name = name
+
+        self.cap = None
+        self.thread = None
+        self.slot = FrameSlot()
+        self.stopped = False
+        self.ended = False
+        self.loop = None
+        self.frame_event = None
+
+    def open(self):
+        """Open the capture, apply its settings and start the reading thread."""
+        self.cap = cv2.VideoCapture(self.input_source)
+        if not self.cap.isOpened():
+            self.cap.release()
+            return False
+
+        # Properties the backend does not support are silently ignored
+        if self.fourcc:
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.fourcc))
+        if self.width:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        if self.height:
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        if self.fps:
+            self.cap.set(cv2.CAP_PROP_FPS, self.fps)
+        if self.buffer_size:
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_size)
+
+        is_file = os.path.isfile(str(self.input_source))
+        realtime = is_file if self.realtime is None else self.realtime
+        source_fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+        frame_interval = 1.0 / source_fps if realtime else 0.0
+        logger.info(
+            f"Capturing {'file' if is_file else 'device'} {self.input_source} at "
+            f"{int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}, "
+            f"{source_fps:.1f} fps"
+        )
+
+        self.loop = asyncio.get_running_loop()
+        self.frame_event = asyncio.Event()
+        self.thread = threading.Thread(target=self._run, args=(frame_interval,),
+                                       name=self.name, daemon=True)
+        self.thread.start()
+        return True
+
+    def is_open(self):
+        return self.thread is not None and not self.stopped
+
+    def _run(self, frame_interval):
+        next_time = time.monotonic()
+        try:
+            while not self.stopped:
+                success, frame = self.cap.read()
+                if not success:
+                    break
+                self.slot.put(frame, time.time(), time.monotonic())
+                self._notify()
+                if frame_interval:
+                    next_time += frame_interval
+                    time.sleep(max(0.0, next_time - time.monotonic()))
+        except Exception as e:
+            logger.error(f"Capture thread error: {e}")
+        finally:
+            # The thread owns the device, so it is never released mid-read
+            self.cap.release()
+            self.ended = True
+            self._notify()
+
+    def _notify(self):
+        try:
+            self.loop.call_soon_threadsafe(self.frame_event.set)
+        except RuntimeError:
+            # The event loop already closed
+            pass
+
+    async def next_frame(self):
+        """Wait for a frame newer than the last one returned; None once capture ends."""
+        while True:
+            self.frame_event.clear()
+            item = self.slot.take()
+            if item is not None:
+                return item
+            if self.ended or self.stopped:
+                return None
+            await self.frame_event.wait()
+
+    def interrupt(self):
+        """Stop reading and wake ``next_frame``."""
+        self.stopped = True
+        if self.frame_event:
+            self.frame_event.set()
+
+    def release(self):
+        self.interrupt()
+        if self.thread:
+            # At most one more cap.read before the thread sees the stop
+            self.thread.join(timeout=1.0)
+            if self.thread.is_alive():
+                logger.warning("Capture thread still reading; it will release the device when done")
+            self.thread = None
+
+    def stats(self):
+        return {"captured": self.slot.seq, "stale_dropped": self.slot.overwritten}
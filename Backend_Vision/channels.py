@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import time
+from asyncio import create_task
+from collections import OrderedDict, deque
+import websockets
+from metrics import RollingLatency
+from quality import QualityController
+
+logger = logging.getLogger(__name__)
+
+
+class ClientChannel:
+    """Outgoing message queue and writer task for one client.
+
+    Messages go into one of two lanes. The control lane (status, errors,
+    reports, TTS audio, flow-control requests) is never dropped and always
+    goes out first. The video lane (frames and metrics) holds at most
+    ``video_depth`` messages; when it is full the oldest is dropped, so a slow
+    client gets the newest frame instead of falling further behind. Because
+    each client has its own writer, a slow link never delays other clients or
+    the frame pipeline.
+
+    How long video messages wait and how many get dropped feeds the client's
+    ``QualityController``, which sizes the frames the session sends next.
+
+    Frames sent with a sequence number are remembered until the client
+    acknowledges rendering them (``ack``), which gives the client's
+    glass-to-glass latency and how many sent frames it actually rendered.
+    """
+
+    # Sent frames remembered for acknowledgement; older ones count as never rendered
+    MAX_IN_FLIGHT = 256
+
+    def __init__(self, websocket, video_depth=2, name=None):
+        self.websocket = websocket
+        self.video_depth = video_depth
+        self.control = deque()
+        self.video = deque()
+        self.wakeup = asyncio.Event()
+        # Set while the writer has nothing left to send
+        self.idle = asyncio.Event()
+        self.closed = False
+        self.sent = 0
+        self.video_dropped = 0
+        self.quality = QualityController()
+        # seq -> capture timestamp of frames sent but not yet acknowledged
+        self.in_flight = OrderedDict()
+        self.frames_sent = 0
+        self.frames_rendered = 0
+        # Capture to client render (client clock) and capture to ack arrival
+        # (server clock only, so it is immune to clock skew but includes the
+        # return trip)
+        self.end_to_end = RollingLatency()
+        self.ack_latency = RollingLatency()
+        self.writer_task = create_task(self._writer(), name=name)
+
+    def send_control(self, message):
+        """Queue a message that must be delivered."""
+        if self.closed:
+            return
+        self.control.append(message)
+        self.idle.clear()
+        self.wakeup.set()
+
+    def send_video(self, message, seq=None, captured_at=None):
+        """Queue a frame; the oldest queued frame is dropped if the lane is full.
+
+        ``seq`` and ``captured_at`` identify the frame for ``ack``.
+        """
+        if self.closed:
+            return
+        if len(self.video) >= self.video_depth:
+            self.video.popleft()
+            self.video_dropped += 1
+            self.quality.on_dropped()
+        self.video.append((message, time.monotonic(), seq, captured_at))
+        self.idle.clear()
+        self.wakeup.set()
+
+    async def _writer(self):
+        try:
+            while True:
+                if not self.control and not self.video:
+                    self.wakeup.clear()
+                    self.idle.set()
+                    await self.wakeup.wait()
+                    continue
+                if self.control:
+                    await self.websocket.send(self.control.popleft())
+                else:
+                    message, queued_at, seq, captured_at = self.video.popleft()
+                    await self.websocket.send(message)
+                    self.quality.on_sent(time.monotonic() - queued_at)
+                    if seq is not None:
+                        self._track(seq, captured_at)
+                self.sent += 1
+        except websockets.ConnectionClosed:
+            self.closed = True
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending to client: {e}")
+            self.closed = True
+
+    def _track(self, seq, captured_at):
+        self.frames_sent += 1
+        self.in_flight[seq] = captured_at
+        if len(self.in_flight) > self.MAX_IN_FLIGHT:
+            self.in_flight.popitem(last=False)
+
+    def ack(self, seq, rendered_at=None):
+        """Record that the client rendered frame ``seq`` at ``rendered_at`` (epoch seconds).
+
+        Returns the capture-to-render latency in seconds, or None if the frame
+        is unknown (never sent here, acknowledged already or too old).
+        """
+        captured_at = self.in_flight.pop(seq, None)
+        if captured_at is None:
+            return None
+        self.frames_rendered += 1
+        self.ack_latency.record(max(0.0, time.time() - captured_at))
+        latency = max(0.0, (rendered_at or time.time()) - captured_at)
+        self.end_to_end.record(latency)
+        return latency
+
+    async def flush(self, timeout=1.0):
+        """Wait (up to ``timeout`` seconds) until everything queued has been sent."""
+        if self.closed:
+            return
+        try:
+            await asyncio.wait_for(self.idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Client channel did not drain before closing")
+
+    def close(self):
+        self.closed = True
+        self.control.clear()
+        self.video.clear()
+        self.writer_task.cancel()
+
+    def stats(self):
+        return {
+            "control_depth": len(self.control),
+            "video_depth": len(self.video),
+            "video_dropped": self.video_dropped,
+            "sent": self.sent,
+            "frames_sent": self.frames_sent,
+            "frames_rendered": self.frames_rendered,
+            "end_to_end": self.end_to_end.stats(),
+            "ack_latency": self.ack_latency.stats(),
+            "closed": self.closed,
+            **self.quality.stats(),
+        }
@@ -0,0 +1,108 @@
+import os
+
+# Vision server settings. Each can be overridden with the environment variable
+# of the same name prefixed with VISION_ (e.g. VISION_ANALYZER_EXECUTOR=process).
+
+
+def _env(name, default, cast=str):
+    value = os.environ.get(f"VISION_{name}")
+    if value is None or value == "":
+        return default
+    return cast(value)
+
+
+# Where analyzer work (pose inference, form checks, drawing, encoding) runs:
+#   "inline"  - on the asyncio event loop (blocks every client while it runs)
+#   "thread"  - in a shared thread pool; OpenCV, MediaPipe and TensorFlow
+#               release the GIL for most of their work
+#   "process" - in a dedicated worker process per session analyzer
+ANALYZER_EXECUTOR = _env("ANALYZER_EXECUTOR", "thread")
+
+# Thread pool size for the "thread" executor (None uses one per available core)
+ANALYZER_WORKERS = _env("ANALYZER_WORKERS", None, int)
+
+# Thread budget per process for the native libraries (see resources.py).
+# Unset, each gets one thread under the "thread" and "process" executors,
+# whose parallelism comes from concurrent sessions, and every core under
+# "inline". BLAS_THREADS sets OMP/OpenBLAS/MKL_NUM_THREADS.
+OPENCV_THREADS = _env("OPENCV_THREADS", None, int)
+TF_INTRA_OP_THREADS = _env("TF_INTRA_OP_THREADS", None, int)
+TF_INTER_OP_THREADS = _env("TF_INTER_OP_THREADS", None, int)
+BLAS_THREADS = _env("BLAS_THREADS", None, int)
+
+# Core sets "process" executor workers are pinned to, round robin, e.g.
+# "0-3;4-7" or "0,1;2,3". Empty leaves them free to run on any core.
+WORKER_CPU_SETS = _env("WORKER_CPU_SETS", "")
+
+# Per-client adaptive streaming (see quality.py). Each client's JPEG quality,
+# downscale factor and frame rate move within these bounds to keep its
+# send latency under the target.
+TARGET_LATENCY_MS = _env("TARGET_LATENCY_MS", 150.0, float)
+JPEG_QUALITY_MIN = _env("JPEG_QUALITY_MIN", 40, int)
+JPEG_QUALITY_MAX = _env("JPEG_QUALITY_MAX", 85, int)
+FRAME_SCALE_MIN = _env("FRAME_SCALE_MIN", 0.5, float)
+STREAM_FPS_MIN = _env("STREAM_FPS_MIN", 5.0, float)
+STREAM_FPS_MAX = _env("STREAM_FPS_MAX", 30.0, float)
+
+# MediaPipe Pose model used by each session's shared pose stage (0, 1 or 2).
+# One model serves every exercise, so it uses the highest complexity any of
+# the analyzers needed (lunges).
+POSE_MODEL_COMPLEXITY = _env("POSE_MODEL_COMPLEXITY", 2, int)
+
+# How the squat analyzer runs its sequence model on each frame:
+#   "numpy" - a NumPy forward pass over the whole window, from a zero state
+#             as the model was trained. Each frame's features are multiplied
+#             into the first recurrent layer once, as the frame arrives, and
+#             that projection is reused for every window the frame is part of;
+#             the recurrences are still stepped over all frames of the window.
+#             Falls back to "keras" for a model it cannot run or whose output
+#             differs from model.predict at warm-up.
+#   "keras" - model.predict on the whole window
+SQUAT_INFERENCE = _env("SQUAT_INFERENCE", "numpy")
+
+# Comma-separated exercises (e.g. "Squats,Lunges") whose analyzers are built
+# in the background once the server is listening. Others are built on first use.
+WARM_ANALYZERS = _env("WARM_ANALYZERS", [], lambda value: [name.strip() for name in value.split(",") if name.strip()])
+
+# Pools of warmed analyzer and pose instances (see registry.py). Each pool keeps
+# at least POOL_MIN_SIZE idle instances ready, at most POOL_MAX_SIZE, and
+# closes extra ones that sat idle for POOL_IDLE_SECONDS.
+POOL_MIN_SIZE = _env("POOL_MIN_SIZE", 0, int)
+POOL_MAX_SIZE = _env("POOL_MAX_SIZE", 2, int)
+POOL_IDLE_SECONDS = _env("POOL_IDLE_SECONDS", 300.0, float)
+
+# Server-side capture settings for the "camera" source (camera index or video
+# file). Unset values keep the device's defaults; the backend ignores any it
+# does not support. FOURCC is a four-letter code such as "MJPG".
+CAPTURE_WIDTH = _env("CAPTURE_WIDTH", None, int)
+CAPTURE_HEIGHT = _env("CAPTURE_HEIGHT", None, int)
+CAPTURE_FOURCC = _env("CAPTURE_FOURCC", None)
+CAPTURE_BUFFER_SIZE = _env("CAPTURE_BUFFER_SIZE", 1, int)
+CAPTURE_FPS = _env("CAPTURE_FPS", None, float)
+
+# Upper bound on frames per second the pipeline reads from the "camera"
+# source, paced on the monotonic clock. 0 reads frames as fast as they come.
+PIPELINE_RATE = _env("PIPELINE_RATE", 30.0, float)
+
+# Optional plain-text (Prometheus style) endpoint with per-stage latency
+# histograms, percentiles and fps, for local scrapers. 0 disables it; it has no
+# authentication, so keep it bound to localhost.
+METRICS_HOST = _env("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = _env("METRICS_PORT", 0, int)
+
+# Admin actions (e.g. "profile"). With ADMIN_TOKEN set, a request must carry
+# it as "token"; without one, admin actions are only accepted from localhost.
+ADMIN_TOKEN = _env("ADMIN_TOKEN", "")
+
+# Sampling profiler for the "profile" action (see profiler.py): where its
+# collapsed-stack files go and the longest run one request may ask for
+PROFILE_DIR = _env("PROFILE_DIR", "profiles")
+PROFILE_MAX_SECONDS = _env("PROFILE_MAX_SECONDS", 60.0, float)
+
+# Memory monitor (see memory.py): how often RSS is sampled and how many samples
+# are kept. Above MEMORY_WARN_MB it logs a warning; above MEMORY_RECYCLE_MB it
+# closes and rebuilds the pooled analyzers and pose graphs. 0 disables either.
+MEMORY_SAMPLE_SECONDS = _env("MEMORY_SAMPLE_SECONDS", 60.0, float)
+MEMORY_HISTORY = _env("MEMORY_HISTORY", 1440, int)
+MEMORY_WARN_MB = _env("MEMORY_WARN_MB", 0.0, float)
+MEMORY_RECYCLE_MB = _env("MEMORY_RECYCLE_MB", 0.0, float)
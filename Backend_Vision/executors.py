@@ -0,0 +1,207 @@
+import asyncio
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+import config
+from memory import object_counts
+from profiler import RUNNING
+from resources import PoolUsage, ThreadBudget, available_cores, parse_cpu_sets, pin_to_cores
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_MODES = ("inline", "thread", "process")
+
+
+def _invoke(analyzer, method, args):
+    """Call an analyzer method.
+
+    "render_jpeg" annotates the frame once and encodes it for each requested
+    ``(quality, scale)``. It returns a dict of JPEG bytes keyed by encoding and
+    the seconds spent drawing and encoding, timed here so the numbers are right
+    whichever executor the call ran in. "object_counts" reports the sizes
+    of the analyzer's buffers (see memory.py).
+    """
+    # Lets the sampling profiler tell which session a pool thread is working for
+    thread_id = threading.get_ident()
+    RUNNING[thread_id] = analyzer
+    try:
+        return _dispatch(analyzer, method, args)
+    finally:
+        RUNNING.pop(thread_id, None)
+
+
+def _dispatch(analyzer, method, args):
+    if method == "object_counts":
+        return object_counts(analyzer)
+    if method == "render_jpeg":
+        frame, pose_landmarks, data, encodings = args
+        start = time.perf_counter()
+        annotated = analyzer.annotate(frame, pose_landmarks, data)
+        drawn = time.perf_counter()
+        jpegs = {encoding: analyzer._encode_jpeg(annotated, *encoding) for encoding in encodings}
+        return jpegs, {"draw": drawn - start, "encode": time.perf_counter() - drawn}
+    return getattr(analyzer, method)(*args)
+
+
+class InlineAnalyzer:
+    """Runs analyzer (or pose estimator) calls directly on the event loop."""
+
+    def __init__(self, analyzer):
+        self.analyzer = analyzer
+        self.frame_key = getattr(analyzer, "frame_key", None)
+
+    async def call(self, method, *args):
+        return _invoke(self.analyzer, method, args)
+
+    def close(self):
+        # Frees the MediaPipe graph now rather than whenever it is collected
+        close = getattr(self.analyzer, "close", None)
+        if close:
+            close()
+
+
+class ThreadAnalyzer(InlineAnalyzer):
+    """Runs analyzer calls in a thread pool shared by all sessions."""
+
+    def __init__(self, analyzer, pool, usage):
+        super().__init__(analyzer)
+        self.pool = pool
+        self.usage = usage
+
+    async def call(self, method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.pool, partial(self.usage.run, time.perf_counter(), _invoke, self.analyzer, method, args))
+
+
+# The analyzer owned by a "process" worker; each worker hosts exactly one
+_worker_analyzer = None
+
+
+def _init_worker(factory, cores=None):
+    global _worker_analyzer
+    # Before the factory imports OpenCV, MediaPipe or TensorFlow, so their
+    # thread pools come up inside the budget and on the pinned cores
+    if cores:
+        pin_to_cores(cores)
+    ThreadBudget().apply()
+    _worker_analyzer = factory()
+
+
+def _call_in_worker(method, args):
+    return _invoke(_worker_analyzer, method, args)
+
+
+def _worker_frame_key():
+    return getattr(_worker_analyzer, "frame_key", None)
+
+
+class ProcessAnalyzer:
+    """Runs an analyzer inside its own worker process.
+
+    The analyzer (with its MediaPipe graph and model) is built in the worker,
+    so its state never crosses the process boundary; only frames, landmarks
+    and payloads are pickled. Calls to one analyzer run one at a time. The
+    worker applies the thread budget and, given ``cores``, pins itself to them.
+    """
+
+    def __init__(self, factory, cores=None, usage=None):
+        self.cores = cores
+        self.usage = usage
+        self.pool = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(factory, cores)
+        )
+        # Waits for the worker to build the analyzer, so the class (and its
+        # imports) never has to be loaded in the server process
+        self.frame_key = self.pool.submit(_worker_frame_key).result()
+        if usage is not None:
+            usage.workers += 1
+
+    async def call(self, method, *args):
+        loop = asyncio.get_running_loop()
+        if self.usage is None:
+            return await loop.run_in_executor(self.pool, _call_in_worker, method, args)
+        # Includes pickling both ways; calls never queue behind each other here
+        started_at = self.usage.started()
+        try:
+            return await loop.run_in_executor(self.pool, _call_in_worker, method, args)
+        finally:
+            self.usage.finished(started_at)
+
+    def close(self):
+        if self.usage is not None:
+            self.usage.workers -= 1
+            self.usage = None
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class AnalyzerExecutor:
+    """Decides where analyzer work runs, so inference never blocks WebSocket I/O."""
+
+    def __init__(self, mode="thread", max_workers=None, cpu_sets=config.WORKER_CPU_SETS):
+        if mode not in EXECUTOR_MODES:
+            raise ValueError(f"Unknown analyzer executor mode: {mode}")
+        self.mode = mode
+        # The server process does the capture and (outside "process" mode) all
+        # analyzer work, so it runs inside the budget too
+        self.budget = ThreadBudget(mode)
+        self.budget.apply()
+        self.cpu_sets = parse_cpu_sets(cpu_sets)
+        self.next_cpu_set = 0
+        self.thread_pool = None
+        self.usage = PoolUsage()
+        if mode == "thread":
+            # One worker per core: every call is native code that releases the
+            # GIL, so more workers than cores only adds contention
+            workers = max_workers or available_cores()
+            self.thread_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="analyzer")
+            self.usage.workers = workers
+        logger.info(f"Analyzer executor mode: {mode}, thread budget {self.budget.stats()}")
+
+    def create(self, factory):
+        """Build an analyzer from ``factory`` and return a handle for calling it."""
+        if self.mode == "process":
+            cores = None
+            if self.cpu_sets:
+                cores = self.cpu_sets[self.next_cpu_set % len(self.cpu_sets)]
+                self.next_cpu_set += 1
+            return ProcessAnalyzer(factory, cores, self.usage)
+        analyzer = factory()
+        if self.mode == "thread":
+            return ThreadAnalyzer(analyzer, self.thread_pool, self.usage)
+        return InlineAnalyzer(analyzer)
+
+    async def run(self, fn, *args):
+        """Run ``fn(*args)`` off the event loop, for session work that is not an analyzer call.
+
+        Uses the analyzer thread pool in "thread" mode and the event loop's
+        default pool in "process" mode, where the work is too small to be
+        worth pickling to a worker; "inline" runs it directly.
+        """
+        if self.mode == "inline":
+            return fn(*args)
+        loop = asyncio.get_running_loop()
+        if self.thread_pool is not None:
+            return await loop.run_in_executor(
+                self.thread_pool, partial(self.usage.run, time.perf_counter(), fn, *args))
+        return await loop.run_in_executor(None, partial(fn, *args))
+
+    def stats(self):
+        """The thread budget and how busy the analyzer workers are."""
+        return {
+            "mode": self.mode,
+            "budget": self.budget.stats(),
+            "cpu_sets": [sorted(cores) for cores in self.cpu_sets],
+            "workers": self.usage.stats(),
+        }
+
+    def shutdown(self):
+        if self.thread_pool:
+            self.thread_pool.shutdown(wait=False, cancel_futures=True)
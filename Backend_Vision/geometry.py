@@ -0,0 +1,123 @@
+import numpy as np
+
+from landmarks import NUM_LANDMARKS
+
+
+def angles(points, triplets):
+    """Angles in degrees at the middle point of each ``(a, b, c)`` index triplet.
+
+    ``points`` is (..., N, D) for any number of leading (batch) axes and any
+    dimension D; the result is (..., len(triplets)). Angles with a zero-length
+    side are NaN.
+    """
+    triplets = np.asarray(triplets, dtype=np.intp).reshape(-1, 3)
+    b = points[..., triplets[:, 1], :]
+    ba = points[..., triplets[:, 0], :] - b
+    bc = points[..., triplets[:, 2], :] - b
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cosine = np.einsum("...d,...d->...", ba, bc) / (
+            np.linalg.norm(ba, axis=-1) * np.linalg.norm(bc, axis=-1))
+    return np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+
+
+def distances(points, pairs):
+    """Euclidean distance between each ``(a, b)`` index pair; (..., len(pairs))."""
+    pairs = np.asarray(pairs, dtype=np.intp).reshape(-1, 2)
+    return np.linalg.norm(points[..., pairs[:, 0], :] - points[..., pairs[:, 1], :], axis=-1)
+
+
+def midpoint(a, b):
+    """A point halfway between landmarks (or points) ``a`` and ``b``."""
+    return ("mid", a, b)
+
+
+def offset(base, dx, dy):
+    """A point at a fixed offset from landmark (or point) ``base``."""
+    return ("offset", base, (dx, dy))
+
+
+def fixed(x, y):
+    """A point at fixed image coordinates."""
+    return ("fixed", None, (x, y))
+
+
+class JointGeometry:
+    """Every angle, distance and derived point an analyzer needs, computed in one pass.
+
+    The table is built once per analyzer class: ``points`` names derived 2-D
+    points (midpoints, offsets, fixed positions) that can be referenced by
+    name alongside landmark indices, ``angles`` maps names to ``(a, b, c)``
+    triplets (the angle is at ``b``) and ``distances`` to ``(a, b)`` pairs.
+    Derived points are one matrix product over the landmarks, and the angles
+    and distances one vectorized computation each, so a frame costs a handful
+    of NumPy calls instead of a dozen ``calculate_angle`` calls.
+
+    ``compute`` takes a (33, 4) landmark array and returns a ``Measurements``
+    of plain floats; ``compute_batch`` takes (T, 33, 4) and returns arrays of
+    length T, for offline analysis of recorded sequences.
+    """
+
+    def __init__(self, points=None, angles=None, distances=None):
+        points = points or {}
+        self.point_names = list(points)
+        index = {name: NUM_LANDMARKS + i for i, name in enumerate(self.point_names)}
+
+        # extended = weights @ landmarks_xy + offsets, rows 0-32 are the landmarks
+        size = NUM_LANDMARKS + len(points)
+        self.weights = np.zeros((size, NUM_LANDMARKS))
+        self.weights[:NUM_LANDMARKS] = np.eye(NUM_LANDMARKS)
+        self.offsets = np.zeros((size, 2))
+        for name, (kind, base, value) in points.items():
+            row = index[name]
+            if kind == "mid":
+                for ref in (base, value):
+                    self.weights[row] += 0.5 * self.weights[index.get(ref, ref)]
+                    self.offsets[row] += 0.5 * self.offsets[index.get(ref, ref)]
+            elif kind == "offset":
+                self.weights[row] = self.weights[index.get(base, base)]
+                self.offsets[row] = self.offsets[index.get(base, base)] + value
+            else:
+                self.offsets[row] = value
+
+        self.angle_names = list(angles or {})
+        self.triplets = np.array([[index.get(ref, ref) for ref in triplet]
+                                  for triplet in (angles or {}).values()], dtype=np.intp).reshape(-1, 3)
+        self.distance_names = list(distances or {})
+        self.pairs = np.array([[index.get(ref, ref) for ref in pair]
+                               for pair in (distances or {}).values()], dtype=np.intp).reshape(-1, 2)
+
+    def extended_points(self, landmarks):
+        """(..., 33 + derived, 2) x/y of the landmarks followed by the derived points."""
+        return np.matmul(self.weights, landmarks[..., :2]) + self.offsets
+
+    def compute_batch(self, landmarks):
+        points = self.extended_points(landmarks)
+        angle_values = angles(points, self.triplets)
+        distance_values = distances(points, self.pairs)
+        derived = points[..., NUM_LANDMARKS:, :]
+        return Measurements(
+            {name: angle_values[..., i] for i, name in enumerate(self.angle_names)},
+            {name: distance_values[..., i] for i, name in enumerate(self.distance_names)},
+            {name: derived[..., i, :] for i, name in enumerate(self.point_names)},
+        )
+
+    def compute(self, landmarks):
+        points = self.extended_points(landmarks)
+        angle_values = angles(points, self.triplets).tolist()
+        distance_values = distances(points, self.pairs).tolist()
+        derived = points[NUM_LANDMARKS:].tolist()
+        return Measurements(
+            dict(zip(self.angle_names, angle_values)),
+            dict(zip(self.distance_names, distance_values)),
+            dict(zip(self.point_names, derived)),
+        )
+
+
+class Measurements:
+    """Named angles (degrees), distances and derived ``[x, y]`` points for a frame or a batch."""
+    __slots__ = ("angles", "distances", "points")
+
+    def __init__(self, angles, distances, points):
+        self.angles = angles
+        self.distances = distances
+        self.points = points
@@ -0,0 +1,80 @@
+import numpy as np
+
+# MediaPipe Pose always reports 33 landmarks, each as (x, y, z, visibility)
+NUM_LANDMARKS = 33
+LANDMARK_FIELDS = 4
+
+# Indices of the landmarks the analyzers use (same as mp.solutions.pose.PoseLandmark)
+NOSE = 0
+LEFT_SHOULDER = 11
+RIGHT_SHOULDER = 12
+LEFT_ELBOW = 13
+RIGHT_ELBOW = 14
+LEFT_WRIST = 15
+RIGHT_WRIST = 16
+LEFT_HIP = 23
+RIGHT_HIP = 24
+LEFT_KNEE = 25
+RIGHT_KNEE = 26
+LEFT_ANKLE = 27
+RIGHT_ANKLE = 28
+
+
+# One landmark row; np.fromiter fills a (33, 4) array of these in a single pass
+ROW_DTYPE = np.dtype((np.float32, LANDMARK_FIELDS))
+
+
+class LandmarkFrame:
+    """One person's 33 landmarks as a float32 (33, 4) array of x, y, z, visibility rows.
+
+    This is what the pose estimator and the landmark sources hand to the
+    analyzers, which index it with the constants above
+    (``landmarks.array[LEFT_KNEE, 1]``) rather than walking MediaPipe's
+    landmark objects one attribute at a time. ``proto`` keeps the MediaPipe
+    landmark list the array was filled from, for drawing; it is ``None`` for
+    landmarks estimated in the browser.
+    """
+    __slots__ = ("array", "proto")
+
+    def __init__(self, array, proto=None):
+        self.array = array
+        self.proto = proto
+
+    @classmethod
+    def from_mediapipe(cls, pose_landmarks):
+        """Fill from MediaPipe's ``pose_landmarks``; ``None`` when no person was detected."""
+        if pose_landmarks is None:
+            return None
+        array = np.fromiter(
+            ((lm.x, lm.y, lm.z, lm.visibility) for lm in pose_landmarks.landmark),
+            dtype=ROW_DTYPE, count=NUM_LANDMARKS,
+        )
+        return cls(array, pose_landmarks)
+
+    @classmethod
+    def from_values(cls, values):
+        """Build from 33 (x, y, z, visibility) rows, 132 floats or packed float32 bytes."""
+        if isinstance(values, (bytes, bytearray, memoryview)):
+            array = np.frombuffer(values, dtype="<f4")
+        else:
+            array = np.asarray(values, dtype=np.float32)
+        if array.size != NUM_LANDMARKS * LANDMARK_FIELDS:
+            raise ValueError(
+                f"Expected {NUM_LANDMARKS} landmarks with {LANDMARK_FIELDS} values each, "
+                f"got {array.size} values"
+            )
+        # NaN or inf would reach the analyzers and end up as invalid JSON
+        if not np.isfinite(array).all():
+            raise ValueError("Landmarks must be finite numbers")
+        return cls(array.reshape(NUM_LANDMARKS, LANDMARK_FIELDS))
+
+
+def landmark_rows(landmarks, digits=4):
+    """Landmarks as 33 rounded [x, y, z, visibility] rows for a JSON message.
+
+    Returns ``None`` when no person was detected.
+    """
+    if landmarks is None:
+        return None
+    # Round in float64 so the JSON carries 0.1234 rather than float32 noise
+    return np.round(landmarks.array.astype(np.float64), digits).tolist()
@@ -1,19 +1,45 @@
 # slr_analyzer.py
 import cv2
 import mediapipe as mp
-import numpy as np
 from collections import defaultdict
 import logging
-import base64
+from geometry import JointGeometry, midpoint, offset
+from landmarks import (LEFT_ANKLE, LEFT_HIP, LEFT_KNEE, LEFT_SHOULDER, RIGHT_ANKLE, RIGHT_HIP,
+                       RIGHT_KNEE, RIGHT_SHOULDER)
+from pose import PoseEstimator
+from timing import ExerciseClock
 
 logger = logging.getLogger(__name__)
 
+# Everything check_straight_leg_raises_rehab measures, computed in one pass per frame
+GEOMETRY = JointGeometry(
+    points={
+        "mid_hip": midpoint(LEFT_HIP, RIGHT_HIP),
+        "mid_shoulder": midpoint(LEFT_SHOULDER, RIGHT_SHOULDER),
+        "right_of_mid_hip": offset("mid_hip", 1, 0),
+    },
+    angles={
+        "torso": ("mid_hip", "mid_shoulder", "right_of_mid_hip"),
+        "left_knee": (LEFT_HIP, LEFT_KNEE, LEFT_ANKLE),
+        "right_knee": (RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE),
+        "left_leg_to_hips": (LEFT_HIP, LEFT_KNEE, "mid_hip"),
+        "right_leg_to_hips": (RIGHT_HIP, RIGHT_KNEE, "mid_hip"),
+        # Thigh against the hip line, at each hip
+        "left_hip_side": ("mid_hip", LEFT_HIP, LEFT_KNEE),
+        "right_hip_side": ("mid_hip", RIGHT_HIP, RIGHT_KNEE),
+        "leg": (RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE),
+    },
+)
+
 class SLRExerciseAnalyzer:
-    def __init__(self, exercise="straight_leg_raises_rehab", delay_seconds=3, target_reps = 8, fps=30):
-        # Initialize MediaPipe Pose
+    # Payload key that carries the encoded frame
+    frame_key = "data"
+
+    def __init__(self, exercise="straight_leg_raises_rehab", delay_seconds=3, target_reps = 8, pose=None):
+        # MediaPipe Pose, only loaded if this analyzer is given raw frames
         self.mp_pose = mp.solutions.pose
         self.mp_drawing = mp.solutions.drawing_utils
-        self.pose = self.mp_pose.Pose()
+        self.pose = pose or PoseEstimator(model_complexity=1)
 
         # Thresholds for rehab straight leg raises
         self.THRESHOLDS = {
@@ -24,15 +50,20 @@ class SLRExerciseAnalyzer:
             "hip_movement": (0, 0.15)  # Max allowed hip movement (normalized units)
         }
 
-        # Recording and rep counting settings
-        self.fps = fps
-        self.delay_frames = delay_seconds * fps  # 3-second delay before correction
+        # Recording and rep counting settings; durations come from frame
+        # timestamps (see timing.py)
+        self.clock = ExerciseClock()
+        self.delay_seconds = delay_seconds  # Delay before correction
         self.target_reps = target_reps  # Number of reps to detect
         self.frame_count = 0
+        self.start_frame = 0
         self.recording = False  # Now indicates correction active
         self.report = {
             "good_form_frames": 0,
-            "error_counts": defaultdict(int)
+            "error_counts": defaultdict(int),
+            "recorded_seconds": 0.0,
+            "good_form_seconds": 0.0,
+            "error_seconds": defaultdict(float)
         }
 
         self.is_above_30 = False
@@ -49,35 +80,15 @@ class SLRExerciseAnalyzer:
         # Hip movement tracking
         self.initial_hip_y = None  # Baseline hip position
 
-    def calculate_angle(self, p1, p2, p3):
-        """Calculate the angle between three points in degrees."""
-        a = np.array(p1)
-        b = np.array(p2)
-        c = np.array(p3)
-        ba = a - b
-        bc = c - b
-        cosine_angle = np.dot(ba, bc) / (np.linalg.norm(ba) * np.linalg.norm(bc))
-        angle = np.arccos(cosine_angle) * 180 / np.pi
-        return angle
-
     def check_straight_leg_raises_rehab(self, landmarks):
-        """Analyze rehab straight leg raises and return top 3 errors."""
+        """Analyze rehab straight leg raises from a (33, 4) landmark array and return top 3 errors."""
         errors = []
+        measured = GEOMETRY.compute(landmarks)
+        angles = measured.angles
+        mid_hip = measured.points["mid_hip"]
 
-        # Extract key landmarks
-        l_hip = [landmarks[self.mp_pose.PoseLandmark.LEFT_HIP].x, landmarks[self.mp_pose.PoseLandmark.LEFT_HIP].y]
-        r_hip = [landmarks[self.mp_pose.PoseLandmark.RIGHT_HIP].x, landmarks[self.mp_pose.PoseLandmark.RIGHT_HIP].y]
-        l_knee = [landmarks[self.mp_pose.PoseLandmark.LEFT_KNEE].x, landmarks[self.mp_pose.PoseLandmark.LEFT_KNEE].y]
-        r_knee = [landmarks[self.mp_pose.PoseLandmark.RIGHT_KNEE].x, landmarks[self.mp_pose.PoseLandmark.RIGHT_KNEE].y]
-        l_ankle = [landmarks[self.mp_pose.PoseLandmark.LEFT_ANKLE].x, landmarks[self.mp_pose.PoseLandmark.LEFT_ANKLE].y]
-        r_ankle = [landmarks[self.mp_pose.PoseLandmark.RIGHT_ANKLE].x, landmarks[self.mp_pose.PoseLandmark.RIGHT_ANKLE].y]
-        l_shoulder = [landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER].x, landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER].y]
-        r_shoulder = [landmarks[self.mp_pose.PoseLandmark.RIGHT_SHOULDER].x, landmarks[self.mp_pose.PoseLandmark.RIGHT_SHOULDER].y]
-
-        # Calculate torso angle
-        mid_hip = [(l_hip[0] + r_hip[0]) / 2, (l_hip[1] + r_hip[1]) / 2]
-        mid_shoulder = [(l_shoulder[0] + r_shoulder[0]) / 2, (l_shoulder[1] + r_shoulder[1]) / 2]
-        torso_angle = self.calculate_angle(mid_hip, mid_shoulder, [mid_hip[0] + 1, mid_hip[1]])  # Horizontal
+        # Torso angle against the horizontal
+        torso_angle = angles["torso"]
 
         # Set initial hip position (once at start)
         if self.initial_hip_y is None:
@@ -89,26 +100,22 @@ class SLRExerciseAnalyzer:
         #    errors.append("Keep your hips on the ground")
 
         # Determine affected and non-affected legs
-        left_knee_angle = self.calculate_angle(l_hip, l_knee, l_ankle)
-        right_knee_angle = self.calculate_angle(r_hip, r_knee, r_ankle)
+        left_knee_angle = angles["left_knee"]
+        right_knee_angle = angles["right_knee"]
         if left_knee_angle < right_knee_angle:  # Left leg is non-affected (bent)
-            non_affected_hip, non_affected_knee, non_affected_ankle = l_hip, l_knee, l_ankle
-            affected_hip, affected_knee, affected_ankle = r_hip, r_knee, r_ankle
-            affected_leg_angle = self.calculate_angle(r_hip, r_knee, r_ankle)
-            non_affected_leg_angle = self.calculate_angle(l_hip, l_knee, mid_hip)
+            affected_leg_angle = right_knee_angle
+            non_affected_leg_angle = angles["left_leg_to_hips"]
+            target_angle = angles["left_hip_side"]
+            affected_torso_angle = angles["right_hip_side"]
         else:  # Right leg is non-affected (bent)
-            non_affected_hip, non_affected_knee, non_affected_ankle = r_hip, r_knee, r_ankle
-            affected_hip, affected_knee, affected_ankle = l_hip, l_knee, l_ankle
-            affected_leg_angle = self.calculate_angle(l_hip, l_knee, l_ankle)
-            non_affected_leg_angle = self.calculate_angle(r_hip, r_knee, mid_hip)
-            
-        target_angle = self.calculate_angle(mid_hip, non_affected_hip, non_affected_knee)
-        self.target_angle = target_angle if self.target_angle is None else self.target_angle
+            affected_leg_angle = left_knee_angle
+            non_affected_leg_angle = angles["right_leg_to_hips"]
+            target_angle = angles["right_hip_side"]
+            affected_torso_angle = angles["left_hip_side"]
 
-        # Affected leg angle relative to torso
-        affected_torso_angle = self.calculate_angle(mid_hip, affected_hip, affected_knee)
+        self.target_angle = target_angle if self.target_angle is None else self.target_angle
 
-        leg_angle = self.calculate_angle(r_shoulder, r_hip, r_knee)
+        leg_angle = angles["leg"]
 
         if affected_leg_angle < 160:
             errors.append("Keep your leg straight.")
@@ -142,59 +149,71 @@ class SLRExerciseAnalyzer:
 
     def reset_counters(self):
         """Reset counters and recording state."""
+        self.clock.reset()
         self.frame_count = 0
         self.recording = False
         self.start_frame = 0
         self.reps = 0
         self.leg_raised = False
         self.prev_affected_angle = None
+        # Pooled analyzers move between patients; never carry a rep, a
+        # target angle or a hip baseline over
+        self.is_above_30 = False
+        self.target_angle = None
+        self.peak_leg_angle = 180
+        self.shallow_rep_detected = False
+        self.initial_hip_y = None
         self.report = {
             "good_form_frames": 0,
-            "error_counts": {}
+            "error_counts": defaultdict(int),
+            "recorded_seconds": 0.0,
+            "good_form_seconds": 0.0,
+            "error_seconds": defaultdict(float)
         }
 
-    async def process_video(self, frame):
-        """Process a single frame and return data to broadcast."""
-        # Process the frame with MediaPipe Pose
-        results = self.pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        annotated_frame = frame.copy()  # Create a copy to annotate
+    def warm_up(self):
+        """Nothing to preload: the form checks are plain NumPy on the landmarks."""
+
+    def detect_pose(self, frame):
+        """Run MediaPipe Pose on a BGR frame and return its landmarks (or None)."""
+        return self.pose.detect(frame)
+
+    def analyze(self, pose_landmarks, timestamp=None):
+        """Check form on one frame's landmarks and return the data to broadcast.
+
+        ``timestamp`` is when the frame was captured (``time.monotonic()``); now if None.
+        """
         error_text = ""
+        countdown = None
+        errors = []
 
-        if results.pose_landmarks:
-            self.mp_drawing.draw_landmarks(annotated_frame, results.pose_landmarks, self.mp_pose.POSE_CONNECTIONS)
+        if pose_landmarks:
+            step = self.clock.tick(timestamp)
             self.frame_count += 1
 
-            # Display countdown during delay
-            if self.frame_count <= self.delay_frames:
-                countdown = int(self.delay_frames / self.fps) - int(self.frame_count / self.fps)
-                cv2.putText(annotated_frame, f"Starting in: {countdown}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            # Countdown during delay
+            if self.clock.elapsed <= self.delay_seconds:
+                countdown = int(self.delay_seconds) - int(self.clock.elapsed)
             else:
                 # Start correction after delay
                 if not self.recording:
                     self.recording = True
                     self.start_frame = self.frame_count
 
-                errors, affected_torso_angle = self.check_straight_leg_raises_rehab(results.pose_landmarks.landmark)
+                errors, affected_torso_angle = self.check_straight_leg_raises_rehab(pose_landmarks.array)
 
                 # Record form data during correction
                 if self.recording:
+                    self.report["recorded_seconds"] += step
                     if not errors:
                         self.report["good_form_frames"] += 1
+                        self.report["good_form_seconds"] += step
                     for error in errors:
                         if error not in self.report["error_counts"]:
                             self.report["error_counts"][error] = 0
                         self.report["error_counts"][error] += 1
+                        self.report["error_seconds"][error] += step
 
-                # Display feedback after delay
-                if self.recording:
-                    if errors:
-                        for i, error in enumerate(errors):
-                            cv2.putText(annotated_frame, error, (10, 30 + i * 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                    else:
-                        cv2.putText(annotated_frame, "Correct Form", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
-                # Display rep count
-                cv2.putText(annotated_frame, f"Reps: {self.reps}/{self.target_reps}", (10, annotated_frame.shape[0] - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
                 ### TEXT TO SPEECH PORTION
                 if errors:
                     error_text = errors[0]
@@ -203,30 +222,54 @@ class SLRExerciseAnalyzer:
                 else:
                     error_text = "You are doing well."
 
-        # Encode frame as base64 and return data
-        frame_base64 = self._encode_frame(annotated_frame)
         return {
             "type": "frame",
-            "data": frame_base64,
             "reps": self.reps,
             "target_reps": self.target_reps,
             "good_form_frames": self.report["good_form_frames"],
-            "error_counts": self.report["error_counts"],
+            "error_counts": dict(self.report["error_counts"]),
             "recording": self.recording,
             "frame_count": self.frame_count - self.start_frame if self.recording else 0,
+            "recorded_seconds": round(self.report["recorded_seconds"], 2),
+            "countdown": countdown,
+            "errors": errors,
             "error_text": error_text
         }
 
-    def _encode_frame(self, frame):
-        """Encode frame as base64."""
-        _, buffer = cv2.imencode('.jpg', frame)
-        return base64.b64encode(buffer).decode('utf-8')
+    def annotate(self, frame, pose_landmarks, data):
+        """Draw the skeleton and the feedback from ``data`` on a copy of the frame."""
+        annotated_frame = frame.copy()  # Create a copy to annotate
+        if pose_landmarks:
+            self.mp_drawing.draw_landmarks(annotated_frame, pose_landmarks.proto, self.mp_pose.POSE_CONNECTIONS)
+
+            if data["countdown"] is not None:
+                cv2.putText(annotated_frame, f"Starting in: {data['countdown']}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            elif data["recording"]:
+                # Display feedback after delay
+                if data["errors"]:
+                    for i, error in enumerate(data["errors"]):
+                        cv2.putText(annotated_frame, error, (10, 30 + i * 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+                else:
+                    cv2.putText(annotated_frame, "Correct Form", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+
+                # Display rep count
+                cv2.putText(annotated_frame, f"Reps: {data['reps']}/{data['target_reps']}", (10, annotated_frame.shape[0] - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
+        return annotated_frame
+
+    def _encode_jpeg(self, frame, quality=95, scale=1.0):
+        """Encode frame as raw JPEG bytes, downscaled by ``scale``."""
+        if scale < 1.0:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+        return buffer.tobytes()
 
     def generate_report(self):
         """Generate and print an exercise report."""
-        total_recorded_frames = self.frame_count - self.start_frame  # Frames from start of correction
-        good_form_seconds = self.report["good_form_frames"] / self.fps
-        total_seconds = total_recorded_frames / self.fps
+        total_seconds = self.report["recorded_seconds"]  # Time since correction started
+        if total_seconds <= 0:
+            print("No exercise session recorded yet.")
+            return
+        good_form_seconds = self.report["good_form_seconds"]
     
         print("\n--- Straight Leg Raises (Rehab) Exercise Report ---")
         print(f"Total Recorded Time: {total_seconds:.2f} seconds")
@@ -235,8 +278,8 @@ class SLRExerciseAnalyzer:
         print("Errors Detected:")
         if self.report["error_counts"]:
             for error, count in self.report["error_counts"].items():
-                error_seconds = count / self.fps
-                print(f"  - '{error}': {count} frames ({error_seconds:.2f} seconds, {(count / total_recorded_frames) * 100:.1f}%)")
+                error_seconds = self.report["error_seconds"][error]
+                print(f"  - '{error}': {count} frames ({error_seconds:.2f} seconds, {(error_seconds / total_seconds) * 100:.1f}%)")
         else:
             print("  - No errors detected!")
         print("--------------------------------\n")
@@ -265,5 +308,9 @@ class SLRExerciseAnalyzer:
         cv2.destroyAllWindows()
         self.pose.close()
 
+    def close(self):
+        """Free the MediaPipe graph, if one was loaded."""
+        self.pose.close()
+
     def __del__(self):
         self.pose.close()
\ No newline at end of file
@@ -3,20 +3,44 @@ import mediapipe as mp
 import numpy as np
 from collections import defaultdict
 import logging
-import base64
+import geometry
+from geometry import JointGeometry, midpoint, offset
+from landmarks import (LEFT_ANKLE, LEFT_HIP, LEFT_KNEE, LEFT_SHOULDER, RIGHT_ANKLE, RIGHT_HIP,
+                       RIGHT_KNEE, RIGHT_SHOULDER)
+from pose import PoseEstimator
+from timing import ExerciseClock
 # import asyncio
 
 logger = logging.getLogger(__name__)
+
+# Landmarks that must be visible for check_lunges_form to judge the frame
+KEY_LANDMARKS = [LEFT_HIP, RIGHT_HIP, LEFT_KNEE, RIGHT_KNEE, LEFT_ANKLE, RIGHT_ANKLE,
+                 LEFT_SHOULDER, RIGHT_SHOULDER]
+
+# Everything check_lunges_form measures, computed in one pass per frame
+GEOMETRY = JointGeometry(
+    points={
+        "mid_hip": midpoint(LEFT_HIP, RIGHT_HIP),
+        "mid_shoulder": midpoint(LEFT_SHOULDER, RIGHT_SHOULDER),
+        "below_mid_hip": offset("mid_hip", 0, 1),
+    },
+    angles={
+        "left_knee": (LEFT_HIP, LEFT_KNEE, LEFT_ANKLE),
+        "right_knee": (RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE),
+        "torso": ("below_mid_hip", "mid_hip", "mid_shoulder"),
+    },
+    distances={
+        "stance": (LEFT_ANKLE, RIGHT_ANKLE),
+    },
+)
 class LungesAnalyzer:
-    def __init__(self, exercise="Lunges", delay_seconds=3, target_reps=8, fps=30):
-        # Initialize MediaPipe Pose
+    # Payload key that carries the encoded frame
+    frame_key = "frame"
+
+    def __init__(self, exercise="Lunges", delay_seconds=3, target_reps=8, pose=None):
+        # MediaPipe Pose, only loaded if this analyzer is given raw frames
         self.mp_pose = mp.solutions.pose
-        self.pose = self.mp_pose.Pose(
-            static_image_mode=False,
-            model_complexity=2,
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
-        )
+        self.pose = pose or PoseEstimator(model_complexity=2)
         self.mp_drawing = mp.solutions.drawing_utils
 
         self.error_counters = {
@@ -57,8 +81,8 @@ class LungesAnalyzer:
         
         # Define the landmarks we're interested in (hip, knee, ankle only)
         self.target_landmarks = [
-            'LEFT_HIP', 'LEFT_KNEE', 'LEFT_ANKLE',
-            'RIGHT_HIP', 'RIGHT_KNEE', 'RIGHT_ANKLE'
+            LEFT_HIP, LEFT_KNEE, LEFT_ANKLE,
+            RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE
         ]
 
         # Set exercise type
@@ -73,55 +97,41 @@ class LungesAnalyzer:
             "hip_level": (0, 0.15),  # Hip should be level (relative displacement)
         }
 
-        # Recording and rep counting settings
-        self.fps = fps
-        self.delay_frames = delay_seconds * fps  # delay before correction
+        # Recording and rep counting settings; durations come from frame
+        # timestamps (see timing.py)
+        self.clock = ExerciseClock()
+        self.delay_seconds = delay_seconds  # delay before correction
         self.target_reps = target_reps  # Number of reps to detect
         self.frame_count = 0
         self.recording = False  # Now indicates correction active
         self.report = {
             "good_form_frames": 0,
-            "error_counts": defaultdict(int)
+            "error_counts": defaultdict(int),
+            "recorded_seconds": 0.0,
+            "good_form_seconds": 0.0,
+            "error_seconds": defaultdict(float)
         }
         self.standing_error_counter = 0
-        self.standing_error_threshold = int(5 * self.fps)
+        self.standing_error_seconds = 5.0
            
         
     def extract_keypoints(self, frame):
         """Extract hip, knee, and ankle keypoints from a single frame."""
-        # Convert BGR to RGB
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        # Process the frame
-        results = self.pose.process(frame_rgb)
-        
-        if not results.pose_landmarks:
+        landmarks = self.pose.detect(frame)
+        if landmarks is None:
             return None, None
         
-        # Extract only hip, knee, ankle keypoints
-        keypoints = []
-        landmark_dict = {}
-        
-        for i, landmark in enumerate(results.pose_landmarks.landmark):
-            name = self.mp_pose.PoseLandmark(i).name
-            if name in self.target_landmarks:
-                landmark_dict[name] = [landmark.x, landmark.y, landmark.z]
+        # Extract only hip, knee, ankle keypoints, in target_landmarks order
+        keypoints = landmarks.array[self.target_landmarks, :3].astype(np.float64)
         
         # Determine leading leg
-        knee_r = landmark_dict['RIGHT_KNEE'][:2]  # Just x,y for position comparison
-        knee_l = landmark_dict['LEFT_KNEE'][:2]
-        
         # Lower y-value means higher in the image (closer to top of frame)
-        if knee_r[1] < knee_l[1]:  # Right knee is higher in the frame
+        if landmarks.array[RIGHT_KNEE, 1] < landmarks.array[LEFT_KNEE, 1]:  # Right knee is higher in the frame
             leading_leg = "Right"  # Right leg is forward
         else:
             leading_leg = "Left"  # Left leg is forward
             
-        # Extract features in a consistent order
-        for name in self.target_landmarks:
-            keypoints.extend(landmark_dict[name])
-            
-        return np.array(keypoints), leading_leg
+        return keypoints.flatten(), leading_leg
     
     def normalize_side(self, keypoints, leading_leg):
         """
@@ -148,31 +158,12 @@ class LungesAnalyzer:
         # Reshape keypoints to have landmarks as rows with [x,y,z] columns
         landmarks = keypoints.reshape(6, 3)
         
-        # Extract individual landmarks
-        front_hip = landmarks[0]    # Using left as front leg (after normalization)
-        front_knee = landmarks[1]
-        front_ankle = landmarks[2]
-        
-        # Calculate angle between three points
-        def calculate_angle(a, b, c):
-            a = np.array(a)
-            b = np.array(b)
-            c = np.array(c)
-            
-            ba = a - b
-            bc = c - b
-            
-            cosine_angle = np.dot(ba, bc) / (np.linalg.norm(ba) * np.linalg.norm(bc))
-            # Clip to avoid numerical errors
-            cosine_angle = np.clip(cosine_angle, -1.0, 1.0)
-            angle = np.arccos(cosine_angle)
-            return np.degrees(angle)
-        
         # Calculate relevant angles and distances
         features = {}
         
         # Front leg angles
-        features['front_knee_angle'] = calculate_angle(front_hip, front_knee, front_ankle)
+        # Rows 0-2 are the front hip, knee and ankle (left is front after normalization)
+        features['front_knee_angle'] = geometry.angles(landmarks, [(0, 1, 2)])[0]
         
         # Store the original leading leg for reference
         features['leading_leg'] = original_leading_leg
@@ -194,20 +185,6 @@ class LungesAnalyzer:
         except Exception as e:
             print(f"Error loading model: {e}")
 
-    def reset_counters(self):
-        """Reset counters and data storage."""
-        self.frame_count = 0
-        self.frames_keypoints = []
-        self.features_data = []
-
-
-    def _encode_frame(self, frame):
-        """Encode frame as base64."""
-        _, buffer = cv2.imencode('.jpg', frame)
-        return base64.b64encode(buffer).decode('utf-8')
-
-  
-    
     def detect_form(self, frame):
         """Detect lunge form in a single frame."""
         if not self.is_trained:
@@ -261,70 +238,24 @@ class LungesAnalyzer:
         return is_correct, feedback, features, errors
     
 
-    def calculate_angle(self, p1, p2, p3):
-        """Calculate the angle between three points in degrees."""
-        a = np.array(p1)
-        b = np.array(p2)
-        c = np.array(p3)
-        
-        ba = a - b
-        bc = c - b
-        
-        # Handle zero vectors
-        if np.linalg.norm(ba) < 1e-6 or np.linalg.norm(bc) < 1e-6:
-            return 0
-            
-        cosine_angle = np.dot(ba, bc) / (np.linalg.norm(ba) * np.linalg.norm(bc))
-        cosine_angle = np.clip(cosine_angle, -1.0, 1.0)  # Avoid numerical errors
-        angle = np.arccos(cosine_angle) * 180 / np.pi
-        return angle
-
     def check_landmark_visibility(self, landmarks, landmark_indexes):
         """Check if landmarks are visible."""
-        for idx in landmark_indexes:
-            if landmarks[idx].visibility < self.visibility_threshold:
-                return False
-        return True
+        return bool((landmarks[landmark_indexes, 3] >= self.visibility_threshold).all())
 
     def check_lunges_form(self, landmarks):
-        """Analyze lunges exercise and return errors."""
+        """Analyze lunges exercise from a (33, 4) landmark array and return errors."""
         errors = []
 
-        # Important landmarks for lunges
-        key_landmarks = [
-            self.mp_pose.PoseLandmark.LEFT_HIP, 
-            self.mp_pose.PoseLandmark.RIGHT_HIP,
-            self.mp_pose.PoseLandmark.LEFT_KNEE, 
-            self.mp_pose.PoseLandmark.RIGHT_KNEE,
-            self.mp_pose.PoseLandmark.LEFT_ANKLE, 
-            self.mp_pose.PoseLandmark.RIGHT_ANKLE,
-            self.mp_pose.PoseLandmark.LEFT_SHOULDER, 
-            self.mp_pose.PoseLandmark.RIGHT_SHOULDER
-        ]
-        
         # Check if all key landmarks are visible
-        if not self.check_landmark_visibility(landmarks, key_landmarks):
+        if not self.check_landmark_visibility(landmarks, KEY_LANDMARKS):
             return ["Move fully into camera view"], 180
 
-        # Extract key landmarks
-        l_hip = [landmarks[self.mp_pose.PoseLandmark.LEFT_HIP].x, landmarks[self.mp_pose.PoseLandmark.LEFT_HIP].y]
-        r_hip = [landmarks[self.mp_pose.PoseLandmark.RIGHT_HIP].x, landmarks[self.mp_pose.PoseLandmark.RIGHT_HIP].y]
-        l_knee = [landmarks[self.mp_pose.PoseLandmark.LEFT_KNEE].x, landmarks[self.mp_pose.PoseLandmark.LEFT_KNEE].y]
-        r_knee = [landmarks[self.mp_pose.PoseLandmark.RIGHT_KNEE].x, landmarks[self.mp_pose.PoseLandmark.RIGHT_KNEE].y]
-        l_ankle = [landmarks[self.mp_pose.PoseLandmark.LEFT_ANKLE].x, landmarks[self.mp_pose.PoseLandmark.LEFT_ANKLE].y]
-        r_ankle = [landmarks[self.mp_pose.PoseLandmark.RIGHT_ANKLE].x, landmarks[self.mp_pose.PoseLandmark.RIGHT_ANKLE].y]
-        l_shoulder = [landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER].x, landmarks[self.mp_pose.PoseLandmark.LEFT_SHOULDER].y]
-        r_shoulder = [landmarks[self.mp_pose.PoseLandmark.RIGHT_SHOULDER].x, landmarks[self.mp_pose.PoseLandmark.RIGHT_SHOULDER].y]
-        
-        # Calculate leg angles
-        left_knee_angle = self.calculate_angle(l_hip, l_knee, l_ankle)
-        right_knee_angle = self.calculate_angle(r_hip, r_knee, r_ankle)
-
-        # Fix for NaN angles
-        if np.isnan(left_knee_angle):
-            left_knee_angle = 180
-        if np.isnan(right_knee_angle):
-            right_knee_angle = 180
+        measured = GEOMETRY.compute(landmarks)
+        angles = measured.angles
+
+        # Calculate leg angles; a degenerate (zero-length) limb reads as 0 degrees
+        left_knee_angle = np.nan_to_num(angles["left_knee"])
+        right_knee_angle = np.nan_to_num(angles["right_knee"])
             
         # Determine which leg is front (has smaller angle = more bent)
         if left_knee_angle < right_knee_angle:
@@ -336,25 +267,20 @@ class LungesAnalyzer:
             back_knee_angle = left_knee_angle
             front_is_left = False
             
-        # Calculate torso angle (relative to vertical)
-        mid_hip = [(l_hip[0] + r_hip[0]) / 2, (l_hip[1] + r_hip[1]) / 2]
-        mid_shoulder = [(l_shoulder[0] + r_shoulder[0]) / 2, (l_shoulder[1] + r_shoulder[1]) / 2]
         # Angle with vertical (0 is perfectly upright)
-        torso_angle = self.calculate_angle([mid_hip[0], mid_hip[1] + 1], mid_hip, mid_shoulder)
+        torso_angle = np.nan_to_num(angles["torso"])
         
         # Calculate stance width
-        stance_width = np.linalg.norm(np.array(l_ankle) - np.array(r_ankle))
+        stance_width = measured.distances["stance"]
         
         # Calculate hip level (should be level in a good lunge)
-        hip_level_diff = abs(l_hip[1] - r_hip[1])
+        hip_level_diff = abs(landmarks[LEFT_HIP, 1] - landmarks[RIGHT_HIP, 1])
         
         # Front knee should not extend past ankle (knee-over-toe check)
         if front_is_left:
-            knee_past_toe = l_knee[0] < l_ankle[0]
-            front_hip, front_knee, front_ankle = l_hip, l_knee, l_ankle
+            knee_past_toe = landmarks[LEFT_KNEE, 0] < landmarks[LEFT_ANKLE, 0]
         else:
-            knee_past_toe = r_knee[0] > r_ankle[0]
-            front_hip, front_knee, front_ankle = r_hip, r_knee, r_ankle
+            knee_past_toe = landmarks[RIGHT_KNEE, 0] > landmarks[RIGHT_ANKLE, 0]
 
         
         
@@ -463,6 +389,7 @@ class LungesAnalyzer:
 
     def reset_counters(self):
         """Reset counters and recording state."""
+        self.clock.reset()
         self.frame_count = 0
         self.recording = False
         self.start_frame = 0
@@ -473,99 +400,115 @@ class LungesAnalyzer:
         self.shallow_rep_detected = False
         self.report = {
             "good_form_frames": 0,
-            "error_counts": defaultdict(int)
+            "error_counts": defaultdict(int),
+            "recorded_seconds": 0.0,
+            "good_form_seconds": 0.0,
+            "error_seconds": defaultdict(float)
         }
         self.knee_angles_history = []
         self.direction = None
         self.phase_frames = 0
-        print(f"{self.exercise} analyzer counters reset")
-
-    async def process_video(self, frame):
-        """Process a single frame and return data to broadcast."""
-        
-        try:
-            # Process the frame with MediaPipe Pose
-            results = self.pose.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-            annotated_frame = frame.copy()  # Create a copy to annotate
-            error_text = ""
-            if results.pose_landmarks:
-                self.mp_drawing.draw_landmarks(annotated_frame, results.pose_landmarks, self.mp_pose.POSE_CONNECTIONS)
-                self.frame_count += 1
-
-                # Display countdown during delay
-                if self.frame_count <= self.delay_frames:
-                    countdown = int(self.delay_frames / self.fps) - int(self.frame_count / self.fps)
-                    cv2.putText(annotated_frame, f"Starting in: {countdown}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-                else:
-                    # Start correction after delay
-                    if not self.recording:
-                        self.recording = True
-                        self.start_frame = self.frame_count
+        # Pooled analyzers move between patients; never carry a persisting error over
+        for error in self.error_counters:
+            self.error_counters[error] = 0
+        self.standing_error_counter = 0
+        logger.debug(f"{self.exercise} analyzer counters reset")
 
-                    # Call form check method
-                    errors, knee_angle = self.check_lunges_form(results.pose_landmarks.landmark)
+    def warm_up(self):
+        """Nothing to preload: the form checks are plain NumPy on the landmarks."""
 
-                    # Record form data during correction
-                    if self.recording:
-                        if not errors:
-                            self.report["good_form_frames"] += 1
-                        for error in errors:
-                            self.report["error_counts"][error] += 1
+    def detect_pose(self, frame):
+        """Run MediaPipe Pose on a BGR frame and return its landmarks (or None)."""
+        return self.pose.detect(frame)
 
-                    # Display feedback after delay
-                    if self.recording:
-                        if errors:
-                            for i, error in enumerate(errors):
-                                cv2.putText(annotated_frame, error, (10, 30 + i * 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-                        else:
-                            cv2.putText(annotated_frame, "Correct Form", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+    def analyze(self, pose_landmarks, timestamp=None):
+        """Check form on one frame's landmarks and return the data to broadcast.
 
-                    # Display rep count
-                    cv2.putText(annotated_frame, f"Reps: {self.reps}/{self.target_reps}", (10, annotated_frame.shape[0] - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
+        ``timestamp`` is when the frame was captured (``time.monotonic()``); now if None.
+        """
+        error_text = ""
+        countdown = None
+        errors = []
+        if pose_landmarks:
+            step = self.clock.tick(timestamp)
+            self.frame_count += 1
 
-                    ## TEXT TO SPEECH PORTION
-                    error_text = errors[0] if errors else "You are doing well"#
+            # Countdown during delay
+            if self.clock.elapsed <= self.delay_seconds:
+                countdown = int(self.delay_seconds) - int(self.clock.elapsed)
+            else:
+                # Start correction after delay
+                if not self.recording:
+                    self.recording = True
+                    self.start_frame = self.frame_count
+
+                # Call form check method
+                errors, knee_angle = self.check_lunges_form(pose_landmarks.array)
+
+                # Record form data during correction
+                if self.recording:
+                    self.report["recorded_seconds"] += step
+                    if not errors:
+                        self.report["good_form_frames"] += 1
+                        self.report["good_form_seconds"] += step
+                    for error in errors:
+                        self.report["error_counts"][error] += 1
+                        self.report["error_seconds"][error] += step
+
+                ## TEXT TO SPEECH PORTION
+                error_text = errors[0] if errors else "You are doing well"#
+
+        return {
+            "type": "frame",
+            "reps": self.reps,
+            "target_reps": self.target_reps,
+            "good_form_frames": self.report["good_form_frames"],
+            "error_counts": dict(self.report["error_counts"]),  # Convert defaultdict to dict for serialization
+            "recording": self.recording,
+            "frame_count": self.frame_count - self.start_frame if self.recording else 0,
+            "recorded_seconds": round(self.report["recorded_seconds"], 2),
+            "countdown": countdown,
+            "errors": errors,
+            "error_text": error_text
+        }
 
+    def annotate(self, frame, pose_landmarks, data):
+        """Draw the skeleton and the feedback from ``data`` on a copy of the frame."""
+        annotated_frame = frame.copy()  # Create a copy to annotate
+        if pose_landmarks:
+            self.mp_drawing.draw_landmarks(annotated_frame, pose_landmarks.proto, self.mp_pose.POSE_CONNECTIONS)
+
+            if data["countdown"] is not None:
+                cv2.putText(annotated_frame, f"Starting in: {data['countdown']}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+            elif data["recording"]:
+                # Display feedback after delay
+                if data["errors"]:
+                    for i, error in enumerate(data["errors"]):
+                        cv2.putText(annotated_frame, error, (10, 30 + i * 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+                else:
+                    cv2.putText(annotated_frame, "Correct Form", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
 
+                # Display rep count
+                cv2.putText(annotated_frame, f"Reps: {data['reps']}/{data['target_reps']}", (10, annotated_frame.shape[0] - 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
+        return annotated_frame
 
-            
-            # Encode frame as base64 and return data
-            frame_base64 = self._encode_frame(annotated_frame)
-            return {
-                "type": "frame",
-                "frame": frame_base64,
-                "reps": self.reps,
-                "target_reps": self.target_reps,
-                "good_form_frames": self.report["good_form_frames"],
-                "error_counts": dict(self.report["error_counts"]),  # Convert defaultdict to dict for serialization
-                "recording": self.recording,
-                "frame_count": self.frame_count - self.start_frame if self.recording else 0,
-                "error_text": error_text
-            }
-        except Exception as e:
-            logger.error(f"Error processing video frame: {str(e)}")
-            # Return a minimal response on error
-            return {
-                "type": "error",
-                "error": f"Processing error: {str(e)}"
-            }
-
-    def _encode_frame(self, frame):
-        """Encode frame as base64."""
-        _, buffer = cv2.imencode('.jpg', frame)
-        return base64.b64encode(buffer).decode('utf-8')
+    def _encode_jpeg(self, frame, quality=95, scale=1.0):
+        """Encode frame as raw JPEG bytes, downscaled by ``scale``."""
+        if scale < 1.0:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+        return buffer.tobytes()
 
     def generate_report(self):
         """Generate and return an exercise report."""
         if not self.recording or self.frame_count <= self.start_frame:
             return "No exercise session recorded yet."
             
-        total_recorded_frames = self.frame_count - self.start_frame  # Frames from start of correction
-        if total_recorded_frames <= 0:
+        total_seconds = self.report["recorded_seconds"]  # Time since correction started
+        if total_seconds <= 0:
             return "No frames recorded yet."
             
-        good_form_seconds = self.report["good_form_frames"] / self.fps
-        total_seconds = total_recorded_frames / self.fps
+        good_form_seconds = self.report["good_form_seconds"]
     
         report_text = f"\n--- {self.exercise} Exercise Report ---\n"
         report_text += f"Total Recorded Time: {total_seconds:.2f} seconds\n"
@@ -584,8 +527,8 @@ class LungesAnalyzer:
                 reverse=True
             )
             for error, count in sorted_errors:
-                error_seconds = count / self.fps
-                report_text += f"  - '{error}': {count} frames ({error_seconds:.2f} seconds, {(count / total_recorded_frames) * 100:.1f}%)\n"
+                error_seconds = self.report["error_seconds"][error]
+                report_text += f"  - '{error}': {count} frames ({error_seconds:.2f} seconds, {(error_seconds / total_seconds) * 100:.1f}%)\n"
         else:
             report_text += "  - No errors detected! Perfect form!\n"
         
@@ -614,6 +557,10 @@ class LungesAnalyzer:
         
         return report_text
 
+    def close(self):
+        """Free the MediaPipe graph, if one was loaded."""
+        self.pose.close()
+
     def __del__(self):
         """Clean up resources when the object is deleted."""
         try:
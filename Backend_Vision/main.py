@@ -1,17 +1,25 @@
-import cv2
+# The thread budget's BLAS/OpenMP variables are read when NumPy first loads,
+# so they are set before anything below imports it (see resources.py)
+from resources import ThreadBudget
+ThreadBudget().apply_environment()
+
 import asyncio
+import hmac
 import json
 import logging
+import math
+import os
 import threading
 import time
 import websockets
-from functools import partial
-from squats import SquatAnalyzer  # Import SquatAnalyzer
-from WarriorPose import WarriorPoseAnalyzer
-from lunges_vision import LungesAnalyzer
-from legRaises import SLRExerciseAnalyzer 
-from bark_tts import play_speech_directly
-from asyncio import Queue, create_task
+from session import ExerciseSession
+from executors import AnalyzerExecutor
+from memory import AllocationTracker, MemoryMonitor, rss_bytes
+from metrics import MetricsEndpoint, ServerMetrics, render_text
+from profiler import SamplingProfiler, SessionMatcher
+from resources import process_stats
+from registry import POSE, AnalyzerRegistry
+import config
 
 
 # Configure logging
@@ -19,347 +27,282 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class VideoServer:
-    def __init__(self):
-        self.cap = None
-        self.clients = set()
+    def __init__(self, input_source=0):
         self.event_loop = None
         self.server = None
-        self.running = False
-        self.current_analyzer = None
-        self.frame_processing_task = None
-
-        self.tts_queue = Queue()
-        self.tts_worker_task = None
-
-        self.language=""
-        self.audiobot = ""
-
-        # Initialize analyzers with SquatAnalyzer
-        self.analyzers = {
-            "Squats": SquatAnalyzer(),  
-            "Warrior": WarriorPoseAnalyzer(),  
-            "Lunges": LungesAnalyzer(),
-            "LegRaises": SLRExerciseAnalyzer()
-        }
-
-    async def process_frames(self, input_source=0):
-        """Centralized frame processing loop with TTS error reporting."""
-        try:
-            self.cap = cv2.VideoCapture(input_source)
-            if not self.cap.isOpened():
-                logger.error(f"Error: Could not open video source {input_source}")
-                await self._broadcast({"error": "Could not open video source"})
-                return
-
-            # TTS-related state variables
-            self.last_error_text = None
-            self.error_hold_start_time = None
-            self.last_tts_time = 0
-            self.tts_repeat_interval = 5.0
-            self.error_tts_cooldown = 0.0
-
-            self.tts_worker_task = create_task(self._tts_worker())
-
-            logger.info("Started processing frames")
-            while self.running and self.cap.isOpened():
-                start_time = time.time()
-
-                success, frame = self.cap.read()
-                if not success:
-                    logger.info("End of video or camera disconnected")
-                    await self._broadcast({"error": "Video source disconnected"})
-                    break
-
-                if self.current_analyzer:
-                    try:
-                        processed_data = await self.current_analyzer.process_video(frame)
-
-                        if processed_data:
-                            # --- TTS Error Monitoring Logic ---
-                            error_text = processed_data.get("error_text", "") or ""
-                            if error_text:
-                                error_text = error_text.strip()
-                            current_time = time.time()
-
-                            if error_text:
-                                if error_text != self.last_error_text:
-                                    self.last_error_text = error_text
-                                    self.error_hold_start_time = current_time
-                                    self.last_tts_time = 0
-                                
-                                time_held = current_time - self.error_hold_start_time
-                                time_since_last_tts = current_time - self.last_tts_time
-                                
-                                if (time_held >= self.error_tts_cooldown and 
-                                    (self.last_tts_time == 0 or 
-                                    time_since_last_tts >= self.tts_repeat_interval)):
-                                    
-                                    if self.audiobot != "off":
-                                        while not self.tts_queue.empty():
-                                            try:
-                                                self.tts_queue.get_nowait()
-                                                self.tts_queue.task_done()
-                                            except asyncio.QueueEmpty:
-                                                break
-
-                                        await self.tts_queue.put(error_text)
-                                        self.last_tts_time = current_time
-
-
-                            else:
-                                self.last_error_text = None
-                                self.error_hold_start_time = None
-                                self.last_tts_time = 0
-
-                            await self._broadcast(processed_data)
-
-                    except Exception as e:
-                        logger.error(f"Error processing frame: {e}")
-                        await self._broadcast({"error": f"Frame processing error: {str(e)}"})
-
-                processing_time = time.time() - start_time
-                await asyncio.sleep(max(0, 0.033 - processing_time))
-
-        except Exception as e:
-            logger.error(f"Error during frame processing: {e}")
-            await self._broadcast({"error": f"Frame processing error: {str(e)}"})
-        finally:
-            if self.cap:
-                self.cap.release()
-                self.cap = None
-
-            if self.tts_worker_task:
-                self.tts_worker_task.cancel()
-                try:
-                    await self.tts_worker_task
-                except asyncio.CancelledError:
-                    pass
-
-
-            if self.current_analyzer:
-                try:
-                    report = self.current_analyzer.generate_report()
-                    if report is not None:
-                        print("\n" + report)
-                        with open('report.txt', 'w') as f:
-                            f.write(report)
-                        await self._broadcast({"type": "report", "data": report})
-                    else:
-                        logger.warning("No report was generated (returned None)")
-                except Exception as e:
-                    logger.error(f"Error generating report: {e}")
-
-            logger.info("Video processing stopped")
-            await self._broadcast({"status": "stopped"})
-
-    def set_language(self, language_code: str):
-        """Set the language for TTS playback."""
-        supported_languages = ["en", "ur"]
-        if language_code in supported_languages:
-            self.language = language_code
-            logger.info(f"TTS language set to {language_code}")
-        else:
-            logger.warning(f"Unsupported language: {language_code}")
-
-    async def _tts_worker(self):
-        while True:
-            error_text = await self.tts_queue.get()
-            try:
-                tts_result = await play_speech_directly(error_text, self.language)
-                if tts_result["audio_data"]:
-                    await self._broadcast({
-                        "type": "audio",
-                        "audio_data": tts_result["audio_data"]
-                    })
-                if tts_result["error"]:
-                    logger.error(tts_result["error"])
-            except Exception as e:
-                logger.error(f"TTS worker error: {e}")
-            finally:
-                self.tts_queue.task_done()
-
-    # async def process_frames(self, input_source=0):
-    #     """Centralized frame processing loop."""
-    #     try:
-    #         self.cap = cv2.VideoCapture(input_source)
-    #         if not self.cap.isOpened():
-    #             logger.error(f"Error: Could not open video source {input_source}")
-    #             await self._broadcast({"error": "Could not open video source"})
-    #             return
-
-    #         logger.info("Started processing frames")
-    #         while self.running and self.cap.isOpened():
-    #             start_time = time.time()
-
-    #             success, frame = self.cap.read()
-    #             if not success:
-    #                 logger.info("End of video or camera disconnected")
-    #                 await self._broadcast({"error": "Video source disconnected"})
-    #                 break
-
-    #             # Process frame with the current analyzer if selected
-    #             if self.current_analyzer:
-    #                 try:
-    #                     processed_data = await self.current_analyzer.process_video(frame)
-    #                     if processed_data:
-    #                         await self._broadcast(processed_data)
-    #                 except Exception as e:
-    #                     logger.error(f"Error processing frame: {e}")
-    #                     await self._broadcast({"error": f"Frame processing error: {str(e)}"})
-
-    #             # Maintain ~30 FPS
-    #             processing_time = time.time() - start_time
-    #             await asyncio.sleep(max(0, 0.033 - processing_time))  # Target ~30fps
-
-    #     except Exception as e:
-    #         logger.error(f"Error during frame processing: {e}")
-    #         await self._broadcast({"error": f"Frame processing error: {str(e)}"})
-    #     finally:
-    #         if self.cap:
-    #             self.cap.release()
-    #             self.cap = None
-            
-    #         # Generate report if analyzer exists
-    #         if self.current_analyzer:
-    #             try:
-    #                 report = self.current_analyzer.generate_report()
-    #                 if report is not None:
-    #                     print("\n" + report)
-    #                     with open('report.txt', 'w') as f:
-    #                         f.write(report)
-    #                     # Send report to clients
-    #                     await self._broadcast({"type": "report", "data": report})
-    #                 else:
-    #                     logger.warning("No report was generated (returned None)")
-    #             except Exception as e:
-    #                 logger.error(f"Error generating report: {e}")
-            
-    #         logger.info("Video processing stopped")
-    #         # Notify clients that processing has stopped
-    #         await self._broadcast({"status": "stopped"})
-            
-    async def _broadcast(self, message):
-        """Broadcast a message to all connected clients."""
-        if not self.clients:
-            return
-            
-        dead_clients = set()
-        message_json = json.dumps(message)
-        
-        for client in self.clients:
-            try:
-                await client.send(message_json)
-            except websockets.exceptions.ConnectionClosed:
-                dead_clients.add(client)
-            except Exception as e:
-                logger.error(f"Error broadcasting to client: {e}")
-                dead_clients.add(client)
-                
-        # Remove dead clients
-        self.clients -= dead_clients
-        if dead_clients:
-            logger.info(f"Removed {len(dead_clients)} dead clients")
-
-    def broadcast_message(self, message):
-        """Broadcast a message to all connected clients from any thread."""
-        if self.event_loop and self.clients:
-            asyncio.run_coroutine_threadsafe(self._broadcast(message), self.event_loop)
+        self.input_source = input_source
+
+        # One ExerciseSession per WebSocket connection
+        self.sessions = {}
+        # Sessions each connection is watching as a viewer
+        self.watching = {}
+
+        # Runs analyzer work off the event loop (inline, thread or process)
+        self.executor = AnalyzerExecutor(config.ANALYZER_EXECUTOR, config.ANALYZER_WORKERS)
+
+        # Analyzers are imported and built the first time an exercise is
+        # started, then pooled: sessions check out warmed instances
+        self.registry = AnalyzerRegistry(self.executor)
+        self.pool_task = None
+
+        # Stage latency histograms per exercise, across all sessions; each
+        # session also keeps its own. Optionally served as plain text.
+        self.metrics = ServerMetrics()
+        self.metrics_endpoint = None
+
+        # The sampling profiler while a "profile" action runs (one at a time)
+        self.profiler = None
+        # Fire-and-forget tasks, kept here so they are not collected mid-run
+        self.background_tasks = set()
+
+        # RSS sampling and the leak guard, which recycles the analyzer pools;
+        # tracemalloc diffs only while an admin asks for them
+        self.memory = MemoryMonitor(on_recycle=self.registry.recycle)
+        self.memory_task = None
+        self.allocations = AllocationTracker()
+
+    async def reply(self, websocket, message):
+        """Send a JSON message to a client on its own session's control lane."""
+        session = self.sessions.get(websocket)
+        if session is not None:
+            await session.send_json(message)
+
+    def run_in_background(self, coro, what):
+        """Start ``coro`` as a task that is kept until it finishes and logs its failure."""
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+
+        def finished(task):
+            self.background_tasks.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                logger.error(f"{what} failed: {task.exception()!r}")
+
+        task.add_done_callback(finished)
+        return task
 
     async def websocket_handler(self, websocket):
         """Handle incoming WebSocket connections."""
-        self.clients.add(websocket)
+        session = ExerciseSession(websocket, self.registry, self.executor, self.input_source,
+                                  self.metrics)
+        self.sessions[websocket] = session
         client_info = f"{websocket.remote_address[0]}:{websocket.remote_address[1]}"
-        logger.info(f"New client connected: {client_info}")
+        logger.info(f"New client connected: {client_info} (session {session.session_id})")
         
         # Send initial connection status
-        await websocket.send(json.dumps({"status": "connected"}))
+        await self.reply(websocket, {"status": "connected", "session_id": session.session_id})
         
         try:
             async for message in websocket:
+                if isinstance(message, bytes):
+                    # Binary messages are camera frames (or packed landmarks) uploaded by the browser
+                    session.submit_frame(message)
+                    continue
                 try:
                     data = json.loads(message)
                     action = data.get('action')
                     exercise = data.get('exercise')
-                    self.language = data.get("language")
-                    print(self.language, "This is language value")
-                    self.audiobot = data.get("audiobot")
-                    print(self.audiobot, "This is audiobot value")
-                    logger.info(f"Received action: {action}, exercise: {exercise}")
+                    session.update_settings(data)
+                    if action not in ('landmarks', 'ack'):
+                        logger.info(f"Received action: {action}, exercise: {exercise}")
 
                     if action == 'connect':
-                        await websocket.send(json.dumps({"status": "connected"}))
+                        await self.reply(websocket, {"status": "connected", "session_id": session.session_id})
                     elif action == 'start':
-                        if exercise in self.analyzers:
-                            await self.start_exercise(exercise, websocket)
+                        if exercise in self.registry:
+                            await self.start_exercise(exercise, websocket, data.get('source', 'camera'))
                         else:
-                            await websocket.send(json.dumps({"error": f"Invalid exercise: {exercise}"}))
+                            await self.reply(websocket, {"error": f"Invalid exercise: {exercise}"})
                     elif action == 'stop':
                         await self.stop_exercise(websocket)
+                    elif action == 'landmarks':
+                        session.submit_landmarks(data.get('landmarks'))
+                    elif action == 'ack':
+                        self.ack_frame(websocket, session, data)
+                    elif action == 'watch':
+                        await self.watch_session(websocket, data)
+                    elif action == 'profile':
+                        if self.is_admin(websocket, data):
+                            self.run_in_background(self.profile_session(websocket, data), "Profile")
+                        else:
+                            await self.reply(websocket, {"error": "Not authorized"})
+                    elif action == 'memory':
+                        if self.is_admin(websocket, data):
+                            await self.reply(websocket, await self.memory_report(data))
+                        else:
+                            await self.reply(websocket, {"error": "Not authorized"})
+                    elif action == 'stats':
+                        await self.reply(websocket, self.session_stats(session))
                     elif action == 'disconnect':
                         logger.info(f"Client requested disconnect: {client_info}")
-                        await websocket.send(json.dumps({"status": "disconnected"}))
+                        await self.reply(websocket, {"status": "disconnected"})
+                        await session.flush()
                         # Client will be removed in the finally block
                         break
                     else:
                         logger.warning(f"Unknown action: {action}")
-                        await websocket.send(json.dumps({"error": "Unknown action"}))
+                        await self.reply(websocket, {"error": "Unknown action"})
                 except json.JSONDecodeError:
                     logger.error("Invalid JSON received")
-                    await websocket.send(json.dumps({"error": "Invalid request format"}))
+                    await self.reply(websocket, {"error": "Invalid request format"})
                 except Exception as e:
                     logger.error(f"Error handling message: {e}")
-                    await websocket.send(json.dumps({"error": f"Server error: {str(e)}"}))
+                    await self.reply(websocket, {"error": f"Server error: {str(e)}"})
         except websockets.ConnectionClosed:
             logger.info(f"Client disconnected: {client_info}")
         except Exception as e:
             logger.error(f"Unexpected error in websocket handler: {e}")
         finally:
-            self.clients.remove(websocket)
+            for watched in self.watching.pop(websocket, set()):
+                watched.detach(websocket)
+            session = self.sessions.pop(websocket, None)
+            if session:
+                await session.close()
             logger.info(f"Client removed: {client_info}")
 
-    async def start_exercise(self, exercise, websocket):
-        """Start processing frames for the specified exercise."""
-        if self.running:
-            await websocket.send(json.dumps({"status": "already_running"}))
+    def session_stats(self, session):
+        """Pipeline counters, stage latencies and per-client delivery counters for one session."""
+        return {
+            "type": "stats",
+            "session_id": session.session_id,
+            "running": session.running,
+            "exercise": session.exercise,
+            "pipeline": session.pipeline.stats() if session.pipeline else None,
+            "timings": session.timings.stats(),
+            "latency": session.latency_stats(),
+            "exercises": self.metrics.stats(),
+            "clients": session.client_stats(),
+            "analyzers": self.registry.stats(),
+            "memory": self.memory.stats(history=0),
+            "resources": {**self.executor.stats(), "process": process_stats()},
+        }
+
+    def ack_frame(self, websocket, session, data):
+        """Route a client's frame acknowledgement to the session that sent the frame."""
+        session_id = data.get('session_id', session.session_id)
+        for target in (session, *self.watching.get(websocket, ())):
+            if target.session_id == session_id:
+                target.ack(websocket, data.get('seq'), data.get('rendered_at'))
+                return
+
+    def metrics_text(self):
+        """Stage latencies of every live session and every exercise, as plain text."""
+        scopes = [({"scope": "exercise", "exercise": name}, timings)
+                  for name, timings in self.metrics.exercises.items()]
+        scopes += [({"scope": "session", "session": session.session_id,
+                     "exercise": session.exercise or ""}, session.timings)
+                   for session in self.sessions.values()]
+        text = render_text(scopes)
+        rss = rss_bytes()
+        if rss is not None:
+            text += (
+                "# HELP physiovision_rss_bytes Resident set size of the server process.\n"
+                "# TYPE physiovision_rss_bytes gauge\n"
+                f"physiovision_rss_bytes {rss}\n"
+            )
+        return text
+
+    def find_session(self, session_id):
+        return next((s for s in self.sessions.values() if s.session_id == session_id), None)
+
+    def is_admin(self, websocket, data):
+        """Whether a client may use admin actions (see config.ADMIN_TOKEN)."""
+        if config.ADMIN_TOKEN:
+            return hmac.compare_digest(str(data.get('token', '')), config.ADMIN_TOKEN)
+        host = websocket.remote_address[0] if websocket.remote_address else None
+        return host in ("127.0.0.1", "::1")
+
+    async def profile_session(self, websocket, data):
+        """Sample one session's stacks for a while, save them and send back the top functions.
+
+        Covers the session's pipeline, TTS and send tasks, its capture thread
+        and its analyzer calls in the thread executor. The collapsed stacks go
+        to PROFILE_DIR for flamegraph tools.
+        """
+        session_id = data.get('session_id')
+        target = self.find_session(session_id)
+        if target is None:
+            await self.reply(websocket, {"error": f"Unknown session: {session_id}"})
+            return
+        if self.profiler is not None:
+            await self.reply(websocket, {"error": "A profile is already running"})
             return
 
         try:
-            self.current_analyzer = self.analyzers[exercise]
-            self.current_analyzer.reset_counters()  # Reset counters for new exercise
-            self.running = True
-            
-            # Cancel any existing task
-            if self.frame_processing_task and not self.frame_processing_task.done():
-                self.frame_processing_task.cancel()
-                
-            # Start new task
-            self.frame_processing_task = asyncio.create_task(self.process_frames())
-            await websocket.send(json.dumps({"status": "started", "exercise": exercise}))
-            logger.info(f"Started exercise: {exercise}")
-        except Exception as e:
-            logger.error(f"Error starting exercise: {e}")
-            await websocket.send(json.dumps({"error": f"Failed to start {exercise}: {str(e)}"}))
+            seconds = float(data.get('seconds', 10))
+            interval_ms = float(data.get('interval_ms', 5))
+        except (TypeError, ValueError):
+            seconds = interval_ms = math.nan
+        if not (math.isfinite(seconds) and seconds > 0 and math.isfinite(interval_ms) and interval_ms > 0):
+            await self.reply(websocket, {"error": "seconds and interval_ms must be positive numbers"})
+            return
+        seconds = min(seconds, config.PROFILE_MAX_SECONDS)
+        interval = min(max(interval_ms, 1.0), 1000.0) / 1000
+        loop = asyncio.get_running_loop()
+        match = SessionMatcher(loop, threading.get_ident(), target.task_name, target.profile_targets())
+        profiler = self.profiler = SamplingProfiler(match, interval)
+        profiler.start()
+        logger.info(f"Profiling session {session_id} for {seconds:.0f}s")
+        await self.reply(websocket, {"status": "profiling", "session_id": session_id,
+                                     "seconds": seconds})
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await loop.run_in_executor(None, profiler.stop)
+            self.profiler = None
 
-    async def stop_exercise(self, websocket):
-        """Stop processing frames."""
-        if not self.running:
-            await websocket.send(json.dumps({"status": "not_running"}))
+        path = os.path.join(config.PROFILE_DIR,
+                            f"session_{session_id}_{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        try:
+            await loop.run_in_executor(None, profiler.write, path)
+        except OSError as e:
+            logger.error(f"Could not write profile: {e}")
+            path = None
+        await self.reply(websocket, {"type": "profile", "session_id": session_id, "path": path,
+                                     **profiler.summary()})
+
+    async def memory_report(self, data):
+        """RSS history, per-session object counts and, on request, tracemalloc diffs.
+
+        ``trace`` may be "start" (begin tracing and take a baseline), "diff"
+        (allocation sites that grew since the last snapshot) or "stop".
+        """
+        trace = data.get('trace')
+        allocations = None
+        if trace == 'start':
+            self.allocations.start()
+        elif trace == 'diff':
+            allocations = self.allocations.diff(int(data.get('limit', 15)))
+        elif trace == 'stop':
+            self.allocations.stop()
+        return {
+            "type": "memory",
+            **self.memory.stats(),
+            "tracing": self.allocations.tracing,
+            "allocations": allocations,
+            "sessions": {session.session_id: await session.memory_stats()
+                         for session in list(self.sessions.values())},
+            "pools": self.registry.stats(),
+        }
+
+    async def watch_session(self, websocket, data):
+        """Attach the client as a viewer of another client's session."""
+        session_id = data.get('session_id')
+        target = self.find_session(session_id)
+        if target is None:
+            await self.reply(websocket, {"error": f"Unknown session: {session_id}"})
             return
+        target.attach(websocket, data.get('subscribe', 'metrics'), data.get('transport', 'json'))
+        self.watching.setdefault(websocket, set()).add(target)
+        await self.reply(websocket, {"status": "watching", "session_id": session_id,
+                                     "subscribe": target.subscriptions[websocket]})
 
-        self.running = False
-        await websocket.send(json.dumps({"status": "stopping"}))
-        
-        # Wait for frame processing to complete
-        if self.frame_processing_task and not self.frame_processing_task.done():
-            try:
-                # Give it some time to clean up
-                await asyncio.wait_for(asyncio.shield(self.frame_processing_task), timeout=2.0)
-            except asyncio.TimeoutError:
-                # If it takes too long, cancel it
-                self.frame_processing_task.cancel()
-                logger.warning("Frame processing task took too long to stop, cancelled it")
-                
-        logger.info("Exercise stopped")
+    async def start_exercise(self, exercise, websocket, source="camera"):
+        """Start processing frames for the specified exercise in the client's session."""
+        await self.sessions[websocket].start(exercise, source)
+
+    async def stop_exercise(self, websocket):
+        """Stop processing frames in the client's session."""
+        await self.sessions[websocket].stop()
 
     def start_server(self, host='localhost', port=8765):
         """Start the WebSocket server."""
@@ -400,6 +343,16 @@ class VideoServer:
                 ping_timeout=10
             )
             logger.info(f"WebSocket server running at ws://{host}:{port}")
+            # Warm and maintain the analyzer pools now that clients can connect
+            if config.WARM_ANALYZERS:
+                self.run_in_background(self.registry.warm([POSE, *config.WARM_ANALYZERS]), "Pool warm-up")
+            self.pool_task = asyncio.create_task(self.registry.maintain())
+            if config.MEMORY_SAMPLE_SECONDS:
+                self.memory_task = asyncio.create_task(self.memory.run())
+            if config.METRICS_PORT:
+                self.metrics_endpoint = MetricsEndpoint(self.metrics_text, config.METRICS_HOST,
+                                                        config.METRICS_PORT)
+                await self.metrics_endpoint.start()
         except Exception as e:
             logger.error(f"Failed to start WebSocket server: {e}")
             # Try to shut down gracefully
@@ -408,8 +361,13 @@ class VideoServer:
 
     def stop_server(self):
         """Stop the WebSocket server."""
-        self.running = False
+        if self.event_loop:
+            for session in list(self.sessions.values()):
+                asyncio.run_coroutine_threadsafe(session.close(), self.event_loop)
         
+        if self.metrics_endpoint and self.event_loop:
+            self.event_loop.call_soon_threadsafe(self.metrics_endpoint.close)
+
         if self.server:
             self.server.close()
             if self.event_loop:
@@ -417,6 +375,9 @@ class VideoServer:
             
         if self.event_loop:
             self.event_loop.call_soon_threadsafe(self.event_loop.stop)
+
+        self.registry.close()
+        self.executor.shutdown()
             
         logger.info("WebSocket server stopped")
 
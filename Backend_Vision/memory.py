@@ -0,0 +1,209 @@
+import asyncio
+import ctypes
+import gc
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+import config
+
+# getrusage is Unix-only; psutil, when installed, covers Windows
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+# Minimum time between two recycles, so a server that stays above the limit
+# after recycling does not keep tearing its pools down
+RECYCLE_COOLDOWN_SECONDS = 300.0
+
+
+def rss_bytes():
+    """Current resident set size of this process, or None where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    # No /proc (macOS) and no psutil; the peak is the best we have
+    return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process, or None where it cannot be read."""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        # Windows reports the peak working set
+        return getattr(info, "peak_wset", info.rss)
+    return None
+
+
+def release_memory():
+    """Collect garbage and hand freed heap pages back to the OS where glibc allows it."""
+    collected = gc.collect()
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+    return collected
+
+
+def object_counts(obj):
+    """Sizes of the containers an analyzer or pose estimator holds, and whether its pose graph is loaded."""
+    counts = {name: len(value) for name, value in vars(obj).items()
+              if isinstance(value, (deque, list, dict, set))}
+    # A PoseEstimator holds the MediaPipe graph in .pose; an analyzer holds a PoseEstimator
+    estimator = obj if hasattr(obj, "detect_timed") else getattr(obj, "pose", None)
+    if estimator is not None and hasattr(estimator, "detect_timed"):
+        counts["pose_graph_loaded"] = estimator.pose is not None
+    return counts
+
+
+def _mb(value):
+    return round(value / (1024 * 1024), 1) if value is not None else None
+
+
+class AllocationTracker:
+    """``tracemalloc`` snapshots on demand, reported as differences by allocation site.
+
+    Tracing slows allocation down noticeably, so it only runs between
+    ``start`` and ``stop``; each ``diff`` compares with the previous snapshot.
+    """
+
+    def __init__(self):
+        self.previous = None
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def start(self, frames=10):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.previous = self._snapshot()
+
+    def diff(self, limit=15):
+        """Allocation sites that grew most since the last snapshot (starts tracing if needed)."""
+        if not tracemalloc.is_tracing() or self.previous is None:
+            self.start()
+            return []
+        snapshot = self._snapshot()
+        stats = snapshot.compare_to(self.previous, "lineno")
+        self.previous = snapshot
+        return [
+            {"site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+             "size_diff_kb": round(stat.size_diff / 1024, 1),
+             "size_kb": round(stat.size / 1024, 1),
+             "count_diff": stat.count_diff}
+            for stat in stats[:limit]
+        ]
+
+    def stop(self):
+        self.previous = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def _snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+
+
+class MemoryMonitor:
+    """Samples RSS periodically and guards against slow growth.
+
+    Above ``warn_mb`` it logs a warning (once per crossing). Above
+    ``recycle_mb`` it calls ``on_recycle`` (the server recycles its pooled
+    analyzers and pose graphs), then collects garbage and trims the heap.
+    A limit of 0 disables that check.
+    """
+
+    def __init__(self, interval=config.MEMORY_SAMPLE_SECONDS, warn_mb=config.MEMORY_WARN_MB,
+                 recycle_mb=config.MEMORY_RECYCLE_MB, on_recycle=None,
+                 history=config.MEMORY_HISTORY):
+        self.interval = interval
+        self.warn_mb = warn_mb
+        self.recycle_mb = recycle_mb
+        self.on_recycle = on_recycle
+        # (epoch seconds, RSS bytes), oldest first
+        self.samples = deque(maxlen=history)
+        self.warned = False
+        self.warnings = 0
+        self.recycles = 0
+        self.last_recycle = float("-inf")
+        self.started_rss = rss_bytes()
+
+    async def run(self):
+        while True:
+            try:
+                await self.sample()
+            except Exception as e:
+                logger.error(f"Memory monitor error: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def sample(self):
+        rss = rss_bytes()
+        if rss is None:
+            # Nothing to watch on this platform
+            return
+        self.samples.append((time.time(), rss))
+        rss_mb = rss / (1024 * 1024)
+
+        if self.warn_mb and rss_mb > self.warn_mb:
+            if not self.warned:
+                self.warned = True
+                self.warnings += 1
+                logger.warning(f"RSS {rss_mb:.0f} MB is over the {self.warn_mb:.0f} MB warning level "
+                               f"(growing {self.growth_mb_per_hour()} MB/h)")
+        else:
+            self.warned = False
+
+        now = time.monotonic()
+        if (self.recycle_mb and rss_mb > self.recycle_mb
+                and now - self.last_recycle > RECYCLE_COOLDOWN_SECONDS):
+            self.last_recycle = now
+            self.recycles += 1
+            logger.warning(f"RSS {rss_mb:.0f} MB is over the {self.recycle_mb:.0f} MB limit; recycling")
+            if self.on_recycle:
+                await self.on_recycle()
+            release_memory()
+            logger.info(f"RSS after recycling: {_mb(rss_bytes())} MB")
+
+    def growth_mb_per_hour(self):
+        """RSS growth rate over the sampled history."""
+        if len(self.samples) < 2:
+            return None
+        (start_time, start_rss), (end_time, end_rss) = self.samples[0], self.samples[-1]
+        if end_time <= start_time:
+            return None
+        return round(_mb(end_rss - start_rss) * 3600 / (end_time - start_time), 1)
+
+    def stats(self, history=20):
+        return {
+            "rss_mb": _mb(rss_bytes()),
+            "peak_rss_mb": _mb(peak_rss_bytes()),
+            "started_rss_mb": _mb(self.started_rss),
+            "growth_mb_per_hour": self.growth_mb_per_hour(),
+            "warn_mb": self.warn_mb,
+            "recycle_mb": self.recycle_mb,
+            "warnings": self.warnings,
+            "recycles": self.recycles,
+            "history": [[round(t), _mb(rss)] for t, rss in list(self.samples)[-history:]] if history else [],
+        }
@@ -0,0 +1,248 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Where a frame's time goes, in pipeline order. "capture" is how old the frame
+# already was when the pipeline picked it up, "convert" the BGR->RGB conversion
+# before pose inference, "analyze" the exercise's form check (and model
+# predict), "serialize" building the JSON/binary messages, "broadcast" queueing
+# them on the client channels and "total" capture to broadcast end to end.
+# "end_to_end" runs from capture to the client rendering the frame, as reported
+# by client acknowledgements (it includes the network and the browser).
+STAGES = ("capture", "convert", "pose", "analyze", "draw", "encode", "serialize", "broadcast", "total",
+          "end_to_end")
+
+# Histogram bucket upper bounds in milliseconds; one more bucket catches
+# everything slower than the last bound
+BUCKETS_MS = (1, 2, 3, 5, 7.5, 10, 15, 20, 30, 40, 50, 75, 100, 150, 200, 300, 500, 750, 1000, 2000, 5000)
+
+PERCENTILES = (50, 95, 99)
+
+# Samples kept by a RollingLatency
+ROLLING_SAMPLES = 100
+
+# How far back the achieved frame rate looks, and the shortest span it is
+# averaged over (so the first couple of frames do not read as a huge rate)
+RATE_WINDOW_SECONDS = 5.0
+RATE_MIN_SPAN_SECONDS = 1.0
+
+
+class LatencyHistogram:
+    """Counts of durations in fixed buckets, so recording is O(log buckets) and memory is constant."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def record(self, seconds):
+        ms = seconds * 1000
+        self.counts[bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.sum += ms
+
+    def percentile(self, p):
+        """Estimate the ``p``th percentile in milliseconds, interpolating inside its bucket."""
+        if not self.count:
+            return None
+        rank = self.count * p / 100
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= rank:
+                if i == len(BUCKETS_MS):
+                    # Slower than the last bound; all we know is the bound
+                    return float(BUCKETS_MS[-1])
+                lower = BUCKETS_MS[i - 1] if i else 0.0
+                upper = BUCKETS_MS[i]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return float(BUCKETS_MS[-1])
+
+    def stats(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum / self.count, 2) if self.count else None,
+            **{f"p{p}_ms": _round(self.percentile(p)) for p in PERCENTILES},
+        }
+
+
+class RollingLatency:
+    """Exact statistics over the most recent ``size`` latency samples."""
+
+    def __init__(self, size=ROLLING_SAMPLES):
+        self.samples = deque(maxlen=size)
+
+    def record(self, seconds):
+        self.samples.append(seconds * 1000)
+
+    def stats(self):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        last = len(ordered) - 1
+        return {
+            "samples": len(ordered),
+            "mean_ms": round(sum(ordered) / len(ordered), 1),
+            "p50_ms": round(ordered[last * 50 // 100], 1),
+            "p95_ms": round(ordered[last * 95 // 100], 1),
+            "max_ms": round(ordered[-1], 1),
+        }
+
+
+class RateMeter:
+    """Events per second over the last ``window`` seconds."""
+
+    def __init__(self, window=RATE_WINDOW_SECONDS):
+        self.window = window
+        self.times = deque()
+        self.total = 0
+        self.started = None
+
+    def mark(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self.started is None:
+            self.started = now
+        self.times.append(now)
+        self.total += 1
+        self._expire(now)
+
+    def rate(self, now=None):
+        now = time.monotonic() if now is None else now
+        self._expire(now)
+        if self.started is None:
+            return 0.0
+        span = max(min(self.window, now - self.started), RATE_MIN_SPAN_SECONDS)
+        return len(self.times) / span
+
+    def _expire(self, now):
+        while self.times and now - self.times[0] > self.window:
+            self.times.popleft()
+
+
+class StageTimings:
+    """A latency histogram per pipeline stage plus the achieved frame rate."""
+
+    def __init__(self):
+        self.stages = {stage: LatencyHistogram() for stage in STAGES}
+        self.frames = RateMeter()
+
+    def record(self, stage, seconds):
+        self.stages[stage].record(seconds)
+
+    def frame_done(self):
+        self.frames.mark()
+
+    def stats(self):
+        return {
+            "fps": round(self.frames.rate(), 1),
+            "frames": self.frames.total,
+            "stages": {stage: hist.stats() for stage, hist in self.stages.items() if hist.count},
+        }
+
+
+class ServerMetrics:
+    """Stage timings aggregated per exercise over every session that ran it."""
+
+    def __init__(self):
+        self.exercises = {}
+
+    def exercise(self, name):
+        if name not in self.exercises:
+            self.exercises[name] = StageTimings()
+        return self.exercises[name]
+
+    def stats(self):
+        return {name: timings.stats() for name, timings in self.exercises.items()}
+
+
+def _round(value, digits=2):
+    return round(value, digits) if value is not None else None
+
+
+def _labels(labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def render_text(scopes):
+    """Prometheus-style text exposition of ``(labels, StageTimings)`` pairs."""
+    lines = [
+        "# HELP physiovision_stage_seconds Time each frame spent in a pipeline stage.",
+        "# TYPE physiovision_stage_seconds histogram",
+    ]
+    quantiles = []
+    rates = []
+    for labels, timings in scopes:
+        for stage, hist in timings.stages.items():
+            if not hist.count:
+                continue
+            stage_labels = _labels({**labels, "stage": stage})
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS_MS, hist.counts):
+                cumulative += bucket_count
+                lines.append(f'physiovision_stage_seconds_bucket{{{stage_labels},le="{bound / 1000:g}"}} {cumulative}')
+            lines.append(f'physiovision_stage_seconds_bucket{{{stage_labels},le="+Inf"}} {hist.count}')
+            lines.append(f"physiovision_stage_seconds_sum{{{stage_labels}}} {hist.sum / 1000:.6f}")
+            lines.append(f"physiovision_stage_seconds_count{{{stage_labels}}} {hist.count}")
+            for p in PERCENTILES:
+                quantiles.append(
+                    f'physiovision_stage_quantile_seconds{{{stage_labels},quantile="{p / 100:g}"}} '
+                    f"{hist.percentile(p) / 1000:.6f}"
+                )
+        rates.append(f"physiovision_fps{{{_labels(labels)}}} {timings.frames.rate():.2f}")
+
+    lines += ["# HELP physiovision_stage_quantile_seconds Estimated stage latency percentiles.",
+              "# TYPE physiovision_stage_quantile_seconds gauge", *quantiles,
+              "# HELP physiovision_fps Frames per second delivered over the last few seconds.",
+              "# TYPE physiovision_fps gauge", *rates]
+    return "\n".join(lines) + "\n"
+
+
+class MetricsEndpoint:
+    """Serves ``render()`` as plain text over HTTP for local scrapers.
+
+    Deliberately minimal: every GET of ``path`` gets the current metrics, any
+    other request a 404. Bind it to localhost; it has no authentication.
+    """
+
+    def __init__(self, render, host="127.0.0.1", port=9100, path="/metrics"):
+        self.render = render
+        self.host = host
+        self.port = port
+        self.path = path
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Metrics available at http://{self.host}:{self.port}{self.path}")
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5.0)
+            # Skip the headers; nothing in them changes the answer
+            while (await asyncio.wait_for(reader.readline(), timeout=5.0)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == self.path:
+                status, body = "200 OK", self.render().encode("utf-8")
+                content_type = "text/plain; version=0.0.4; charset=utf-8"
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+                content_type = "text/plain; charset=utf-8"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except Exception as e:
+            logger.warning(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
+
+    def close(self):
+        if self.server:
+            self.server.close()
+            self.server = None
@@ -0,0 +1,298 @@
+import asyncio
+import logging
+import time
+from asyncio import create_task
+from collections import deque
+
+import config
+from landmarks import landmark_rows
+
+logger = logging.getLogger(__name__)
+
+# Returned by LatestQueue.get once the queue is closed and drained
+CLOSED = object()
+
+
+class FrameItem:
+    """One frame on its way through the pipeline."""
+    __slots__ = ("seq", "timestamp", "monotonic", "frame", "pose_landmarks", "data", "jpeg", "targets")
+
+    def __init__(self, seq, timestamp, monotonic, frame=None, pose_landmarks=None):
+        self.seq = seq
+        # Capture time in epoch seconds, for clients (``captured_at``), and on
+        # the monotonic clock, for latencies and the analyzers' clocks
+        self.timestamp = timestamp
+        self.monotonic = monotonic
+        self.frame = frame
+        self.pose_landmarks = pose_landmarks
+        self.data = None
+        # JPEG bytes per (quality, scale) encoding, and the clients to send
+        # this frame to mapped to (subscription level, encoding)
+        self.jpeg = None
+        self.targets = None
+
+
+class LatestQueue:
+    """Bounded hand-off between two pipeline stages where the newest item wins.
+
+    When the queue is full, ``put`` drops the oldest item instead of waiting, so
+    a slow stage always picks up the freshest frame rather than a backlog.
+    """
+
+    def __init__(self, maxsize=1):
+        self.maxsize = maxsize
+        self.items = deque()
+        self.item_event = asyncio.Event()
+        self.drained_event = asyncio.Event()
+        self.drained_event.set()
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        if self.closed:
+            return
+        if len(self.items) >= self.maxsize:
+            self.items.popleft()
+            self.dropped += 1
+        self.items.append(item)
+        self.item_event.set()
+        self.drained_event.clear()
+
+    async def get(self):
+        """Return the next item, or ``CLOSED`` once the queue is closed and empty."""
+        while not self.items:
+            if self.closed:
+                return CLOSED
+            self.item_event.clear()
+            await self.item_event.wait()
+        item = self.items.popleft()
+        if not self.items:
+            self.drained_event.set()
+        return item
+
+    async def wait_drained(self):
+        """Wait until the consumer has taken everything that was put."""
+        await self.drained_event.wait()
+
+    def close(self):
+        self.closed = True
+        self.item_event.set()
+        self.drained_event.set()
+
+    def qsize(self):
+        return len(self.items)
+
+
+class Pacer:
+    """Paces a loop to ``rate`` iterations per second on the monotonic clock.
+
+    Deadlines advance by a fixed interval from the previous deadline rather than
+    from whenever the loop body finished, so the rate does not drift with
+    processing time and is unaffected by wall-clock adjustments. A loop that
+    falls more than one interval behind starts over from now instead of
+    bursting to catch up. A rate of 0 (or None) disables pacing.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.deadline = None
+        self.late = 0
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.deadline is None:
+            self.deadline = now
+        self.deadline += self.interval
+        delay = self.deadline - now
+        if delay > 0:
+            await asyncio.sleep(delay)
+        elif delay < -self.interval:
+            self.late += 1
+            self.deadline = now
+
+
+class FramePipeline:
+    """Runs one session's frames through capture -> pose -> analysis -> encode -> fan-out.
+
+    Every stage is its own task and the CPU-heavy ones go through the session's
+    analyzer executor (see executors.py), so pose inference on frame N+1
+    overlaps analysis of frame N and encoding of frame N-1. Pose inference runs
+    on the session's shared PoseEstimator; the analyzer only sees landmarks.
+    Stages are joined by ``LatestQueue``s, so a slow stage drops stale frames
+    instead of delaying everything behind it. How long each frame spends in
+    each step goes into the session's (and its exercise's) stage timings
+    (see metrics.py).
+    """
+
+    STAGES = ("capture", "pose", "analysis", "encode", "fanout")
+
+    def __init__(self, session, queue_size=1):
+        self.session = session
+        self.analyzer = session.current_analyzer
+        self.pose_estimator = session.pose_estimator
+        self.source = session.source
+        self.pose_queue = LatestQueue(queue_size)
+        self.analysis_queue = LatestQueue(queue_size)
+        self.encode_queue = LatestQueue(queue_size)
+        self.fanout_queue = LatestQueue(queue_size)
+        self.pacer = Pacer(config.PIPELINE_RATE)
+        self.timings = [t for t in (session.timings, session.exercise_timings) if t is not None]
+        self.seq = 0
+
+    async def run(self):
+        """Run all stages until the source ends or the session stops."""
+        # Named after the session so the sampling profiler can find them
+        name = self.session.task_name
+        tasks = [
+            create_task(self._capture(), name=f"{name}-capture"),
+            create_task(self._pose(), name=f"{name}-pose"),
+            create_task(self._analysis(), name=f"{name}-analysis"),
+            create_task(self._encode(), name=f"{name}-encode"),
+            create_task(self._fanout(), name=f"{name}-fanout"),
+        ]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self):
+        """Queue depth and frames dropped at the entrance of each stage."""
+        queues = {
+            "pose": self.pose_queue,
+            "analysis": self.analysis_queue,
+            "encode": self.encode_queue,
+            "fanout": self.fanout_queue,
+        }
+        stats = {name: {"depth": q.qsize(), "dropped": q.dropped} for name, q in queues.items()}
+        stats["capture"] = {"late": self.pacer.late}
+        return stats
+
+    def _record(self, stage, seconds):
+        for timings in self.timings:
+            timings.record(stage, seconds)
+
+    async def _report_error(self, e):
+        logger.error(f"Error processing frame: {e}")
+        await self.session._broadcast({"error": f"Frame processing error: {str(e)}"})
+
+    async def _capture(self):
+        """Read frames (or client landmarks) from the session's source."""
+        try:
+            while self.session.running and self.source.is_open():
+                start_time = time.time()
+                start_monotonic = time.monotonic()
+
+                success, item = await self.source.read()
+                if not success:
+                    if self.session.running:
+                        logger.info("End of video or camera disconnected")
+                        await self.session._broadcast({"error": "Video source disconnected"})
+                    break
+
+                self.seq += 1
+                # When the frame was captured (or received), not when we got to it
+                timestamp = self.source.captured_at or start_time
+                monotonic = self.source.captured_monotonic or start_monotonic
+                self._record("capture", max(0.0, time.monotonic() - monotonic))
+                if self.source.kind == "landmarks":
+                    # Client already ran pose estimation; skip straight to analysis
+                    next_queue = self.analysis_queue
+                    next_queue.put(FrameItem(self.seq, timestamp, monotonic, pose_landmarks=item))
+                else:
+                    next_queue = self.pose_queue
+                    next_queue.put(FrameItem(self.seq, timestamp, monotonic, frame=item))
+
+                if self.source.on_demand:
+                    # Only ask the client for more once the next stage took this one
+                    await next_queue.wait_drained()
+                else:
+                    await self.pacer.wait()
+        finally:
+            self.pose_queue.close()
+
+    async def _pose(self):
+        while True:
+            item = await self.pose_queue.get()
+            if item is CLOSED:
+                break
+            try:
+                item.pose_landmarks, timings = await self.pose_estimator.call("detect_timed", item.frame)
+            except Exception as e:
+                await self._report_error(e)
+                continue
+            for stage, seconds in timings.items():
+                self._record(stage, seconds)
+            self.analysis_queue.put(item)
+        self.analysis_queue.close()
+
+    async def _analysis(self):
+        while True:
+            item = await self.analysis_queue.get()
+            if item is CLOSED:
+                break
+            start = time.perf_counter()
+            try:
+                # Analyzers time countdowns, durations and velocities from
+                # the capture timestamp, not from how many frames they saw
+                item.data = await self.analyzer.call("analyze", item.pose_landmarks, item.monotonic)
+            except Exception as e:
+                await self._report_error(e)
+                continue
+            self._record("analyze", time.perf_counter() - start)
+            self.encode_queue.put(item)
+        self.encode_queue.close()
+
+    async def _encode(self):
+        while True:
+            item = await self.encode_queue.get()
+            if item is CLOSED:
+                break
+            if item.frame is None:
+                # Landmarks-only frames carry metrics and no image
+                item.data["type"] = "metrics"
+                item.targets = self.session.frame_targets()
+            else:
+                # Only clients due a frame get one, each at its own quality and
+                # scale; nothing is drawn unless a video subscriber is among them
+                item.targets = self.session.frame_targets(item.frame.shape[1])
+                encodings = {encoding for level, encoding in item.targets.values() if level == "video"}
+                if not encodings:
+                    item.data["type"] = "metrics"
+                elif self.session.render == "overlay":
+                    # The browser draws the skeleton over its own camera preview,
+                    # so send the landmarks instead of drawing and encoding a frame
+                    item.data["type"] = "overlay"
+                    item.data["landmarks"] = landmark_rows(item.pose_landmarks)
+                else:
+                    try:
+                        item.jpeg, timings = await self.analyzer.call(
+                            "render_jpeg", item.frame, item.pose_landmarks, item.data, encodings)
+                    except Exception as e:
+                        await self._report_error(e)
+                        continue
+                    for stage, seconds in timings.items():
+                        self._record(stage, seconds)
+                # The raw frame is no longer needed downstream
+                item.frame = None
+            self.fanout_queue.put(item)
+        self.fanout_queue.close()
+
+    async def _fanout(self):
+        while True:
+            item = await self.fanout_queue.get()
+            if item is CLOSED:
+                break
+            try:
+                await self.session._queue_tts(item.data)
+                start = time.perf_counter()
+                serialize_seconds = await self.session._broadcast_frame(item, self.analyzer.frame_key)
+                self._record("serialize", serialize_seconds)
+                self._record("broadcast", time.perf_counter() - start - serialize_seconds)
+                self._record("total", max(0.0, time.monotonic() - item.monotonic))
+                for timings in self.timings:
+                    timings.frame_done()
+            except Exception as e:
+                await self._report_error(e)
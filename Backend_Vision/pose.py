@@ -0,0 +1,68 @@
+import logging
+import time
+
+import cv2
+import mediapipe as mp
+import numpy as np
+
+import config
+from landmarks import LandmarkFrame
+
+logger = logging.getLogger(__name__)
+
+
+class PoseEstimator:
+    """MediaPipe Pose behind a small interface shared by the session and the analyzers.
+
+    A session runs one estimator for all of its frames and hands the landmarks
+    to whichever analyzer is active, so pose inference happens once per frame
+    no matter how many exercise analyzers the session has built. The MediaPipe
+    graph is only loaded on the first call, so analyzers that never see a raw
+    frame (the server always gives them landmarks) cost nothing for it.
+    """
+
+    def __init__(self, model_complexity=config.POSE_MODEL_COMPLEXITY,
+                 min_detection_confidence=0.5, min_tracking_confidence=0.5):
+        self.model_complexity = model_complexity
+        self.min_detection_confidence = min_detection_confidence
+        self.min_tracking_confidence = min_tracking_confidence
+        self.pose = None
+
+    def process(self, image_rgb):
+        """Run MediaPipe Pose on an RGB image and return its full result."""
+        if self.pose is None:
+            logger.info(f"Loading MediaPipe Pose (model complexity {self.model_complexity})")
+            self.pose = mp.solutions.pose.Pose(
+                static_image_mode=False,
+                model_complexity=self.model_complexity,
+                min_detection_confidence=self.min_detection_confidence,
+                min_tracking_confidence=self.min_tracking_confidence
+            )
+        return self.pose.process(image_rgb)
+
+    def detect(self, frame):
+        """Run MediaPipe Pose on a BGR frame and return a ``LandmarkFrame`` (or None)."""
+        return LandmarkFrame.from_mediapipe(self.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)).pose_landmarks)
+
+    def detect_timed(self, frame):
+        """Like ``detect``, but return ``(landmarks, {"convert": s, "pose": s})``."""
+        start = time.perf_counter()
+        image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        converted = time.perf_counter()
+        pose_landmarks = LandmarkFrame.from_mediapipe(self.process(image_rgb).pose_landmarks)
+        return pose_landmarks, {"convert": converted - start, "pose": time.perf_counter() - converted}
+
+    def warm_up(self, width=640, height=480):
+        """Load the graph and run it once on a synthetic frame."""
+        self.detect(np.zeros((height, width, 3), dtype=np.uint8))
+        self.reset()
+
+    def reset(self):
+        """Forget tracking state so the next frame starts a fresh detection."""
+        if self.pose is not None:
+            self.pose.reset()
+
+    def close(self):
+        if self.pose is not None:
+            self.pose.close()
+            self.pose = None
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+# Thread id -> analyzer (or pose estimator) object it is running a call on,
+# maintained by executors._invoke so samples from the shared analyzer thread
+# pool can be attributed to the session that owns the object
+RUNNING = {}
+
+
+def _frame_name(code):
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _stack(frame):
+    """Function names from the outermost call down to ``frame``."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    names.reverse()
+    return tuple(names)
+
+
+class SessionMatcher:
+    """Decides which sampled threads are doing work for one session.
+
+    On the event loop thread that is whenever the running task's name starts
+    with ``prefix`` (the session names its pipeline, TTS and send tasks that
+    way); on any other thread it is whenever the thread is named with the
+    prefix (the capture thread) or is inside a call on one of ``objects``
+    (the session's analyzer and pose estimator in the thread executor).
+    """
+
+    def __init__(self, loop, loop_thread_id, prefix, objects):
+        self.loop = loop
+        self.loop_thread_id = loop_thread_id
+        self.prefix = prefix
+        self.objects = {id(obj): label for label, obj in objects.items() if obj is not None}
+        self.thread_names = {}
+
+    def __call__(self, thread_id):
+        if thread_id == self.loop_thread_id:
+            try:
+                task = asyncio.current_task(self.loop)
+            except RuntimeError:
+                return None
+            if task is not None and task.get_name().startswith(self.prefix):
+                return task.get_name()
+            return None
+        running = RUNNING.get(thread_id)
+        if running is not None and id(running) in self.objects:
+            return f"{self.prefix}-{self.objects[id(running)]}"
+        if thread_id not in self.thread_names:
+            thread = next((t for t in threading.enumerate() if t.ident == thread_id), None)
+            self.thread_names[thread_id] = thread.name if thread else ""
+        if self.thread_names[thread_id].startswith(self.prefix):
+            return self.thread_names[thread_id]
+        return None
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of matching threads every ``interval`` seconds.
+
+    Runs on its own thread and only reads ``sys._current_frames()``, so the
+    profiled code is never instrumented or slowed down beyond the GIL time the
+    sampler itself takes. Nothing runs while no profile is being taken.
+    ``match(thread_id)`` returns the label to file a sample under, or None to
+    skip that thread.
+    """
+
+    def __init__(self, match, interval=0.005):
+        self.match = match
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.ticks = 0
+        self.stopped = threading.Event()
+        self.thread = None
+        self.started_at = None
+        self.elapsed = 0.0
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self.thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.elapsed = time.monotonic() - self.started_at
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            self.ticks += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                label = self.match(thread_id)
+                if label is None:
+                    continue
+                self.stacks[(label, *_stack(frame))] += 1
+                self.samples += 1
+
+    def collapsed(self):
+        """The samples as collapsed stacks ("a;b;c count" per line), for flamegraph tools."""
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def write(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.collapsed())
+
+    def top_functions(self, limit=15):
+        """Functions by samples spent in them (self) and under them (total)."""
+        own = Counter()
+        total = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for name in set(stack[1:]):
+                total[name] += count
+        samples = self.samples or 1
+        return [
+            {"function": name,
+             "self_samples": own[name],
+             "self_percent": round(100 * own[name] / samples, 1),
+             "total_percent": round(100 * total[name] / samples, 1)}
+            for name, _ in own.most_common(limit)
+        ]
+
+    def summary(self, limit=15):
+        by_label = Counter()
+        for stack, count in self.stacks.items():
+            by_label[stack[0]] += count
+        return {
+            "seconds": round(self.elapsed, 2),
+            "interval_ms": round(self.interval * 1000, 2),
+            "ticks": self.ticks,
+            "samples": self.samples,
+            "by_task": dict(by_label.most_common()),
+            "top_functions": self.top_functions(limit),
+        }
@@ -0,0 +1,38 @@
+import json
+import struct
+
+# Binary frame message, sent as a single binary WebSocket message:
+#
+#   header    21 bytes, little-endian
+#     uint8    protocol version
+#     uint32   session id
+#     uint32   frame sequence number
+#     float64  capture timestamp (seconds since the epoch)
+#     uint32   metadata length in bytes
+#   metadata  UTF-8 JSON (the same fields as a JSON frame message, minus the image)
+#   image     raw JPEG bytes up to the end of the message
+#
+# Compared with base64 inside JSON this saves a third of the bandwidth and the
+# server never copies or escapes the image as a string.
+PROTOCOL_VERSION = 1
+FRAME_HEADER = struct.Struct("<BIIdI")
+
+TRANSPORTS = ("json", "binary")
+
+
+def pack_frame(session_id, seq, timestamp, metadata, jpeg):
+    """Build a binary frame message."""
+    meta = json.dumps(metadata).encode("utf-8")
+    header = FRAME_HEADER.pack(PROTOCOL_VERSION, session_id, seq & 0xFFFFFFFF, timestamp, len(meta))
+    return b"".join((header, meta, jpeg))
+
+
+def unpack_frame(message):
+    """Split a binary frame message into (session_id, seq, timestamp, metadata, jpeg)."""
+    version, session_id, seq, timestamp, meta_length = FRAME_HEADER.unpack_from(message)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported frame protocol version: {version}")
+    meta_start = FRAME_HEADER.size
+    meta_end = meta_start + meta_length
+    metadata = json.loads(bytes(message[meta_start:meta_end]).decode("utf-8"))
+    return session_id, seq, timestamp, metadata, bytes(message[meta_end:])
@@ -0,0 +1,162 @@
+import logging
+import time
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Fixed steps keep the number of distinct encodings per frame small when
+# several clients share a session
+QUALITY_STEP = 10
+SCALE_STEPS = (1.0, 0.75, 0.5, 0.25)
+FPS_STEP = 5.0
+
+# Smoothing for the latency average, how long to wait between adjustments and
+# how many fast sends in a row it takes to step back up
+LATENCY_SMOOTHING = 0.2
+ADJUST_INTERVAL = 1.0
+RECOVER_SAMPLES = 30
+
+# Fraction of the frame interval a frame may arrive early and still be sent
+FRAME_TOLERANCE = 0.5
+
+# Render widths a client may report, in pixels; others are clamped into range
+MAX_WIDTH_MIN = 160
+MAX_WIDTH_MAX = 7680
+
+
+class QualityController:
+    """Picks the JPEG quality, downscale factor and frame rate for one client.
+
+    Its ClientChannel reports how long each video message waited between being
+    queued and leaving the socket, and every message dropped because the lane
+    was full. While the smoothed latency is over the target (or frames are
+    being dropped) the controller steps down quality first, then resolution,
+    then frame rate; once the link is comfortably fast again it steps back up
+    in the opposite order. A client can also cap the resolution with the width
+    it actually renders at, so small previews never cost a full-size encode.
+    """
+
+    def __init__(self, target_latency=config.TARGET_LATENCY_MS / 1000.0,
+                 quality_min=config.JPEG_QUALITY_MIN, quality_max=config.JPEG_QUALITY_MAX,
+                 scale_min=config.FRAME_SCALE_MIN,
+                 fps_min=config.STREAM_FPS_MIN, fps_max=config.STREAM_FPS_MAX):
+        self.target_latency = target_latency
+        self.quality_min = quality_min
+        self.quality_max = quality_max
+        self.scales = [s for s in SCALE_STEPS if s >= scale_min] or [1.0]
+        self.fps_min = fps_min
+        self.fps_max = fps_max
+        self.max_width = None
+
+        self.quality = quality_max
+        self.scale_index = 0
+        self.fps = fps_max
+        self.latency = None
+        self.fast_samples = 0
+        self.last_adjust = 0.0
+        # When the client is next due a frame, on a fixed schedule
+        self.next_due = 0.0
+
+    def set_max_width(self, value):
+        """Cap frames at the width the client renders; a falsy ``value`` removes the cap.
+
+        Values that are not positive whole numbers are ignored.
+        """
+        if not value:
+            self.max_width = None
+            return
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            return
+        try:
+            width = int(value)
+        except (ValueError, OverflowError):
+            return
+        if width > 0:
+            self.max_width = min(max(width, MAX_WIDTH_MIN), MAX_WIDTH_MAX)
+
+    def on_sent(self, latency):
+        """Record the queue-to-socket latency of one video message."""
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+
+        if self.latency > self.target_latency:
+            self.fast_samples = 0
+            self._adjust(-1)
+        elif self.latency < self.target_latency / 2:
+            self.fast_samples += 1
+            if self.fast_samples >= RECOVER_SAMPLES:
+                self.fast_samples = 0
+                self._adjust(+1)
+
+    def on_dropped(self):
+        """A queued video message was replaced before it could be sent."""
+        self.fast_samples = 0
+        self._adjust(-1)
+
+    def take_frame(self, now):
+        """Return True (and start a new interval) if the client is due a frame."""
+        interval = 1.0 / self.fps
+        # Frames arrive at about the same rate as fps_max, so one that comes
+        # a little early still counts as on time
+        if now < self.next_due - FRAME_TOLERANCE * interval:
+            return False
+        # Advance the schedule from when this frame was due rather than when it
+        # came, so early frames do not push it back; after a gap it restarts
+        self.next_due = max(self.next_due, now) + interval
+        return True
+
+    def encoding(self, frame_width=None):
+        """The ``(quality, scale)`` to encode this client's next frame with."""
+        if frame_width is None:
+            return None
+        scale = self.scales[self.scale_index]
+        if self.max_width and frame_width > self.max_width:
+            # Smallest step that still covers the client's render width
+            needed = self.max_width / frame_width
+            scale = min(scale, min((s for s in SCALE_STEPS if s >= needed), default=1.0))
+        return self.quality, scale
+
+    def _adjust(self, direction):
+        now = time.monotonic()
+        if now - self.last_adjust < ADJUST_INTERVAL:
+            return
+        if direction < 0:
+            changed = self._step_down()
+        else:
+            changed = self._step_up()
+        if changed:
+            self.last_adjust = now
+            logger.debug(f"Stream settings now {self.stats()}")
+
+    def _step_down(self):
+        if self.quality > self.quality_min:
+            self.quality = max(self.quality_min, self.quality - QUALITY_STEP)
+        elif self.scale_index < len(self.scales) - 1:
+            self.scale_index += 1
+        elif self.fps > self.fps_min:
+            self.fps = max(self.fps_min, self.fps - FPS_STEP)
+        else:
+            return False
+        return True
+
+    def _step_up(self):
+        if self.fps < self.fps_max:
+            self.fps = min(self.fps_max, self.fps + FPS_STEP)
+        elif self.scale_index > 0:
+            self.scale_index -= 1
+        elif self.quality < self.quality_max:
+            self.quality = min(self.quality_max, self.quality + QUALITY_STEP)
+        else:
+            return False
+        return True
+
+    def stats(self):
+        return {
+            "quality": self.quality,
+            "scale": self.scales[self.scale_index],
+            "fps": self.fps,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+        }
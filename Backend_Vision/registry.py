@@ -0,0 +1,221 @@
+import asyncio
+import importlib
+import logging
+import time
+from collections import deque
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Exercise name -> "module:class". Modules are only imported when an analyzer
+# for that exercise is first built, so TensorFlow, the squat model and the
+# joblib artifacts stay out of the server until someone starts squats.
+ANALYZERS = {
+    "Squats": "squats:SquatAnalyzer",
+    "Warrior": "WarriorPose:WarriorPoseAnalyzer",
+    "Lunges": "lunges_vision:LungesAnalyzer",
+    "LegRaises": "legRaises:SLRExerciseAnalyzer",
+}
+
+# Every session that reads raw frames also checks out one of these
+POSE_ESTIMATOR = "pose:PoseEstimator"
+POSE = "pose"
+
+
+class AnalyzerSpec:
+    """Factory that imports its analyzer class on first call.
+
+    Only the module path is stored, so a spec pickles cleanly into "process"
+    executor workers, which then do the import themselves.
+    """
+
+    def __init__(self, name, path):
+        self.name = name
+        self.module, self.attr = path.split(":")
+
+    def load(self):
+        return getattr(importlib.import_module(self.module), self.attr)
+
+    def __call__(self, *args, **kwargs):
+        return self.load()(*args, **kwargs)
+
+
+class HandlePool:
+    """Idle, already-warmed executor handles of one kind, ready for the next session.
+
+    Handles are built through the analyzer executor and warmed (``warm_up``)
+    before they are first handed out, so no session pays for a cold MediaPipe
+    graph or a first Keras ``predict``. The pool keeps at least ``min_size``
+    idle handles, never more than ``max_size``, and closes idle handles above
+    ``min_size`` once they have not been used for ``idle_seconds``.
+
+    ``recycle`` retires every handle built so far: idle ones are closed at
+    once and checked-out ones when they come back, so a long-running server
+    can shed whatever its MediaPipe graphs and models have accumulated.
+    """
+
+    def __init__(self, spec, executor, min_size=0, max_size=2, idle_seconds=300.0):
+        self.spec = spec
+        self.executor = executor
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        # (handle, time it became idle); the most recently returned is on the right
+        self.idle = deque()
+        self.in_use = 0
+        self.builds = 0
+        # Handles built before the last recycle are closed instead of reused
+        self.generation = 0
+        self.recycled = 0
+        self.last_build_seconds = None
+        self.total_build_seconds = 0.0
+
+    async def checkout(self):
+        """Take an idle handle, or build and warm a new one if none is left."""
+        if self.idle:
+            handle, _ = self.idle.pop()
+        else:
+            handle = await self._build()
+        self.in_use += 1
+        return handle
+
+    async def checkin(self, handle):
+        """Give back a handle whose counters the session has already reset."""
+        self.in_use -= 1
+        if len(self.idle) >= self.max_size or handle.generation != self.generation:
+            handle.close()
+            return
+        self.idle.append((handle, time.monotonic()))
+
+    def discard(self, handle):
+        """Close a checked-out handle that should not be reused."""
+        self.in_use -= 1
+        handle.close()
+
+    async def fill(self, size=None):
+        """Build idle handles until there are ``size`` (default ``min_size``)."""
+        size = self.min_size if size is None else min(size, self.max_size)
+        while len(self.idle) < size:
+            self.idle.append((await self._build(), time.monotonic()))
+
+    def evict(self, now=None):
+        """Close the handles that sat idle too long, keeping ``min_size``."""
+        now = time.monotonic() if now is None else now
+        while len(self.idle) > self.min_size and now - self.idle[0][1] > self.idle_seconds:
+            handle, _ = self.idle.popleft()
+            handle.close()
+            logger.info(f"Evicted an idle {self.spec.name} instance")
+
+    def recycle(self):
+        """Close the idle handles and retire the checked-out ones; ``fill`` builds fresh ones."""
+        self.generation += 1
+        self.recycled += len(self.idle) + self.in_use
+        self.close()
+
+    async def _build(self):
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        handle = await loop.run_in_executor(None, self.executor.create, self.spec)
+        handle.generation = self.generation
+        await handle.call("warm_up")
+        elapsed = time.perf_counter() - start
+
+        self.builds += 1
+        self.last_build_seconds = round(elapsed, 3)
+        self.total_build_seconds = round(self.total_build_seconds + elapsed, 3)
+        logger.info(f"Built and warmed {self.spec.name} in {elapsed:.2f}s")
+        return handle
+
+    def stats(self):
+        return {
+            "idle": len(self.idle),
+            "in_use": self.in_use,
+            "builds": self.builds,
+            "recycled": self.recycled,
+            "last_build_seconds": self.last_build_seconds,
+            "total_build_seconds": self.total_build_seconds,
+        }
+
+    def close(self):
+        for handle, _ in self.idle:
+            handle.close()
+        self.idle.clear()
+
+
+class AnalyzerRegistry:
+    """Pools of warmed analyzers per exercise, plus one of pose estimators.
+
+    Sessions check an analyzer (and a pose estimator) out on ``start`` and
+    check it back in after resetting its counters, so starting a session is
+    a pool hand-off rather than a model load.
+    """
+
+    def __init__(self, executor, analyzers=ANALYZERS,
+                 min_size=config.POOL_MIN_SIZE, max_size=config.POOL_MAX_SIZE,
+                 idle_seconds=config.POOL_IDLE_SECONDS):
+        self.pools = {
+            name: HandlePool(AnalyzerSpec(name, path), executor, min_size, max_size, idle_seconds)
+            for name, path in analyzers.items()
+        }
+        self.pose_pool = HandlePool(AnalyzerSpec(POSE, POSE_ESTIMATOR), executor,
+                                    min_size, max_size, idle_seconds)
+
+    def __contains__(self, name):
+        return name in self.pools
+
+    def names(self):
+        return list(self.pools)
+
+    def _pool(self, name):
+        return self.pose_pool if name == POSE else self.pools[name]
+
+    async def checkout(self, name):
+        """Check out a warmed analyzer for ``name``, or a pose estimator for ``POSE``."""
+        return await self._pool(name).checkout()
+
+    async def checkin(self, name, handle):
+        await self._pool(name).checkin(handle)
+
+    def discard(self, name, handle):
+        self._pool(name).discard(handle)
+
+    async def warm(self, names):
+        """Make sure each pool in ``names`` has at least one idle, warmed instance."""
+        for name in names:
+            if name != POSE and name not in self.pools:
+                logger.warning(f"Cannot warm unknown analyzer: {name}")
+                continue
+            try:
+                pool = self._pool(name)
+                await pool.fill(max(pool.min_size, 1))
+            except Exception as e:
+                logger.error(f"Error warming {name}: {e}")
+
+    async def maintain(self, interval=10.0):
+        """Evict idle instances and top pools back up to their minimum, forever."""
+        while True:
+            for name, pool in [(POSE, self.pose_pool), *self.pools.items()]:
+                pool.evict()
+                try:
+                    await pool.fill()
+                except Exception as e:
+                    logger.error(f"Error refilling {name} pool: {e}")
+            await asyncio.sleep(interval)
+
+    async def recycle(self):
+        """Recycle every pool, then rebuild their minimum number of idle instances."""
+        for name, pool in [(POSE, self.pose_pool), *self.pools.items()]:
+            pool.recycle()
+            try:
+                await pool.fill()
+            except Exception as e:
+                logger.error(f"Error refilling {name} pool: {e}")
+
+    def stats(self):
+        return {name: pool.stats() for name, pool in [(POSE, self.pose_pool), *self.pools.items()]}
+
+    def close(self):
+        self.pose_pool.close()
+        for pool in self.pools.values():
+            pool.close()
@@ -0,0 +1,200 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+import config
+
+logger = logging.getLogger(__name__)
+
+# Thread-count variables read by OpenMP, OpenBLAS and MKL (NumPy, TensorFlow's
+# CPU kernels) when they initialize, i.e. on the first NumPy import
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS")
+
+# How far back a pool's busy percentage looks
+USAGE_WINDOW_SECONDS = 10.0
+
+
+def available_cores():
+    """Cores this process may run on (respects affinity and container CPU sets)."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def parse_cpu_sets(value):
+    """Parse "0-3;4-7" or "0,1;2,3" into a list of core sets."""
+    cpu_sets = []
+    for group in filter(None, (part.strip() for part in (value or "").split(";"))):
+        cores = set()
+        for item in filter(None, (part.strip() for part in group.split(","))):
+            if "-" in item:
+                first, last = item.split("-")
+                cores.update(range(int(first), int(last) + 1))
+            else:
+                cores.add(int(item))
+        cpu_sets.append(cores)
+    return cpu_sets
+
+
+def pin_to_cores(cores):
+    """Restrict this process (and every thread it starts later) to ``cores``."""
+    if not cores or not hasattr(os, "sched_setaffinity"):
+        return False
+    os.sched_setaffinity(0, cores)
+    return True
+
+
+# BLAS thread count set in the environment before NumPy loaded, if any
+_startup_blas = None
+
+
+def _limit_blas(threads):
+    """Cap BLAS/OpenMP pools that are already running; False without threadpoolctl."""
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        logger.warning("NumPy was imported before the thread budget and threadpoolctl is not "
+                       "installed; BLAS thread pools are not capped")
+        return False
+    threadpool_limits(limits=threads)
+    return True
+
+
+class ThreadBudget:
+    """How many threads OpenCV, TensorFlow and the BLAS/OpenMP runtime may use in one process.
+
+    Left alone, each library sizes its pools to every core, so a few
+    concurrent sessions run many times more threads than there are cores.
+    With the "thread" and "process" executors the parallelism comes from
+    running sessions side by side, so by default each library gets a single
+    thread per process; "inline" runs one call at a time and lets each
+    library use every core. MediaPipe's graph executors cannot be sized from
+    Python; pin process workers to core sets (WORKER_CPU_SETS) to bound them.
+
+    The BLAS/OpenMP variables only take effect if they are set before NumPy
+    is first imported, so main.py calls ``apply_environment`` before its
+    other imports. Pools that are already running are capped with
+    threadpoolctl where it is installed (it comes with scikit-learn);
+    ``stats`` reports whether the BLAS cap is actually in force.
+    """
+
+    def __init__(self, mode=config.ANALYZER_EXECUTOR, opencv=config.OPENCV_THREADS,
+                 tf_intra_op=config.TF_INTRA_OP_THREADS, tf_inter_op=config.TF_INTER_OP_THREADS,
+                 blas=config.BLAS_THREADS):
+        default = available_cores() if mode == "inline" else 1
+        self.opencv = opencv or default
+        self.tf_intra_op = tf_intra_op or default
+        self.tf_inter_op = tf_inter_op or 1
+        self.blas = blas or default
+        self.blas_applied = False
+
+    def apply_environment(self):
+        """Set the thread-count variables; they only count if NumPy is not imported yet."""
+        global _startup_blas
+        if "numpy" not in sys.modules:
+            _startup_blas = self.blas
+        self.blas_applied = _startup_blas == self.blas
+        for name in THREAD_ENV_VARS:
+            os.environ[name] = str(self.blas)
+        os.environ["TF_NUM_INTRAOP_THREADS"] = str(self.tf_intra_op)
+        os.environ["TF_NUM_INTEROP_THREADS"] = str(self.tf_inter_op)
+
+    def apply(self):
+        """Apply the budget to this process; call early, before TensorFlow loads."""
+        self.apply_environment()
+        if not self.blas_applied:
+            self.blas_applied = _limit_blas(self.blas)
+
+        import cv2
+        cv2.setNumThreads(self.opencv)
+
+    def configure_tensorflow(self, tf):
+        """Size TensorFlow's thread pools; only possible before it runs its first op."""
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(self.tf_intra_op)
+            tf.config.threading.set_inter_op_parallelism_threads(self.tf_inter_op)
+        except RuntimeError:
+            # Already initialized in this process (another analyzer loaded it)
+            logger.debug("TensorFlow thread pools were already initialized")
+
+    def stats(self):
+        return {
+            "opencv": self.opencv,
+            "tf_intra_op": self.tf_intra_op,
+            "tf_inter_op": self.tf_inter_op,
+            "blas": self.blas,
+            "blas_applied": self.blas_applied,
+        }
+
+
+class PoolUsage:
+    """How busy a pool of workers is: calls, queue wait and the share of worker time spent working."""
+
+    def __init__(self, workers=0):
+        self.lock = threading.Lock()
+        self.workers = workers
+        self.active = 0
+        self.calls = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        # (end time, seconds busy) of recent calls, for the windowed busy percentage
+        self.recent = deque()
+
+    def started(self, queued_at=None):
+        """Mark a call as started; ``queued_at`` is when it was submitted."""
+        now = time.perf_counter()
+        with self.lock:
+            self.active += 1
+            if queued_at is not None:
+                self.wait_seconds += now - queued_at
+        return now
+
+    def finished(self, started_at):
+        now = time.perf_counter()
+        busy = now - started_at
+        with self.lock:
+            self.active -= 1
+            self.calls += 1
+            self.busy_seconds += busy
+            self.recent.append((now, busy))
+            while self.recent and now - self.recent[0][0] > USAGE_WINDOW_SECONDS:
+                self.recent.popleft()
+
+    def run(self, queued_at, fn, *args):
+        """Run ``fn(*args)`` on a pool worker, counting it."""
+        started_at = self.started(queued_at)
+        try:
+            return fn(*args)
+        finally:
+            self.finished(started_at)
+
+    def stats(self):
+        now = time.perf_counter()
+        with self.lock:
+            recent_busy = sum(busy for end, busy in self.recent if now - end <= USAGE_WINDOW_SECONDS)
+            capacity = USAGE_WINDOW_SECONDS * max(self.workers, 1)
+            return {
+                "workers": self.workers,
+                "active": self.active,
+                "calls": self.calls,
+                "busy_percent": round(min(100.0, 100 * recent_busy / capacity), 1),
+                "mean_call_ms": round(1000 * self.busy_seconds / self.calls, 2) if self.calls else None,
+                "mean_wait_ms": round(1000 * self.wait_seconds / self.calls, 2) if self.calls else None,
+            }
+
+
+def process_stats():
+    """CPU use of the server process and the machine's load against the cores available."""
+    times = os.times()
+    stats = {
+        "cores": available_cores(),
+        "cpu_seconds": round(times.user + times.system, 1),
+        "threads": threading.active_count(),
+    }
+    if hasattr(os, "getloadavg"):
+        stats["load_average"] = [round(load, 2) for load in os.getloadavg()]
+    return stats
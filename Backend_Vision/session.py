@@ -0,0 +1,560 @@
+import asyncio
+import base64
+import json
+import logging
+import os
+import time
+from asyncio import Queue, create_task
+from itertools import count
+import numpy as np
+import config
+from bark_tts import play_speech_directly
+from channels import ClientChannel
+from landmarks import LANDMARK_FIELDS, NUM_LANDMARKS
+from metrics import RollingLatency, StageTimings
+from pipeline import FramePipeline
+from registry import POSE
+from protocol import TRANSPORTS, pack_frame
+from sources import CameraSource, LandmarkSource, UploadSource
+
+logger = logging.getLogger(__name__)
+
+REPORT_DIR = "reports"
+
+# "camera" reads from the server's own capture device, "upload" takes frames
+# the browser sends over the WebSocket and "landmarks" takes pose landmarks the
+# browser estimated itself, so the server skips decoding and pose inference.
+FRAME_SOURCES = ("camera", "upload", "landmarks")
+
+# "server" draws the skeleton and feedback on the frame and sends it as a JPEG;
+# "overlay" sends only landmarks and feedback, and the browser draws them over
+# its local camera preview (no server-side drawing or encoding at all).
+RENDER_MODES = ("server", "overlay")
+
+# What each client receives: "video" gets frames (or overlay landmarks) plus
+# everything below, "metrics" gets the per-frame numbers without any image and
+# "events" only gets status changes, errors, audio and the report. Frames are
+# only drawn and encoded while at least one "video" subscriber is due one.
+SUBSCRIPTIONS = ("video", "metrics", "events")
+
+_session_ids = count(1)
+
+
+class ExerciseSession:
+    """One patient's exercise run: its own source, analyzers, TTS state and report."""
+
+    def __init__(self, websocket, registry, executor, input_source=0, metrics=None):
+        self.session_id = next(_session_ids)
+        # Prefix of this session's task and thread names (see profiler.py)
+        self.task_name = f"session-{self.session_id}"
+        self.websocket = websocket
+        self.clients = {websocket}
+        # "json" (base64 image inside JSON) or "binary" (see protocol.py), per client
+        self.transports = {websocket: "json"}
+        # Outgoing queue and writer task per client (see channels.py)
+        self.channels = {websocket: ClientChannel(websocket, name=f"{self.task_name}-send")}
+        self.subscriptions = {websocket: "video"}
+        self.registry = registry
+        self.executor = executor
+        self.input_source = input_source
+
+        # Per-stage latency histograms for this session's frames, and the
+        # server-wide ones for the running exercise (see metrics.py)
+        self.metrics = metrics
+        self.timings = StageTimings()
+        self.exercise_timings = None
+        # Capture to client render, across every client that acknowledges frames
+        self.end_to_end = RollingLatency()
+
+        # Checked out of the registry's warmed pools on start and returned,
+        # with counters reset, when the run ends. Both are executor handles
+        # (see executors.py); the analyzer only ever sees the estimator's landmarks.
+        self.current_analyzer = None
+        self.pose_estimator = None
+        self.exercise = None
+
+        self.source_type = "camera"
+        self.render = "server"
+        self.source = None
+        self.pipeline = None
+        self.running = False
+        self.frame_processing_task = None
+
+        self.tts_queue = Queue()
+        self.tts_worker_task = None
+        self.language = ""
+        self.audiobot = ""
+
+        # TTS-related state variables
+        self.last_error_text = None
+        self.error_hold_start_time = None
+        self.last_tts_time = 0
+        self.tts_repeat_interval = 5.0
+        self.error_tts_cooldown = 0.0
+
+        self.report = None
+
+    async def _checkout(self, exercise, source):
+        """Take a warmed analyzer (and pose estimator for frame sources) from the pools."""
+        self.exercise = exercise
+        self.exercise_timings = self.metrics.exercise(exercise) if self.metrics else None
+        self.current_analyzer = await self.registry.checkout(exercise)
+        if source != "landmarks":
+            self.pose_estimator = await self.registry.checkout(POSE)
+
+    async def _release(self):
+        """Reset the checked-out analyzer and pose estimator and return them to their pools."""
+        for name, handle, reset in ((self.exercise, self.current_analyzer, "reset_counters"),
+                                    (POSE, self.pose_estimator, "reset")):
+            if handle is None:
+                continue
+            try:
+                await handle.call(reset)
+                await self.registry.checkin(name, handle)
+            except Exception as e:
+                logger.error(f"Error returning {name} to its pool: {e}")
+                self.registry.discard(name, handle)
+        self.current_analyzer = None
+        self.pose_estimator = None
+
+    def update_settings(self, data):
+        """Apply the TTS settings carried on a client message."""
+        if "language" in data:
+            self.language = data.get("language")
+        if "audiobot" in data:
+            self.audiobot = data.get("audiobot")
+        if data.get("transport") in TRANSPORTS:
+            self.transports[self.websocket] = data["transport"]
+        if data.get("subscribe") in SUBSCRIPTIONS:
+            self.subscriptions[self.websocket] = data["subscribe"]
+        if data.get("render") in RENDER_MODES:
+            self.render = data["render"]
+        if "max_width" in data:
+            # Width the client renders frames at; frames are never encoded wider
+            self.channels[self.websocket].quality.set_max_width(data["max_width"])
+
+    async def start(self, exercise, source="camera"):
+        """Start processing frames for the specified exercise."""
+        if self.running:
+            await self.send_json({"status": "already_running"})
+            return
+
+        if source not in FRAME_SOURCES:
+            await self.send_json({"error": f"Invalid source: {source}"})
+            return
+
+        try:
+            await self._checkout(exercise, source)
+            await self.current_analyzer.call("reset_counters")  # Reset counters for new exercise
+            self.source_type = source
+            self.report = None
+            self.running = True
+
+            # Cancel any existing task
+            if self.frame_processing_task and not self.frame_processing_task.done():
+                self.frame_processing_task.cancel()
+
+            self.frame_processing_task = create_task(self.process_frames(), name=f"{self.task_name}-frames")
+            await self.send_json({"status": "started", "exercise": exercise, "source": source,
+                              "render": self.render})
+            logger.info(f"Session {self.session_id} started exercise: {exercise}")
+        except Exception as e:
+            self.running = False
+            await self._release()
+            logger.error(f"Error starting exercise: {e}")
+            await self.send_json({"error": f"Failed to start {exercise}: {str(e)}"})
+
+    async def stop(self, notify=True):
+        """Stop processing frames and wait for the report to be produced."""
+        if not self.running:
+            if notify:
+                await self.send_json({"status": "not_running"})
+            return
+
+        self.running = False
+        if self.source:
+            # Wakes an upload source that is waiting for the next frame
+            self.source.interrupt()
+        if notify:
+            await self.send_json({"status": "stopping"})
+
+        # Wait for frame processing to complete
+        if self.frame_processing_task and not self.frame_processing_task.done():
+            try:
+                # Give it some time to clean up
+                await asyncio.wait_for(asyncio.shield(self.frame_processing_task), timeout=2.0)
+            except asyncio.TimeoutError:
+                # If it takes too long, cancel it
+                self.frame_processing_task.cancel()
+                logger.warning(f"Session {self.session_id} frame task took too long to stop, cancelled it")
+
+        logger.info(f"Session {self.session_id} exercise stopped")
+
+    async def close(self):
+        """Tear down the session when its client goes away."""
+        await self.stop(notify=False)
+        self.clients.clear()
+        for channel in self.channels.values():
+            channel.close()
+        self.channels.clear()
+        # Only set if the frame task was cancelled before it could return them
+        await self._release()
+
+    def attach(self, websocket, subscribe="metrics", transport="json"):
+        """Add a viewer (e.g. a therapist dashboard) to this session's broadcasts."""
+        self.clients.add(websocket)
+        self.channels[websocket] = ClientChannel(websocket, name=f"{self.task_name}-send")
+        self.subscriptions[websocket] = subscribe if subscribe in SUBSCRIPTIONS else "metrics"
+        self.transports[websocket] = transport if transport in TRANSPORTS else "json"
+        logger.info(f"Session {self.session_id} attached a {self.subscriptions[websocket]} viewer")
+
+    def detach(self, websocket):
+        """Remove a viewer added with ``attach``."""
+        self.clients.discard(websocket)
+        self.subscriptions.pop(websocket, None)
+        self.transports.pop(websocket, None)
+        channel = self.channels.pop(websocket, None)
+        if channel:
+            channel.close()
+
+    def ack(self, websocket, seq, rendered_at=None):
+        """Record a client's acknowledgement that it rendered frame ``seq``.
+
+        ``rendered_at`` is the client's render time in seconds since the epoch.
+        Returns False if the frame was not sent to that client by this session.
+        """
+        channel = self.channels.get(websocket)
+        if channel is None or seq is None:
+            return False
+        latency = channel.ack(int(seq), float(rendered_at) if rendered_at else None)
+        if latency is None:
+            return False
+        self.end_to_end.record(latency)
+        for timings in (self.timings, self.exercise_timings):
+            if timings is not None:
+                timings.record("end_to_end", latency)
+        return True
+
+    def submit_frame(self, data):
+        """Accept a compressed frame (or packed landmarks) uploaded by the client."""
+        if not self.running or not isinstance(self.source, UploadSource):
+            logger.warning(f"Session {self.session_id} ignored an unrequested frame upload")
+            return
+        self.source.submit(data)
+
+    def submit_landmarks(self, landmarks):
+        """Accept landmarks sent as JSON rows; ``None`` means no person in view."""
+        if not self.running or not isinstance(self.source, LandmarkSource):
+            logger.warning(f"Session {self.session_id} ignored landmarks outside landmarks mode")
+            return
+        if landmarks is None:
+            self.source.submit(b"")
+            return
+        try:
+            rows = np.asarray(landmarks, dtype=np.float32)
+        except (TypeError, ValueError):
+            rows = None
+        # Values are checked when the source decodes them (LandmarkFrame.from_values)
+        if rows is None or rows.shape != (NUM_LANDMARKS, LANDMARK_FIELDS):
+            logger.warning(f"Session {self.session_id} ignored landmarks that are not "
+                           f"{NUM_LANDMARKS} [x, y, z, visibility] rows")
+            return
+        self.source.submit(rows)
+
+    async def _request_frame(self):
+        """Tell the client the session is ready for its next uploaded frame."""
+        await self.send_json({"type": "ready"})
+
+    def _make_source(self):
+        if self.source_type == "upload":
+            return UploadSource(self._request_frame, executor=self.executor)
+        if self.source_type == "landmarks":
+            return LandmarkSource(self._request_frame)
+        return CameraSource(
+            self.input_source,
+            width=config.CAPTURE_WIDTH,
+            height=config.CAPTURE_HEIGHT,
+            fourcc=config.CAPTURE_FOURCC,
+            buffer_size=config.CAPTURE_BUFFER_SIZE,
+            fps=config.CAPTURE_FPS,
+            name=f"{self.task_name}-capture",
+        )
+
+    async def process_frames(self):
+        """Frame processing loop for this session with TTS error reporting."""
+        try:
+            self.source = self._make_source()
+            if not self.source.open():
+                logger.error(f"Error: Could not open video source {self.input_source}")
+                await self._broadcast({"error": "Could not open video source"})
+                return
+
+            self.last_error_text = None
+            self.error_hold_start_time = None
+            self.last_tts_time = 0
+
+            self.tts_worker_task = create_task(self._tts_worker(), name=f"{self.task_name}-tts")
+
+            logger.info(f"Session {self.session_id} started processing frames")
+            self.pipeline = FramePipeline(self)
+            await self.pipeline.run()
+
+        except Exception as e:
+            logger.error(f"Error during frame processing: {e}")
+            await self._broadcast({"error": f"Frame processing error: {str(e)}"})
+        finally:
+            self.running = False
+            if self.source:
+                self.source.release()
+                self.source = None
+
+            if self.tts_worker_task:
+                self.tts_worker_task.cancel()
+                try:
+                    await self.tts_worker_task
+                except asyncio.CancelledError:
+                    pass
+                self.tts_worker_task = None
+
+            await self._finish_report()
+            await self._release()
+
+            logger.info(f"Session {self.session_id} video processing stopped")
+            await self._broadcast({"status": "stopped"})
+
+    async def _queue_tts(self, processed_data):
+        """Queue spoken feedback once an error has been held long enough."""
+        error_text = processed_data.get("error_text", "") or ""
+        if error_text:
+            error_text = error_text.strip()
+        current_time = time.time()
+
+        if not error_text:
+            self.last_error_text = None
+            self.error_hold_start_time = None
+            self.last_tts_time = 0
+            return
+
+        if error_text != self.last_error_text:
+            self.last_error_text = error_text
+            self.error_hold_start_time = current_time
+            self.last_tts_time = 0
+
+        time_held = current_time - self.error_hold_start_time
+        time_since_last_tts = current_time - self.last_tts_time
+
+        if (time_held >= self.error_tts_cooldown and
+                (self.last_tts_time == 0 or
+                 time_since_last_tts >= self.tts_repeat_interval)):
+
+            if self.audiobot != "off":
+                while not self.tts_queue.empty():
+                    try:
+                        self.tts_queue.get_nowait()
+                        self.tts_queue.task_done()
+                    except asyncio.QueueEmpty:
+                        break
+
+                await self.tts_queue.put(error_text)
+                self.last_tts_time = current_time
+
+    async def _tts_worker(self):
+        while True:
+            error_text = await self.tts_queue.get()
+            try:
+                tts_result = await play_speech_directly(error_text, self.language)
+                if tts_result["audio_data"]:
+                    await self._broadcast({
+                        "type": "audio",
+                        "audio_data": tts_result["audio_data"]
+                    })
+                if tts_result["error"]:
+                    logger.error(tts_result["error"])
+            except Exception as e:
+                logger.error(f"TTS worker error: {e}")
+            finally:
+                self.tts_queue.task_done()
+
+    async def _finish_report(self):
+        """Generate this session's report, save it and send it to its clients."""
+        if not self.current_analyzer:
+            return
+        try:
+            report = await self.current_analyzer.call("generate_report")
+            if report is not None:
+                self.report = report
+                print("\n" + report)
+                os.makedirs(REPORT_DIR, exist_ok=True)
+                report_path = os.path.join(REPORT_DIR, f"report_{self.session_id}.txt")
+                with open(report_path, 'w') as f:
+                    f.write(report)
+                await self._broadcast({"type": "report", "data": report})
+            else:
+                logger.warning("No report was generated (returned None)")
+        except Exception as e:
+            logger.error(f"Error generating report: {e}")
+
+    def profile_targets(self):
+        """Objects whose executor calls count as this session's work when profiling."""
+        targets = {}
+        for label, handle in (("analyzer", self.current_analyzer), ("pose", self.pose_estimator)):
+            # Only in-process handles expose their object; "process" workers
+            # cannot be sampled from here
+            if handle is not None and hasattr(handle, "analyzer"):
+                targets[label] = handle.analyzer
+        return targets
+
+    async def memory_stats(self):
+        """What this session is holding on to: queued messages, buffers and pose graphs."""
+        channels = self.channels.values()
+        stats = {
+            "clients": len(self.clients),
+            "queued_control": sum(len(channel.control) for channel in channels),
+            "queued_video": sum(len(channel.video) for channel in channels),
+            "queued_video_bytes": sum(len(entry[0]) for channel in channels for entry in channel.video),
+            "frames_awaiting_ack": sum(len(channel.in_flight) for channel in channels),
+            "tts_queued": self.tts_queue.qsize(),
+            "pipeline_queued": sum(stage.get("depth", 0) for stage in self.pipeline.stats().values())
+            if self.pipeline else 0,
+        }
+        for label, handle in (("analyzer", self.current_analyzer), ("pose", self.pose_estimator)):
+            if handle is not None:
+                try:
+                    stats[label] = await handle.call("object_counts")
+                except Exception as e:
+                    stats[label] = {"error": str(e)}
+        return stats
+
+    def latency_stats(self):
+        """End-to-end latency and how many frames were captured, dropped, sent and rendered."""
+        pipeline = self.pipeline.stats() if self.pipeline else {}
+        channels = self.channels.values()
+        return {
+            "end_to_end": self.end_to_end.stats(),
+            "frames_captured": self.pipeline.seq if self.pipeline else 0,
+            "frames_dropped": sum(stage.get("dropped", 0) for stage in pipeline.values()),
+            "frames_sent": sum(channel.frames_sent for channel in channels),
+            "frames_dropped_in_send": sum(channel.video_dropped for channel in channels),
+            "frames_rendered": sum(channel.frames_rendered for channel in channels),
+        }
+
+    def client_stats(self):
+        """Queue depth and drop counters for each client of this session."""
+        return [
+            {"client": f"{c.remote_address[0]}:{c.remote_address[1]}" if c.remote_address else None,
+             "transport": self.transports.get(c, "json"),
+             "subscribe": self.subscriptions.get(c, "video"),
+             **channel.stats()}
+            for c, channel in self.channels.items()
+        ]
+
+    async def send_json(self, message):
+        """Send a JSON message to the client that owns this session, on its control lane."""
+        channel = self.channels.get(self.websocket)
+        if channel:
+            channel.send_control(json.dumps(message))
+
+    async def flush(self):
+        """Wait for the owner's queued messages to go out, e.g. before closing."""
+        channel = self.channels.get(self.websocket)
+        if channel:
+            await channel.flush()
+
+    async def _broadcast(self, message):
+        """Broadcast a JSON message to the clients attached to this session.
+
+        These are control messages (status, errors, reports, audio) and are
+        never dropped.
+        """
+        text = json.dumps(message)
+        self._deliver(lambda client: text, video=False)
+
+    def frame_targets(self, frame_width=None):
+        """Pick the clients due a per-frame message now.
+
+        Returns ``{client: (level, encoding)}``, where ``encoding`` is the
+        ``(quality, scale)`` a "video" subscriber's image should use, or None
+        for "metrics" subscribers and messages without an image.
+        "events" subscribers never get per-frame messages.
+        """
+        now = time.monotonic()
+        targets = {}
+        for client in self.clients:
+            level = self.subscriptions.get(client, "video")
+            if level == "events":
+                continue
+            channel = self.channels.get(client)
+            if channel and not channel.closed and channel.quality.take_frame(now):
+                encoding = channel.quality.encoding(frame_width) if level == "video" else None
+                targets[client] = (level, encoding)
+        return targets
+
+    async def _broadcast_frame(self, item, frame_key):
+        """Send a processed frame to its target clients at their subscription level and transport.
+
+        Frames go in the droppable video lane of each client's channel. Every
+        message carries the session id, the frame's sequence number and its
+        capture timestamp (epoch seconds), which clients echo back in ``ack``.
+        Returns the seconds spent building (serializing) the messages.
+        """
+        messages = {}
+        serialize_seconds = 0.0
+
+        def build(client):
+            nonlocal serialize_seconds
+            if client not in item.targets:
+                return None
+            level, encoding = item.targets[client]
+            transport = self.transports.get(client, "json")
+            key = (level, transport, encoding)
+            if key not in messages:
+                start = time.perf_counter()
+                data = item.data
+                jpeg = item.jpeg.get(encoding) if item.jpeg and encoding else None
+                if level == "metrics" and data.get("type") != "metrics":
+                    data = {k: v for k, v in data.items() if k != "landmarks"}
+                    data["type"] = "metrics"
+                data = {**data, "session_id": self.session_id, "seq": item.seq,
+                        "captured_at": round(item.timestamp, 3)}
+                if transport == "binary" and jpeg is not None:
+                    messages[key] = pack_frame(
+                        self.session_id, item.seq, item.timestamp, data, jpeg)
+                else:
+                    if jpeg is not None:
+                        data[frame_key] = base64.b64encode(jpeg).decode('utf-8')
+                    messages[key] = json.dumps(data)
+                serialize_seconds += time.perf_counter() - start
+            return messages[key]
+
+        self._deliver(build, video=True, seq=item.seq, captured_at=item.timestamp)
+        return serialize_seconds
+
+    def _deliver(self, build, video, seq=None, captured_at=None):
+        """Queue ``build(client)`` for every client, dropping any that have gone away.
+
+        Clients for which ``build`` returns None are skipped. ``seq`` and
+        ``captured_at`` identify a video message for acknowledgements.
+        """
+        dead_clients = set()
+
+        for client in self.clients:
+            channel = self.channels.get(client)
+            if channel is None or channel.closed:
+                dead_clients.add(client)
+                continue
+            message = build(client)
+            if message is None:
+                continue
+            if video:
+                channel.send_video(message, seq, captured_at)
+            else:
+                channel.send_control(message)
+
+        # Remove dead clients
+        if dead_clients:
+            self.clients -= dead_clients
+            for client in dead_clients:
+                channel = self.channels.pop(client, None)
+                if channel:
+                    channel.close()
+            logger.info(f"Session {self.session_id} removed {len(dead_clients)} dead clients")
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import cv2
+import numpy as np
+import time
+from capture import CaptureThread
+from landmarks import LandmarkFrame
+
+logger = logging.getLogger(__name__)
+
+
+class CameraSource:
+    """Reads frames from a camera index or video file on the server.
+
+    A ``CaptureThread`` keeps reading in the background, so ``read`` always
+    returns the newest frame and never one that sat in the driver's buffer.
+    """
+
+    kind = "frame"
+    # Frames arrive on their own, whether or not anyone asked for them
+    on_demand = False
+
+    def __init__(self, input_source=0, **capture_settings):
+        self.capture = CaptureThread(input_source, **capture_settings)
+        # When the frame last returned by ``read`` was captured: epoch
+        # seconds for clients, time.monotonic() for the analyzers' clocks
+        self.captured_at = None
+        self.captured_monotonic = None
+
+    def open(self):
+        return self.capture.open()
+
+    def is_open(self):
+        return self.capture.is_open()
+
+    async def read(self):
+        """Return (success, frame) for the newest frame not yet read."""
+        item = await self.capture.next_frame()
+        if item is None:
+            return False, None
+        _, self.captured_at, self.captured_monotonic, frame = item
+        return True, frame
+
+    def interrupt(self):
+        """Wake a ``read`` that is waiting for the next frame."""
+        self.capture.interrupt()
+
+    def release(self):
+        self.capture.release()
+
+    def stats(self):
+        return self.capture.stats()
+
+
+class UploadSource:
+    """Frames sent by the browser as binary (JPEG/WebP) WebSocket messages.
+
+    ``kind`` tells the session whether ``read`` yields images or landmarks.
+
+    Flow control is pull based: each ``read`` asks the client for one frame with
+    a ``{"type": "ready"}`` message, so the client only sends when the session
+    has finished with the previous frame. If a client sends more than it was
+    asked for, the newest frame replaces any that has not been picked up yet.
+    """
+
+    kind = "frame"
+    # The client only sends a frame after being asked for one
+    on_demand = True
+    # Decoding a JPEG takes long enough to stall every session on the loop
+    decode_in_executor = True
+
+    def __init__(self, request_frame, wait_timeout=1.0, executor=None):
+        self.request_frame = request_frame
+        # Runs ``_decode`` off the event loop (AnalyzerExecutor.run)
+        self.executor = executor
+        self.wait_timeout = wait_timeout
+        self.pending = None
+        self.pending_at = None
+        self.pending_monotonic = None
+        # When the frame last returned by ``read`` reached the server (epoch
+        # seconds and time.monotonic(), as for CameraSource)
+        self.captured_at = None
+        self.captured_monotonic = None
+        self.frame_event = asyncio.Event()
+        self.requested = False
+        self.opened = False
+        self.dropped_frames = 0
+
+    def open(self):
+        self.opened = True
+        return True
+
+    def is_open(self):
+        return self.opened
+
+    def submit(self, data):
+        """Hand a compressed frame received from the client to the session."""
+        if self.pending is not None:
+            self.dropped_frames += 1
+        self.pending = data
+        self.pending_at = time.time()
+        self.pending_monotonic = time.monotonic()
+        self.frame_event.set()
+
+    async def read(self):
+        """Wait for the next uploaded frame and decode it."""
+        while self.opened:
+            if self.pending is None and not self.requested:
+                self.requested = True
+                await self.request_frame()
+            if self.pending is None:
+                try:
+                    await asyncio.wait_for(self.frame_event.wait(), timeout=self.wait_timeout)
+                except asyncio.TimeoutError:
+                    # The client may have missed the request; ask again
+                    self.requested = False
+                    continue
+            data, self.pending = self.pending, None
+            self.captured_at = self.pending_at
+            self.captured_monotonic = self.pending_monotonic
+            self.frame_event.clear()
+            self.requested = False
+            if data is None:
+                continue
+
+            if self.decode_in_executor and self.executor is not None:
+                success, item = await self.executor.run(self._decode, data)
+            else:
+                success, item = self._decode(data)
+            if not success:
+                logger.warning(f"Could not decode uploaded {self.kind}, requesting another")
+                continue
+            return True, item
+        return False, None
+
+    def _decode(self, data):
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return frame is not None, frame
+
+    def interrupt(self):
+        """Wake a ``read`` that is waiting for the client."""
+        self.release()
+
+    def release(self):
+        self.opened = False
+        self.pending = None
+        self.frame_event.set()
+
+
+class LandmarkSource(UploadSource):
+    """Pose landmarks estimated in the browser, one set of 33 per frame.
+
+    Each message is either 132 little-endian float32 values (binary) or a JSON
+    list of 33 ``[x, y, z, visibility]`` rows. An empty message means no person
+    was detected and is passed on as ``None``.
+    """
+
+    kind = "landmarks"
+    # 132 floats; cheaper to read on the loop than to hand to a worker
+    decode_in_executor = False
+
+    def _decode(self, data):
+        if len(data) == 0:
+            return True, None
+        try:
+            return True, LandmarkFrame.from_values(data)
+        except (TypeError, ValueError) as e:
+            # Well-formed JSON can still hold the wrong types (dicts, nulls)
+            logger.warning(f"Invalid landmarks: {e}")
+            return False, None
@@ -0,0 +1,148 @@
+import numpy as np
+
+from landmarks import (LEFT_ANKLE, LEFT_HIP, LEFT_KNEE, LEFT_SHOULDER, NOSE, RIGHT_ANKLE, RIGHT_HIP,
+                       RIGHT_KNEE, RIGHT_SHOULDER)
+
+# Per-frame features the squat model was trained on, followed by their rates
+# of change (per second), in the order the model expects them
+BASE_FEATURES = [
+    'left_knee_angle', 'right_knee_angle',
+    'left_hip_angle', 'right_hip_angle',
+    'torso_vertical_angle', 'head_torso_angle',
+    'knee_distance_normalized', 'ankle_distance_normalized',
+    'left_squat_depth', 'right_squat_depth',
+]
+FEATURE_NAMES = BASE_FEATURES + [f'{name}_velocity' for name in BASE_FEATURES]
+FEATURE_INDEX = {name: i for i, name in enumerate(FEATURE_NAMES)}
+
+# Limb vectors (from, to) whose angles make up the first six base features:
+# each angle is between the matching FIRST and SECOND vector, and the
+# torso_vertical_angle's second vector is the vertical
+FIRST_VECTORS = [
+    (LEFT_HIP, LEFT_KNEE), (RIGHT_HIP, RIGHT_KNEE),
+    (LEFT_SHOULDER, LEFT_HIP), (RIGHT_SHOULDER, RIGHT_HIP),
+    (LEFT_SHOULDER, LEFT_HIP), (NOSE, LEFT_SHOULDER),
+]
+SECOND_VECTORS = [
+    (LEFT_KNEE, LEFT_ANKLE), (RIGHT_KNEE, RIGHT_ANKLE),
+    (LEFT_HIP, LEFT_KNEE), (RIGHT_HIP, RIGHT_KNEE),
+    (LEFT_SHOULDER, LEFT_HIP),
+]
+VERTICAL_ANGLE = BASE_FEATURES.index('torso_vertical_angle')
+
+
+def _vectors(points, pairs):
+    pairs = np.array(pairs, dtype=np.intp)
+    return points[..., pairs[:, 1], :] - points[..., pairs[:, 0], :]
+
+
+def _unit(vectors):
+    magnitude = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    # A zero-length limb stays a zero vector, as in the training preprocessing
+    return vectors / np.where(magnitude == 0, 1e-10, magnitude)
+
+
+def base_features(landmarks):
+    """The ten per-frame squat features from (..., 33, 3+) landmarks, as (..., 10) float64."""
+    points = np.asarray(landmarks, dtype=np.float64)[..., :3]
+    first = _vectors(points, FIRST_VECTORS)
+    # Y is vertical in image coordinates
+    second = np.insert(_vectors(points, SECOND_VECTORS), VERTICAL_ANGLE, (0.0, 1.0, 0.0), axis=-2)
+    cosine = np.einsum('...d,...d->...', _unit(first), _unit(second))
+    angles = np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+
+    # Left-right spread in the floor (x, z) plane, relative to the hips
+    def floor_width(left, right):
+        delta = points[..., right, :] - points[..., left, :]
+        return np.hypot(delta[..., 0], delta[..., 2])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        hip_width = floor_width(LEFT_HIP, RIGHT_HIP)
+        spreads = np.stack([floor_width(LEFT_KNEE, RIGHT_KNEE) / hip_width,
+                            floor_width(LEFT_ANKLE, RIGHT_ANKLE) / hip_width], axis=-1)
+
+    # Squat depth: hip height relative to knee height
+    depths = np.stack([points[..., LEFT_HIP, 1] - points[..., LEFT_KNEE, 1],
+                       points[..., RIGHT_HIP, 1] - points[..., RIGHT_KNEE, 1]], axis=-1)
+    return np.concatenate([angles, spreads, depths], axis=-1)
+
+
+def standardization(scaler):
+    """``(mean, scale)`` such that ``scaler.transform(x) == (x - mean) / scale``.
+
+    Returns ``(None, None)`` unless ``scaler`` is a fitted StandardScaler.
+    """
+    if not hasattr(scaler, "with_mean") or not hasattr(scaler, "mean_"):
+        return None, None
+    features = len(scaler.mean_)
+    mean = np.asarray(scaler.mean_, dtype=np.float64) if scaler.with_mean else np.zeros(features)
+    if scaler.with_std and scaler.scale_ is not None:
+        scale = np.asarray(scaler.scale_, dtype=np.float64)
+    else:
+        scale = np.ones(features)
+    return mean, scale
+
+
+class FeatureWindow:
+    """The last ``size`` feature rows of a squat session in a preallocated float32 buffer.
+
+    Each row is written twice, at ``i`` and ``i + size``, so the window in
+    time order is always the contiguous slice ``buffer[start:start + size]``
+    and the model reads it without copying or reordering anything.
+
+    Given the scaler's ``mean`` and ``scale`` (see ``standardization``), a
+    second buffer laid out the same way holds every row standardized once,
+    as it arrives, so the window never has to be rescaled as a whole.
+    """
+
+    def __init__(self, size, mean=None, scale=None):
+        self.size = size
+        self.buffer = np.zeros((2 * size, len(FEATURE_NAMES)), dtype=np.float32)
+        self.mean = mean
+        self.scale = scale
+        self.scaled = np.zeros_like(self.buffer) if mean is not None else None
+        self.previous = np.zeros(len(BASE_FEATURES))
+        self.next = 0
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def push(self, features, dt):
+        """Append one frame's base features; ``dt`` is the time since the previous frame.
+
+        Returns the row as standardized, or None without a mean and scale.
+        """
+        row = self.buffer[self.next]
+        scaled = None
+        base = len(BASE_FEATURES)
+        row[:base] = features
+        if self.count and dt > 0:
+            row[base:] = (features - self.previous) / dt
+        else:
+            row[base:] = 0.0
+        self.buffer[self.next + self.size] = row
+        if self.scaled is not None:
+            scaled = self.scaled[self.next]
+            scaled[:] = (row - self.mean) / self.scale
+            self.scaled[self.next + self.size] = scaled
+        self.previous = features
+        self.next = (self.next + 1) % self.size
+        self.count += 1
+        return scaled
+
+    def window(self):
+        """The rows collected so far, oldest first, as a (len(self), features) view."""
+        return self._ordered(self.buffer)
+
+    def scaled_window(self):
+        """Like ``window``, but standardized; only available when built with a mean and scale."""
+        return self._ordered(self.scaled)
+
+    def _ordered(self, buffer):
+        start = self.next if self.count >= self.size else 0
+        return buffer[start:start + len(self)]
+
+    def clear(self):
+        self.next = 0
+        self.count = 0
@@ -0,0 +1,235 @@
+import numpy as np
+
+# Largest difference in class probabilities from model.predict that still
+# counts as the same output (float32 rounding in a different order)
+PARITY_TOLERANCE = 1e-4
+
+
+def _sigmoid(x):
+    # Same as 1 / (1 + exp(-x)), without overflowing for large negative x
+    return 0.5 * (1.0 + np.tanh(0.5 * x))
+
+
+def _softmax(x):
+    exp = np.exp(x - x.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0.0),
+    "tanh": np.tanh,
+    "sigmoid": _sigmoid,
+    "softmax": _softmax,
+}
+
+
+def run_lstm(projected, recurrent, units):
+    """Step LSTM directions side by side over inputs already multiplied by their kernels.
+
+    ``projected`` is (directions, steps, 4 * units), each direction in the
+    order it reads the sequence, with the bias added; ``recurrent`` is
+    (directions, units, 4 * units). Gates are in Keras order (input, forget,
+    cell, output). Returns the hidden state after every step, in the same order.
+    """
+    directions, steps, _ = projected.shape
+    h = np.zeros((directions, 1, units), dtype=np.float32)
+    c = np.zeros((directions, 1, units), dtype=np.float32)
+    outputs = np.empty((directions, steps, units), dtype=np.float32)
+    for t in range(steps):
+        z = projected[:, t:t + 1] + np.matmul(h, recurrent)
+        i = _sigmoid(z[..., :units])
+        f = _sigmoid(z[..., units:2 * units])
+        g = np.tanh(z[..., 2 * units:3 * units])
+        o = _sigmoid(z[..., 3 * units:])
+        c = f * c + i * g
+        h = o * np.tanh(c)
+        outputs[:, t] = h[:, 0]
+    return outputs
+
+
+class RecurrentLayer:
+    """One LSTM, or a Bidirectional LSTM with concatenated outputs, as stacked NumPy weights."""
+
+    def __init__(self, kernels, recurrents, biases, units, return_sequences):
+        # One entry per direction: forward, then backward for a Bidirectional
+        self.kernels = np.stack(kernels).astype(np.float32)
+        self.recurrents = np.stack(recurrents).astype(np.float32)
+        self.biases = np.stack(biases).astype(np.float32)[:, np.newaxis]
+        self.units = units
+        self.return_sequences = return_sequences
+
+    def project(self, inputs):
+        """(steps, features) -> (directions, steps, 4 * units) input projections in time order."""
+        return np.matmul(inputs[np.newaxis], self.kernels) + self.biases
+
+    def run(self, projected):
+        """Run over time-ordered projections; returns (steps, out) or (out,)."""
+        if len(projected) == 2:
+            # The backward direction reads the window newest frame first
+            projected = np.stack([projected[0], projected[1, ::-1]])
+        outputs = run_lstm(projected, self.recurrents, self.units)
+        if not self.return_sequences:
+            # Each direction's state after reading the whole window
+            return outputs[:, -1].reshape(-1)
+        if len(outputs) == 2:
+            outputs = np.stack([outputs[0], outputs[1, ::-1]])
+        return np.concatenate(list(outputs), axis=-1)
+
+
+class DenseLayer:
+    def __init__(self, kernel, bias, activation):
+        self.kernel = kernel.astype(np.float32)
+        self.bias = bias.astype(np.float32)
+        self.activation = ACTIVATIONS[activation]
+
+    def run(self, inputs):
+        return self.activation(inputs @ self.kernel + self.bias)
+
+
+def _activation_name(activation):
+    return getattr(activation, "__name__", str(activation))
+
+
+def _lstm_weights(lstm):
+    """Check an LSTM layer is one ``run_lstm`` computes exactly; return its weights."""
+    config = lstm.get_config()
+    if (config.get("activation") != "tanh" or config.get("recurrent_activation") != "sigmoid"
+            or not config.get("use_bias", True) or config.get("stateful")):
+        raise ValueError(f"Unsupported LSTM configuration in {lstm.name}")
+    kernel, recurrent, bias = lstm.get_weights()
+    return kernel, recurrent, bias, config["units"], config["return_sequences"]
+
+
+def layers_from_keras(model):
+    """Translate a Keras sequence classifier into NumPy layers; ValueError if it uses anything else.
+
+    Supported: LSTM and Bidirectional(LSTM, merge_mode="concat") layers,
+    Dense layers and Dropout (a no-op at inference).
+    """
+    layers = []
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind in ("InputLayer", "Dropout"):
+            continue
+        if kind == "LSTM":
+            if layer.get_config().get("go_backwards"):
+                raise ValueError(f"Unsupported backwards LSTM {layer.name}")
+            kernel, recurrent, bias, units, return_sequences = _lstm_weights(layer)
+            layers.append(RecurrentLayer([kernel], [recurrent], [bias], units, return_sequences))
+        elif kind == "Bidirectional":
+            if layer.merge_mode != "concat" or type(layer.forward_layer).__name__ != "LSTM":
+                raise ValueError(f"Unsupported Bidirectional layer {layer.name}")
+            forward = _lstm_weights(layer.forward_layer)
+            backward = _lstm_weights(layer.backward_layer)
+            layers.append(RecurrentLayer([forward[0], backward[0]], [forward[1], backward[1]],
+                                         [forward[2], backward[2]], forward[3], forward[4]))
+        elif kind == "Dense":
+            kernel, bias = layer.get_weights()
+            activation = _activation_name(layer.activation)
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Unsupported activation {activation} in {layer.name}")
+            layers.append(DenseLayer(kernel, bias, activation))
+        else:
+            raise ValueError(f"Unsupported layer {kind} ({layer.name})")
+    if not layers or not isinstance(layers[0], RecurrentLayer):
+        raise ValueError("The model does not start with a recurrent layer")
+    return layers
+
+
+class WindowClassifier:
+    """Runs the squat sequence model over the current window in NumPy.
+
+    ``push`` multiplies one new (scaled) feature row into the first recurrent
+    layer's input space, once, and keeps it in a mirrored ring like
+    ``squat_features.FeatureWindow``; ``predict`` steps the recurrences over
+    the whole window from those cached projections. No state is carried from
+    one window to the next: every window starts from a zero state, as the
+    model was trained (and its backward direction has to read the window
+    newest frame first anyway), so results match ``model.predict`` on the
+    same window.
+    """
+
+    def __init__(self, layers, window):
+        self.layers = layers
+        self.window = window
+        first = layers[0]
+        self.projections = np.zeros((2 * window, len(first.kernels), 4 * first.units), dtype=np.float32)
+        self.next = 0
+        self.count = 0
+
+    @classmethod
+    def from_keras(cls, model, window):
+        return cls(layers_from_keras(model), window)
+
+    def push(self, row):
+        projected = self.layers[0].project(np.asarray(row, dtype=np.float32)[np.newaxis])[:, 0]
+        self.projections[self.next] = projected
+        self.projections[self.next + self.window] = projected
+        self.next = (self.next + 1) % self.window
+        self.count += 1
+
+    def predict(self):
+        """Class probabilities for the current window, or None until it is full."""
+        if self.count < self.window:
+            return None
+        projected = self.projections[self.next:self.next + self.window].transpose(1, 0, 2)
+        outputs = self.layers[0].run(projected)
+        for layer in self.layers[1:]:
+            if isinstance(layer, RecurrentLayer):
+                outputs = layer.run(layer.project(outputs))
+            else:
+                outputs = layer.run(outputs)
+        return outputs
+
+    def reset(self):
+        self.next = 0
+        self.count = 0
+
+
+def check_parity(model, sequences, window):
+    """Largest difference between ``WindowClassifier`` and ``model.predict`` over every window of ``sequences``.
+
+    ``sequences`` is a list of (frames, features) arrays of scaled feature
+    rows, e.g. recorded from sessions; each is pushed frame by frame and
+    every full window compared with the windowed Keras output.
+    """
+    classifier = WindowClassifier.from_keras(model, window)
+    worst = 0.0
+    for sequence in sequences:
+        sequence = np.asarray(sequence, dtype=np.float32)
+        if len(sequence) < window:
+            continue
+        classifier.reset()
+        predicted = []
+        for row in sequence:
+            classifier.push(row)
+            if classifier.count >= window:
+                predicted.append(classifier.predict())
+        windows = np.lib.stride_tricks.sliding_window_view(sequence, window, axis=0).transpose(0, 2, 1)
+        expected = model.predict(windows, batch_size=len(windows), verbose=0)
+        worst = max(worst, float(np.abs(np.array(predicted) - expected).max()))
+    return worst
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check NumPy squat inference against model.predict")
+    parser.add_argument("model", help="path to the .keras model")
+    parser.add_argument("recordings", nargs="*",
+                        help=".npy files of (frames, features) scaled rows; random rows if none")
+    parser.add_argument("--window", type=int, default=30)
+    args = parser.parse_args()
+
+    import tensorflow as tf
+
+    keras_model = tf.keras.models.load_model(args.model)
+    if args.recordings:
+        recorded = [np.load(path) for path in args.recordings]
+    else:
+        features = keras_model.input_shape[-1]
+        recorded = [np.random.default_rng(seed).normal(size=(args.window + 30, features)) for seed in range(3)]
+    difference = check_parity(keras_model, recorded, args.window)
+    print(f"Max difference from model.predict: {difference:.2e} "
+          f"({'ok' if difference <= PARITY_TOLERANCE else 'MISMATCH'})")
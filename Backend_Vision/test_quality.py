@@ -0,0 +1,28 @@
+import numpy as np
+
+from quality import QualityController
+
+
+def _sent(quality, times):
+    return sum(quality.take_frame(now) for now in times)
+
+
+def test_jittered_stream_at_fps_max_keeps_its_rate():
+    quality = QualityController(fps_max=30.0)
+    times = 1000.0 + np.arange(300) / 30.0 + np.random.default_rng(0).uniform(-0.003, 0.003, 300)
+    assert _sent(quality, times) == 300
+
+
+def test_faster_stream_is_held_to_fps():
+    quality = QualityController(fps_max=30.0)
+    quality.fps = 10.0
+    times = 1000.0 + np.arange(300) / 30.0
+    assert abs(_sent(quality, times) - 100) <= 1
+
+
+def test_schedule_restarts_after_a_gap():
+    quality = QualityController(fps_max=30.0)
+    assert _sent(quality, 1000.0 + np.arange(30) / 30.0) == 30
+    # Frames resume after a pause; no burst to catch up, then the normal rate
+    assert _sent(quality, 1010.0 + np.arange(30) / 30.0) == 30
+    assert not quality.take_frame(1010.0 + 29 / 30.0 + 0.001)
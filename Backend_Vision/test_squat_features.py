@@ -0,0 +1,206 @@
+"""The NumPy squat features against the original pandas pipeline.
+
+``BaselineSquatFeatures`` holds the feature methods of ``SquatAnalyzer`` as
+they were before the NumPy rewrite, copied unchanged (only the MediaPipe
+enum keypoint map is replaced by the same landmark indices). That code
+assumed 30 fps, so the window is fed a constant 1/30 s frame interval.
+"""
+from collections import deque
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from landmarks import (LEFT_ANKLE, LEFT_HIP, LEFT_KNEE, LEFT_SHOULDER, NOSE, NUM_LANDMARKS, RIGHT_ANKLE,
+                       RIGHT_HIP, RIGHT_KNEE, RIGHT_SHOULDER)
+from squat_features import FEATURE_NAMES, FeatureWindow, base_features
+
+pd = pytest.importorskip("pandas")
+
+WINDOW = 30
+FRAMES = 90
+
+
+class BaselineSquatFeatures:
+    def __init__(self, window_size=WINDOW):
+        self.features_buffer = deque(maxlen=window_size)
+        self.feature_names = list(FEATURE_NAMES)
+        self.keypoint_map = {
+            'NOSE': NOSE,
+            'LEFT_SHOULDER': LEFT_SHOULDER,
+            'RIGHT_SHOULDER': RIGHT_SHOULDER,
+            'LEFT_HIP': LEFT_HIP,
+            'RIGHT_HIP': RIGHT_HIP,
+            'LEFT_KNEE': LEFT_KNEE,
+            'RIGHT_KNEE': RIGHT_KNEE,
+            'LEFT_ANKLE': LEFT_ANKLE,
+            'RIGHT_ANKLE': RIGHT_ANKLE
+        }
+
+    def push(self, landmarks):
+        """The feature half of the old ``_process_frame``, after pose estimation."""
+        keypoints_dict = self._landmarks_to_keypoints_dict(landmarks)
+        keypoints_df = self._keypoints_dict_to_df(keypoints_dict)
+        angles_df = self._extract_anatomical_angles(keypoints_df)
+        feature_series = angles_df.iloc[0]
+        if len(self.features_buffer) > 0:
+            prev_features = self.features_buffer[-1]
+            feature_series = self._add_velocity_features(feature_series, prev_features)
+        else:
+            feature_series = self._add_velocity_features(feature_series)
+        self.features_buffer.append(feature_series)
+
+    def _landmarks_to_keypoints_dict(self, landmarks):
+        """Convert MediaPipe landmarks to format compatible with preprocessing code"""
+        keypoints = {}
+        for name, landmark_id in self.keypoint_map.items():
+            landmark = landmarks.landmark[landmark_id]
+            keypoints[f'{name}_x'] = landmark.x
+            keypoints[f'{name}_y'] = landmark.y
+            keypoints[f'{name}_z'] = landmark.z
+        return keypoints
+
+    def _keypoints_dict_to_df(self, keypoints_dict):
+        """Convert keypoints dictionary to DataFrame"""
+        return pd.DataFrame([keypoints_dict])
+
+    def _calculate_vector(self, df, point1, point2):
+        """Calculate vector between two keypoints"""
+        vec = np.zeros((len(df), 3))
+        vec[:, 0] = df[f'{point2}_x'].values - df[f'{point1}_x'].values
+        vec[:, 1] = df[f'{point2}_y'].values - df[f'{point1}_y'].values
+        vec[:, 2] = df[f'{point2}_z'].values - df[f'{point1}_z'].values
+        return vec
+
+    def _normalize_vector(self, vec):
+        """Normalize a vector to unit length"""
+        magnitude = np.sqrt(np.sum(vec**2, axis=1))
+        magnitude = np.where(magnitude == 0, 1e-10, magnitude)
+        vec_normalized = vec / magnitude[:, np.newaxis]
+        return vec_normalized
+
+    def _angle_between_vectors(self, vec1, vec2):
+        """Calculate the angle between two 3D vectors in degrees"""
+        vec1_norm = self._normalize_vector(vec1)
+        vec2_norm = self._normalize_vector(vec2)
+        dot_product = np.sum(vec1_norm * vec2_norm, axis=1)
+        dot_product = np.clip(dot_product, -1.0, 1.0)
+        angles = np.degrees(np.arccos(dot_product))
+        return angles
+
+    def _extract_anatomical_angles(self, df):
+        """Extract biomechanically relevant angles from keypoints"""
+        angles_df = pd.DataFrame()
+        
+        # Calculate vectors
+        shoulder_to_hip_left = self._calculate_vector(df, 'LEFT_SHOULDER', 'LEFT_HIP')
+        shoulder_to_hip_right = self._calculate_vector(df, 'RIGHT_SHOULDER', 'RIGHT_HIP')
+        hip_to_knee_left = self._calculate_vector(df, 'LEFT_HIP', 'LEFT_KNEE')
+        hip_to_knee_right = self._calculate_vector(df, 'RIGHT_HIP', 'RIGHT_KNEE')
+        knee_to_ankle_left = self._calculate_vector(df, 'LEFT_KNEE', 'LEFT_ANKLE')
+        knee_to_ankle_right = self._calculate_vector(df, 'RIGHT_KNEE', 'RIGHT_ANKLE')
+        nose_to_shoulder_mid = self._calculate_vector(df, 'NOSE', 'LEFT_SHOULDER')
+        
+        # Calculate angles
+        angles_df['left_knee_angle'] = self._angle_between_vectors(hip_to_knee_left, knee_to_ankle_left)
+        angles_df['right_knee_angle'] = self._angle_between_vectors(hip_to_knee_right, knee_to_ankle_right)
+        angles_df['left_hip_angle'] = self._angle_between_vectors(shoulder_to_hip_left, hip_to_knee_left)
+        angles_df['right_hip_angle'] = self._angle_between_vectors(shoulder_to_hip_right, hip_to_knee_right)
+        
+        # Back angles (relative to vertical)
+        vertical = np.zeros_like(shoulder_to_hip_left)
+        vertical[:, 1] = 1  # Y axis is usually vertical in pose estimation
+        angles_df['torso_vertical_angle'] = self._angle_between_vectors(shoulder_to_hip_left, vertical)
+        
+        # Head angle relative to torso
+        angles_df['head_torso_angle'] = self._angle_between_vectors(nose_to_shoulder_mid, shoulder_to_hip_left)
+        
+        # Knee distance (for detecting knee valgus/varus)
+        hip_width = np.sqrt(
+            (df['RIGHT_HIP_x'] - df['LEFT_HIP_x'])**2 + 
+            (df['RIGHT_HIP_z'] - df['LEFT_HIP_z'])**2
+        )
+        knee_distance = np.sqrt(
+            (df['RIGHT_KNEE_x'] - df['LEFT_KNEE_x'])**2 + 
+            (df['RIGHT_KNEE_z'] - df['LEFT_KNEE_z'])**2
+        )
+        angles_df['knee_distance_normalized'] = knee_distance / hip_width
+        
+        # Foot positioning
+        ankle_distance = np.sqrt(
+            (df['RIGHT_ANKLE_x'] - df['LEFT_ANKLE_x'])**2 + 
+            (df['RIGHT_ANKLE_z'] - df['LEFT_ANKLE_z'])**2
+        )
+        angles_df['ankle_distance_normalized'] = ankle_distance / hip_width
+        
+        # Squat depth - hip height relative to knee height
+        angles_df['left_squat_depth'] = df['LEFT_HIP_y'] - df['LEFT_KNEE_y']
+        angles_df['right_squat_depth'] = df['RIGHT_HIP_y'] - df['RIGHT_KNEE_y']
+        
+        return angles_df
+
+    def _add_velocity_features(self, current_features, prev_features=None, fps=30):
+        """Add velocity features based on frame-to-frame changes"""
+        # Create a Series with zeros for all velocity features
+        velocity_features = pd.Series({f'{col}_velocity': 0.0 for col in current_features.index 
+                                    if not col.endswith('_velocity')})
+        
+        if prev_features is not None:
+            # Calculate frame-to-frame changes for non-velocity features
+            for col in current_features.index:
+                if not col.endswith('_velocity') and col in prev_features:
+                    velocity_col = f'{col}_velocity'
+                    velocity_features[velocity_col] = (current_features[col] - prev_features[col]) * fps
+        
+        # Combine current features with velocity features
+        # Make sure to only include the original features and their velocities
+        result = pd.Series()
+        for feature_name in self.feature_names:
+            if feature_name in current_features:
+                result[feature_name] = current_features[feature_name]
+            elif feature_name in velocity_features:
+                result[feature_name] = velocity_features[feature_name]
+            else:
+                # If a feature is missing, set it to 0 to maintain the expected shape
+                result[feature_name] = 0.0
+                
+        return result
+
+
+def _mediapipe_landmarks(array):
+    """Landmark rows in the shape MediaPipe's ``pose_landmarks`` has."""
+    return SimpleNamespace(landmark=[SimpleNamespace(x=x, y=y, z=z, visibility=v) for x, y, z, v in array])
+
+
+@pytest.fixture
+def landmarks():
+    return np.random.default_rng(0).random((FRAMES, NUM_LANDMARKS, 4)).astype(np.float32)
+
+
+def _relative_difference(actual, expected):
+    return np.abs(actual - expected) / np.maximum(np.abs(expected), 1.0)
+
+
+def test_window_matches_baseline_pipeline(landmarks):
+    baseline = BaselineSquatFeatures()
+    window = FeatureWindow(WINDOW)
+    for frame in landmarks:
+        baseline.push(_mediapipe_landmarks(frame))
+        window.push(base_features(frame), 1 / 30)
+
+    expected = np.array([[row[name] for name in FEATURE_NAMES] for row in baseline.features_buffer])
+    actual = window.window()
+    assert actual.shape == expected.shape
+    assert _relative_difference(actual, expected).max() < 1e-5
+
+
+def test_scaled_rows_match_scaling_the_window(landmarks):
+    rng = np.random.default_rng(1)
+    mean = rng.normal(size=len(FEATURE_NAMES))
+    scale = rng.uniform(0.5, 50.0, len(FEATURE_NAMES))
+    window = FeatureWindow(WINDOW, mean, scale)
+    for frame in landmarks:
+        window.push(base_features(frame), 1 / 30)
+
+    expected = (window.window().astype(np.float64) - mean) / scale
+    assert _relative_difference(window.scaled_window(), expected).max() < 1e-5
@@ -0,0 +1,34 @@
+import time
+
+# Longest step a single frame may add to a duration. A longer gap (nobody in
+# view, a stalled pipeline) counts as this much rather than the whole gap.
+MAX_FRAME_STEP = 0.5
+
+
+class ExerciseClock:
+    """Turns frame timestamps into elapsed time for the analyzers.
+
+    Countdowns, report durations and velocities are computed from the time
+    between frames rather than from frame counts at an assumed 30 fps, so
+    they stay correct when the frame rate drops or varies. Timestamps are
+    ``time.monotonic()`` seconds, so wall-clock adjustments do not move them.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.last_timestamp = None
+        self.elapsed = 0.0
+
+    def tick(self, timestamp=None):
+        """Advance to ``timestamp`` (monotonic seconds, now if None) and return the step since the last tick."""
+        if timestamp is None:
+            timestamp = time.monotonic()
+        if self.last_timestamp is None:
+            step = 0.0
+        else:
+            step = min(max(timestamp - self.last_timestamp, 0.0), MAX_FRAME_STEP)
+        self.last_timestamp = timestamp
+        self.elapsed += step
+        return step
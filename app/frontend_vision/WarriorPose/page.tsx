@@ -2,6 +2,14 @@
 import React, { useState, useEffect, useRef } from "react";
 import { Sidebar } from "../../sidebar/page";
 import { useAudio } from "@/contexts/AudioContexts";
+import useFrameUploader from "@/utils/useFrameUploader";
+import usePoseOverlay, { overlayErrors } from "@/utils/usePoseOverlay";
+import {
+  parseVisionMessage,
+  frameUrl,
+  swapFrameUrl,
+  ackFrame,
+} from "@/utils/visionProtocol";
 
 export default function WarriorPose() {
   const [sidebarOpen, setSidebarOpen] = useState(false);
@@ -15,6 +23,7 @@ export default function WarriorPose() {
   const [formStatus, setFormStatus] = useState<"good" | "bad" | null>(null);
   const [goodFormFrames, setGoodFormFrames] = useState<number>(0);
   const [frameCount, setFrameCount] = useState<number>(0);
+  const [recordedSeconds, setRecordedSeconds] = useState<number>(0);
   const [errorCounts, setErrorCounts] = useState<Record<string, number>>({});
   const [isRecording, setIsRecording] = useState<boolean>(false);
   const wsRef = useRef<WebSocket | null>(null);
@@ -23,6 +32,10 @@ export default function WarriorPose() {
   const MAX_RECONNECT_ATTEMPTS = 5;
   const [autoReconnect, setAutoReconnect] = useState(false);
   const { audiobot, language } = useAudio();
+  const { videoRef, startCamera, stopCamera, sendFrame } =
+    useFrameUploader(wsRef);
+  // Skeleton drawn in the browser over the local preview (render: "overlay")
+  const { canvasRef, drawOverlay, clearOverlay } = usePoseOverlay(videoRef);
 
   // Initialize audio element
   useEffect(() => {
@@ -55,6 +68,8 @@ export default function WarriorPose() {
     setErrorMessage(null);
 
     const ws = new WebSocket("ws://localhost:8765");
+    // Frames arrive as binary messages (see utils/visionProtocol.ts)
+    ws.binaryType = "arraybuffer";
 
     ws.onopen = () => {
       console.log("WebSocket connected");
@@ -64,13 +79,21 @@ export default function WarriorPose() {
 
     ws.onmessage = (event) => {
       try {
-        const data = JSON.parse(event.data);
+        const data = parseVisionMessage(event.data);
         console.log("Received WebSocket message:", data);
 
-        if (data.type === "frame") {
-          setFrameSrc(`data:image/jpeg;base64,${data.data}`);
+        if (data.type === "frame" || data.type === "overlay") {
+          if (data.type === "overlay") {
+            drawOverlay(data.landmarks, overlayErrors(data));
+          } else {
+            setFrameSrc((prev) =>
+              swapFrameUrl(prev, frameUrl(data, "data"))
+            );
+          }
+          ackFrame(ws, data);
           setGoodFormFrames(data.good_form_frames || 0);
           setFrameCount(data.frame_count || 0);
+          setRecordedSeconds(data.recorded_seconds || 0);
           setErrorCounts(data.error_counts || {});
           setIsRecording(data.recording || false);
 
@@ -89,6 +112,9 @@ export default function WarriorPose() {
             setFeedback("Correct Form");
             setFormStatus("good");
           }
+        } else if (data.type === "ready") {
+          // Server is ready for the next uploaded camera frame
+          sendFrame();
         } else if (data.type === "audio") {
           if (data.audio_data && audiobot === "on") {
             const audioBlob = base64ToBlob(data.audio_data, "audio/mpeg");
@@ -118,6 +144,7 @@ export default function WarriorPose() {
             setFormStatus(null);
             setGoodFormFrames(0);
             setFrameCount(0);
+            setRecordedSeconds(0);
             setErrorCounts({});
             setIsRecording(false);
           }
@@ -175,17 +202,28 @@ export default function WarriorPose() {
     return new Blob([byteArray], { type: mimeType });
   };
 
-  const startWarriorPose = () => {
+  const startWarriorPose = async () => {
     if (!wsRef.current || wsRef.current.readyState !== WebSocket.OPEN) {
       setErrorMessage("Not connected to server. Please connect first.");
       return;
     }
 
     setErrorMessage(null);
-    wsRef.current.send(
+    try {
+      clearOverlay();
+      await startCamera();
+    } catch (e) {
+      console.error("Camera error:", e);
+      setErrorMessage("Could not access the camera.");
+      return;
+    }
+    wsRef.current?.send(
       JSON.stringify({
         action: "start",
         exercise: "Warrior",
+        source: "upload",
+        transport: "binary",
+        render: "overlay",
         audiobot,
         language,
       })
@@ -193,6 +231,7 @@ export default function WarriorPose() {
   };
 
   const stopWarriorPose = () => {
+    stopCamera();
     if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
       wsRef.current.send(JSON.stringify({ action: "stop" }));
     }
@@ -203,6 +242,7 @@ export default function WarriorPose() {
     setFormStatus(null);
     setGoodFormFrames(0);
     setFrameCount(0);
+    setRecordedSeconds(0);
     setErrorCounts({});
     setIsRecording(false);
   };
@@ -232,10 +272,9 @@ export default function WarriorPose() {
     return ((goodFormFrames / frameCount) * 100).toFixed(1);
   };
 
-  // Format time from frame count (assuming 30fps)
-  const formatTime = (frames: number) => {
-    const seconds = Math.floor(frames / 30);
-    return `${seconds}s`;
+  // Format the recorded time the server measured from frame timestamps
+  const formatTime = (seconds: number) => {
+    return `${Math.floor(seconds)}s`;
   };
 
   return (
@@ -256,14 +295,34 @@ export default function WarriorPose() {
         )}
 
         <div className="flex flex-col items-center justify-center h-[80vh] bg-gray-900 rounded-lg overflow-hidden relative">
-          {frameSrc ? (
+          <video
+            ref={videoRef}
+            className={
+              isRunning
+                ? "absolute inset-0 w-full h-full object-contain"
+                : "hidden"
+            }
+            muted
+            playsInline
+          />
+          <canvas
+            ref={canvasRef}
+            className={
+              isRunning
+                ? "absolute inset-0 w-full h-full object-contain pointer-events-none"
+                : "hidden"
+            }
+          />
+          {frameSrc || isRunning ? (
             <>
-              <img
-                src={frameSrc}
-                alt="Webcam Feed"
-                className="w-full h-full object-contain"
-                onError={() => setFrameSrc(null)}
-              />
+              {frameSrc && (
+                <img
+                  src={frameSrc}
+                  alt="Webcam Feed"
+                  className="relative w-full h-full object-contain"
+                  onError={() => setFrameSrc(null)}
+                />
+              )}
               {feedback && (
                 <div
                   className={`absolute bottom-6 left-1/2 transform -translate-x-1/2 px-6 py-2 max-w-sm w-[90%] rounded-xl text-center text-base font-semibold backdrop-blur-md shadow-lg ${
@@ -276,10 +335,10 @@ export default function WarriorPose() {
               <div className="absolute top-4 left-4 bg-black/50 p-2 rounded-lg text-white">
                 {isRecording ? (
                   <>
-                    <p>Recording: {formatTime(frameCount)}</p>
+                    <p>Recording: {formatTime(recordedSeconds)}</p>
                   </>
                 ) : (
-                  <p>{frameCount > 0 ? `${formatTime(frameCount)}` : ""}</p>
+                  <p>{frameCount > 0 ? `${formatTime(recordedSeconds)}` : ""}</p>
                 )}
               </div>
             </>
@@ -2,6 +2,14 @@
 import React, { useState, useEffect, useRef } from "react";
 import { Sidebar } from "../../sidebar/page";
 import { useAudio } from "@/contexts/AudioContexts";
+import useFrameUploader from "@/utils/useFrameUploader";
+import usePoseOverlay, { overlayErrors } from "@/utils/usePoseOverlay";
+import {
+  parseVisionMessage,
+  frameUrl,
+  swapFrameUrl,
+  ackFrame,
+} from "@/utils/visionProtocol";
 
 export default function LegRaises() {
   const [sidebarOpen, setSidebarOpen] = useState(false);
@@ -22,6 +30,10 @@ export default function LegRaises() {
   const MAX_RECONNECT_ATTEMPTS = 5;
 
   const { audiobot, language } = useAudio();
+  const { videoRef, startCamera, stopCamera, sendFrame } =
+    useFrameUploader(wsRef);
+  // Skeleton drawn in the browser over the local preview (render: "overlay")
+  const { canvasRef, drawOverlay, clearOverlay } = usePoseOverlay(videoRef);
 
   // Initialize audio element
   useEffect(() => {
@@ -53,6 +65,8 @@ export default function LegRaises() {
     setErrorMessage(null);
 
     const ws = new WebSocket("ws://localhost:8765");
+    // Frames arrive as binary messages (see utils/visionProtocol.ts)
+    ws.binaryType = "arraybuffer";
 
     ws.onopen = () => {
       console.log("WebSocket connected");
@@ -64,11 +78,18 @@ export default function LegRaises() {
 
     ws.onmessage = (event) => {
       try {
-        const data = JSON.parse(event.data);
+        const data = parseVisionMessage(event.data);
         console.log("Received WebSocket message:", data);
 
-        if (data.type === "frame") {
-          setFrameSrc(`data:image/jpeg;base64,${data.data}`);
+        if (data.type === "frame" || data.type === "overlay") {
+          if (data.type === "overlay") {
+            drawOverlay(data.landmarks, overlayErrors(data));
+          } else {
+            setFrameSrc((prev) =>
+              swapFrameUrl(prev, frameUrl(data, "data"))
+            );
+          }
+          ackFrame(ws, data);
           setPrediction(data.prediction || null);
           setConfidence(data.confidence || null);
           setRepCount(data.rep_count || 0);
@@ -81,6 +102,9 @@ export default function LegRaises() {
             );
             setFormStatus(data.prediction === "good" ? "good" : "bad");
           }
+        } else if (data.type === "ready") {
+          // Server is ready for the next uploaded camera frame
+          sendFrame();
         } else if (data.type === "audio") {
           // Handle audio data
           if (data.audio_data && audiobot === "on") {
@@ -157,13 +181,24 @@ export default function LegRaises() {
     return new Blob([byteArray], { type: mimeType });
   };
 
-  const startLegRaises = () => {
+  const startLegRaises = async () => {
     if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
       setErrorMessage(null);
-      wsRef.current.send(
+      try {
+        clearOverlay();
+        await startCamera();
+      } catch (e) {
+        console.error("Camera error:", e);
+        setErrorMessage("Could not access the camera.");
+        return;
+      }
+      wsRef.current?.send(
         JSON.stringify({
           action: "start",
           exercise: "LegRaises",
+          source: "upload",
+          transport: "binary",
+          render: "overlay",
           audiobot,
           language,
         })
@@ -175,6 +210,7 @@ export default function LegRaises() {
   };
 
   const stopLegRaises = () => {
+    stopCamera();
     if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
       wsRef.current.send(JSON.stringify({ action: "stop" }));
     } else {
@@ -206,14 +242,34 @@ export default function LegRaises() {
         )}
 
         <div className="flex flex-col items-center justify-center h-[80vh] bg-gray-900 rounded-lg overflow-hidden relative">
-          {frameSrc ? (
+          <video
+            ref={videoRef}
+            className={
+              isRunning
+                ? "absolute inset-0 w-full h-full object-contain"
+                : "hidden"
+            }
+            muted
+            playsInline
+          />
+          <canvas
+            ref={canvasRef}
+            className={
+              isRunning
+                ? "absolute inset-0 w-full h-full object-contain pointer-events-none"
+                : "hidden"
+            }
+          />
+          {frameSrc || isRunning ? (
             <>
-              <img
-                src={frameSrc}
-                alt="Webcam Feed"
-                className="w-full h-full object-contain"
-                onError={() => setFrameSrc(null)}
-              />
+              {frameSrc && (
+                <img
+                  src={frameSrc}
+                  alt="Webcam Feed"
+                  className="relative w-full h-full object-contain"
+                  onError={() => setFrameSrc(null)}
+                />
+              )}
               {feedback && (
                 <div
                   className={`absolute bottom-6 left-1/2 transform -translate-x-1/2 px-6 py-2 max-w-sm w-[90%] rounded-xl text-center text-base font-semibold backdrop-blur-md shadow-lg ${
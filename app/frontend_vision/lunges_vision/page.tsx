@@ -3,6 +3,14 @@
 import React, { useState, useEffect, useRef } from "react";
 import { Sidebar } from "../../sidebar/page";
 import { useAudio } from "@/contexts/AudioContexts";
+import useFrameUploader from "@/utils/useFrameUploader";
+import usePoseOverlay, { overlayErrors } from "@/utils/usePoseOverlay";
+import {
+  parseVisionMessage,
+  frameUrl,
+  swapFrameUrl,
+  ackFrame,
+} from "@/utils/visionProtocol";
 
 export default function LungeVision() {
   const [sidebarOpen, setSidebarOpen] = useState(false);
@@ -16,6 +24,7 @@ export default function LungeVision() {
   const [formStatus, setFormStatus] = useState<"good" | "bad" | null>(null);
   const [goodFormFrames, setGoodFormFrames] = useState<number>(0);
   const [frameCount, setFrameCount] = useState<number>(0);
+  const [recordedSeconds, setRecordedSeconds] = useState<number>(0);
   const [errorCounts, setErrorCounts] = useState<Record<string, number>>({});
   const [isRecording, setIsRecording] = useState<boolean>(false);
   const wsRef = useRef<WebSocket | null>(null);
@@ -24,6 +33,10 @@ export default function LungeVision() {
   const MAX_RECONNECT_ATTEMPTS = 5;
   const [autoReconnect, setAutoReconnect] = useState(false);
   const { audiobot, language } = useAudio();
+  const { videoRef, startCamera, stopCamera, sendFrame } =
+    useFrameUploader(wsRef);
+  // Skeleton drawn in the browser over the local preview (render: "overlay")
+  const { canvasRef, drawOverlay, clearOverlay } = usePoseOverlay(videoRef);
 
   // Initialize audio element
   useEffect(() => {
@@ -56,6 +69,8 @@ export default function LungeVision() {
     setErrorMessage(null);
 
     const ws = new WebSocket("ws://localhost:8765");
+    // Frames arrive as binary messages (see utils/visionProtocol.ts)
+    ws.binaryType = "arraybuffer";
 
     ws.onopen = () => {
       console.log("WebSocket connected");
@@ -67,13 +82,24 @@ export default function LungeVision() {
 
     ws.onmessage = (event) => {
       try {
-        const data = JSON.parse(event.data);
+        const data = parseVisionMessage(event.data);
         console.log("Received WebSocket message:", data);
 
-        if (data.type === "frame" && data.frame) {
-          setFrameSrc(`data:image/jpeg;base64,${data.frame}`);
+        if (
+          (data.type === "frame" && (data.frame || data.frameUrl)) ||
+          data.type === "overlay"
+        ) {
+          if (data.type === "overlay") {
+            drawOverlay(data.landmarks, overlayErrors(data));
+          } else {
+            setFrameSrc((prev) =>
+              swapFrameUrl(prev, frameUrl(data, "frame"))
+            );
+          }
+          ackFrame(ws, data);
           setGoodFormFrames(data.good_form_frames || 0);
           setFrameCount(data.frame_count || 0);
+          setRecordedSeconds(data.recorded_seconds || 0);
           setErrorCounts(data.error_counts || {});
           setIsRecording(data.recording || false);
 
@@ -94,6 +120,9 @@ export default function LungeVision() {
               setFormStatus("good");
             }
           }
+        } else if (data.type === "ready") {
+          // Server is ready for the next uploaded camera frame
+          sendFrame();
         } else if (data.type === "audio") {
           if (data.audio_data && audiobot === "on") {
             const audioBlob = base64ToBlob(data.audio_data, "audio/mpeg");
@@ -128,6 +157,7 @@ export default function LungeVision() {
             setFormStatus(null);
             setGoodFormFrames(0);
             setFrameCount(0);
+            setRecordedSeconds(0);
             setErrorCounts({});
             setIsRecording(false);
           }
@@ -189,17 +219,28 @@ export default function LungeVision() {
     return new Blob([byteArray], { type: mimeType });
   };
 
-  const startLunges = () => {
+  const startLunges = async () => {
     if (!wsRef.current || wsRef.current.readyState !== WebSocket.OPEN) {
       setErrorMessage("Not connected to server. Please connect first.");
       return;
     }
 
     setErrorMessage(null);
-    wsRef.current.send(
+    try {
+      clearOverlay();
+      await startCamera();
+    } catch (e) {
+      console.error("Camera error:", e);
+      setErrorMessage("Could not access the camera.");
+      return;
+    }
+    wsRef.current?.send(
       JSON.stringify({
         action: "start",
         exercise: "Lunges",
+        source: "upload",
+        transport: "binary",
+        render: "overlay",
         audiobot,
         language,
       })
@@ -207,6 +248,7 @@ export default function LungeVision() {
   };
 
   const stopLunges = () => {
+    stopCamera();
     if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
       wsRef.current.send(JSON.stringify({ action: "stop" }));
     }
@@ -217,6 +259,7 @@ export default function LungeVision() {
     setFormStatus(null);
     setGoodFormFrames(0);
     setFrameCount(0);
+    setRecordedSeconds(0);
     setErrorCounts({});
     setIsRecording(false);
   };
@@ -249,10 +292,9 @@ export default function LungeVision() {
     return ((goodFormFrames / frameCount) * 100).toFixed(1);
   };
 
-  // Format time from frame count (assuming 30fps)
-  const formatTime = (frames: number) => {
-    const seconds = Math.floor(frames / 30);
-    return `${seconds}s`;
+  // Format the recorded time the server measured from frame timestamps
+  const formatTime = (seconds: number) => {
+    return `${Math.floor(seconds)}s`;
   };
 
   return (
@@ -271,17 +313,37 @@ export default function LungeVision() {
         )}
 
         <div className="flex flex-col items-center justify-center h-[80vh] bg-gray-900 rounded-lg overflow-hidden relative">
-          {frameSrc ? (
+          <video
+            ref={videoRef}
+            className={
+              isRunning
+                ? "absolute inset-0 w-full h-full object-contain"
+                : "hidden"
+            }
+            muted
+            playsInline
+          />
+          <canvas
+            ref={canvasRef}
+            className={
+              isRunning
+                ? "absolute inset-0 w-full h-full object-contain pointer-events-none"
+                : "hidden"
+            }
+          />
+          {frameSrc || isRunning ? (
             <>
-              <img
-                src={frameSrc}
-                alt="Webcam Feed"
-                className="w-full h-full object-contain"
-                onError={() => {
-                  console.error("Image load error");
-                  setFrameSrc(null);
-                }}
-              />
+              {frameSrc && (
+                <img
+                  src={frameSrc}
+                  alt="Webcam Feed"
+                  className="relative w-full h-full object-contain"
+                  onError={() => {
+                    console.error("Image load error");
+                    setFrameSrc(null);
+                  }}
+                />
+              )}
               {feedback && (
                 <div
                   className={`absolute bottom-6 left-1/2 transform -translate-x-1/2 px-6 py-2 max-w-sm w-[90%] rounded-xl text-center text-base font-semibold backdrop-blur-md shadow-lg ${
@@ -294,10 +356,10 @@ export default function LungeVision() {
               <div className="absolute top-4 left-4 bg-black/50 p-2 rounded-lg text-white">
                 {isRecording ? (
                   <>
-                    <p>Recording: {formatTime(frameCount)}</p>
+                    <p>Recording: {formatTime(recordedSeconds)}</p>
                   </>
                 ) : (
-                  <p>{frameCount > 0 ? `${formatTime(frameCount)}` : ""}</p>
+                  <p>{frameCount > 0 ? `${formatTime(recordedSeconds)}` : ""}</p>
                 )}
               </div>
             </>
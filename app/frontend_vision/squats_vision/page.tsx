@@ -2,6 +2,14 @@
 import React, { useState, useEffect, useRef } from "react";
 import { Sidebar } from "../../sidebar/page";
 import { useAudio } from "@/contexts/AudioContexts";
+import useFrameUploader from "@/utils/useFrameUploader";
+import usePoseOverlay, { overlayErrors } from "@/utils/usePoseOverlay";
+import {
+  parseVisionMessage,
+  frameUrl,
+  swapFrameUrl,
+  ackFrame,
+} from "@/utils/visionProtocol";
 
 export default function SquatVision() {
   const [sidebarOpen, setSidebarOpen] = useState(false);
@@ -21,6 +29,10 @@ export default function SquatVision() {
   const audioRef = useRef<HTMLAudioElement | null>(null); // Ref for audio element
   const MAX_RECONNECT_ATTEMPTS = 5;
   const { audiobot, language } = useAudio();
+  const { videoRef, startCamera, stopCamera, sendFrame } =
+    useFrameUploader(wsRef);
+  // Skeleton drawn in the browser over the local preview (render: "overlay")
+  const { canvasRef, drawOverlay, clearOverlay } = usePoseOverlay(videoRef);
 
   // Initialize audio element
   useEffect(() => {
@@ -52,6 +64,8 @@ export default function SquatVision() {
     setErrorMessage(null);
 
     const ws = new WebSocket("ws://localhost:8765");
+    // Frames arrive as binary messages (see utils/visionProtocol.ts)
+    ws.binaryType = "arraybuffer";
 
     ws.onopen = () => {
       console.log("WebSocket connected");
@@ -63,11 +77,18 @@ export default function SquatVision() {
 
     ws.onmessage = (event) => {
       try {
-        const data = JSON.parse(event.data);
+        const data = parseVisionMessage(event.data);
         console.log("Received WebSocket message:", data);
 
-        if (data.type === "frame") {
-          setFrameSrc(`data:image/jpeg;base64,${data.data}`);
+        if (data.type === "frame" || data.type === "overlay") {
+          if (data.type === "overlay") {
+            drawOverlay(data.landmarks, overlayErrors(data));
+          } else {
+            setFrameSrc((prev) =>
+              swapFrameUrl(prev, frameUrl(data, "data"))
+            );
+          }
+          ackFrame(ws, data);
           setPrediction(data.prediction || null);
           setConfidence(data.confidence || null);
           setRepCount(data.rep_count || 0);
@@ -90,6 +111,9 @@ export default function SquatVision() {
             setFeedback(null);
             setFormStatus(null);
           }
+        } else if (data.type === "ready") {
+          // Server is ready for the next uploaded camera frame
+          sendFrame();
         } else if (data.type === "audio") {
           if (data.audio_data && audiobot === "on") {
             const audioBlob = base64ToBlob(data.audio_data, "audio/mpeg");
@@ -167,13 +191,24 @@ export default function SquatVision() {
     return new Blob([byteArray], { type: mimeType });
   };
 
-  const startSquats = () => {
+  const startSquats = async () => {
     if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
       setErrorMessage(null);
-      wsRef.current.send(
+      try {
+        clearOverlay();
+        await startCamera();
+      } catch (e) {
+        console.error("Camera error:", e);
+        setErrorMessage("Could not access the camera.");
+        return;
+      }
+      wsRef.current?.send(
         JSON.stringify({
           action: "start",
           exercise: "Squats",
+          source: "upload",
+          transport: "binary",
+          render: "overlay",
           audiobot,
           language,
         })
@@ -185,6 +220,7 @@ export default function SquatVision() {
   };
 
   const stopSquats = () => {
+    stopCamera();
     if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
       wsRef.current.send(JSON.stringify({ action: "stop" }));
     } else {
@@ -216,17 +252,37 @@ export default function SquatVision() {
         )}
 
         <div className="flex flex-col items-center justify-center h-[80vh] bg-gray-900 rounded-lg overflow-hidden relative">
-          {frameSrc ? (
+          <video
+            ref={videoRef}
+            className={
+              isRunning
+                ? "absolute inset-0 w-full h-full object-contain"
+                : "hidden"
+            }
+            muted
+            playsInline
+          />
+          <canvas
+            ref={canvasRef}
+            className={
+              isRunning
+                ? "absolute inset-0 w-full h-full object-contain pointer-events-none"
+                : "hidden"
+            }
+          />
+          {frameSrc || isRunning ? (
             <>
-              <img
-                src={frameSrc}
-                alt="Webcam Feed"
-                className="w-full h-full object-contain"
-                onError={(e) => {
-                  console.error("Error loading image:", e);
-                  setFrameSrc(null);
-                }}
-              />
+              {frameSrc && (
+                <img
+                  src={frameSrc}
+                  alt="Webcam Feed"
+                  className="relative w-full h-full object-contain"
+                  onError={(e) => {
+                    console.error("Error loading image:", e);
+                    setFrameSrc(null);
+                  }}
+                />
+              )}
               {feedback && (
                 <div
                   className={`absolute bottom-6 left-1/2 transform -translate-x-1/2 px-6 py-2 max-w-sm w-[90%] rounded-xl text-center text-base font-semibold backdrop-blur-md shadow-lg ${
@@ -0,0 +1,91 @@
+import { useRef, useEffect, MutableRefObject } from "react";
+
+interface FrameUploaderOptions {
+  width?: number;
+  quality?: number;
+}
+
+interface FrameUploader {
+  videoRef: MutableRefObject<HTMLVideoElement | null>;
+  startCamera: () => Promise<void>;
+  stopCamera: () => void;
+  sendFrame: () => void;
+}
+
+// Streams the local camera to the vision server as binary JPEG messages.
+// The server pulls frames: call sendFrame() each time it sends {type: "ready"}.
+export default function useFrameUploader(
+  wsRef: MutableRefObject<WebSocket | null>,
+  { width = 640, quality = 0.7 }: FrameUploaderOptions = {}
+): FrameUploader {
+  const videoRef = useRef<HTMLVideoElement | null>(null);
+  const streamRef = useRef<MediaStream | null>(null);
+  const canvasRef = useRef<HTMLCanvasElement | null>(null);
+
+  const startCamera = async () => {
+    if (streamRef.current) {
+      return;
+    }
+    const stream = await navigator.mediaDevices.getUserMedia({
+      video: { width: { ideal: width } },
+      audio: false,
+    });
+    streamRef.current = stream;
+    if (videoRef.current) {
+      videoRef.current.srcObject = stream;
+      await videoRef.current.play();
+    }
+  };
+
+  const stopCamera = () => {
+    if (streamRef.current) {
+      streamRef.current.getTracks().forEach((track) => track.stop());
+      streamRef.current = null;
+    }
+    if (videoRef.current) {
+      videoRef.current.srcObject = null;
+    }
+  };
+
+  const sendFrame = () => {
+    const video = videoRef.current;
+    const ws = wsRef.current;
+    if (!ws || ws.readyState !== WebSocket.OPEN || !streamRef.current) {
+      return;
+    }
+    // Camera still warming up; try again shortly
+    if (!video || video.readyState < 2 || video.videoWidth === 0) {
+      setTimeout(sendFrame, 50);
+      return;
+    }
+
+    if (!canvasRef.current) {
+      canvasRef.current = document.createElement("canvas");
+    }
+    const canvas = canvasRef.current;
+    const scale = Math.min(1, width / video.videoWidth);
+    canvas.width = Math.round(video.videoWidth * scale);
+    canvas.height = Math.round(video.videoHeight * scale);
+    const ctx = canvas.getContext("2d");
+    if (!ctx) {
+      return;
+    }
+    ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
+    canvas.toBlob(
+      (blob) => {
+        if (!blob || ws.readyState !== WebSocket.OPEN) {
+          return;
+        }
+        blob.arrayBuffer().then((buffer) => ws.send(buffer));
+      },
+      "image/jpeg",
+      quality
+    );
+  };
+
+  useEffect(() => {
+    return () => stopCamera();
+  }, []);
+
+  return { videoRef, startCamera, stopCamera, sendFrame };
+}
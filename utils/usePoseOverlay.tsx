@@ -0,0 +1,104 @@
+import { useRef, MutableRefObject } from "react";
+
+// Pairs of landmark indices joined by a bone (MediaPipe Pose's POSE_CONNECTIONS)
+export const POSE_CONNECTIONS: [number, number][] = [
+  [0, 1], [1, 2], [2, 3], [3, 7], [0, 4], [4, 5], [5, 6], [6, 8],
+  [9, 10], [11, 12], [11, 13], [13, 15], [15, 17], [15, 19], [15, 21],
+  [17, 19], [12, 14], [14, 16], [16, 18], [16, 20], [16, 22], [18, 20],
+  [11, 23], [12, 24], [23, 24], [23, 25], [24, 26], [25, 27], [26, 28],
+  [27, 29], [28, 30], [29, 31], [30, 32], [27, 31], [28, 32],
+];
+
+// Landmarks below this visibility are not drawn
+const MIN_VISIBILITY = 0.5;
+
+// [x, y, z, visibility] with x and y normalized to the frame size
+export type LandmarkRow = [number, number, number, number];
+
+interface PoseOverlay {
+  canvasRef: MutableRefObject<HTMLCanvasElement | null>;
+  drawOverlay: (landmarks: LandmarkRow[] | null, errors?: string[]) => void;
+  clearOverlay: () => void;
+}
+
+// Errors in an overlay message, whichever analyzer sent it
+export function overlayErrors(data: Record<string, any>): string[] {
+  if (Array.isArray(data.errors)) {
+    return data.errors;
+  }
+  return data.error_text ? [data.error_text] : [];
+}
+
+// Draws the skeleton and form errors from {type: "overlay"} messages on a
+// canvas stacked over the local camera preview, so the server never has to
+// draw on or encode the frame. Give the canvas the same object-fit as the
+// video and the two line up.
+export default function usePoseOverlay(
+  videoRef: MutableRefObject<HTMLVideoElement | null>
+): PoseOverlay {
+  const canvasRef = useRef<HTMLCanvasElement | null>(null);
+
+  const clearOverlay = () => {
+    const canvas = canvasRef.current;
+    canvas?.getContext("2d")?.clearRect(0, 0, canvas.width, canvas.height);
+  };
+
+  const drawOverlay = (landmarks: LandmarkRow[] | null, errors: string[] = []) => {
+    const canvas = canvasRef.current;
+    const video = videoRef.current;
+    if (!canvas || !video || video.videoWidth === 0) {
+      return;
+    }
+    // Draw in video pixels; CSS scales the canvas together with the video
+    if (canvas.width !== video.videoWidth || canvas.height !== video.videoHeight) {
+      canvas.width = video.videoWidth;
+      canvas.height = video.videoHeight;
+    }
+    const ctx = canvas.getContext("2d");
+    if (!ctx) {
+      return;
+    }
+    ctx.clearRect(0, 0, canvas.width, canvas.height);
+    if (!landmarks) {
+      return;
+    }
+
+    const point = ([x, y]: LandmarkRow): [number, number] => [
+      x * canvas.width,
+      y * canvas.height,
+    ];
+    const visible = (i: number) => landmarks[i] && landmarks[i][3] >= MIN_VISIBILITY;
+
+    ctx.lineWidth = 2;
+    ctx.strokeStyle = "#ffffff";
+    ctx.beginPath();
+    for (const [a, b] of POSE_CONNECTIONS) {
+      if (visible(a) && visible(b)) {
+        ctx.moveTo(...point(landmarks[a]));
+        ctx.lineTo(...point(landmarks[b]));
+      }
+    }
+    ctx.stroke();
+
+    ctx.fillStyle = "#ff0000";
+    landmarks.forEach((row, i) => {
+      if (visible(i)) {
+        const [x, y] = point(row);
+        ctx.beginPath();
+        ctx.arc(x, y, 3, 0, 2 * Math.PI);
+        ctx.fill();
+      }
+    });
+
+    ctx.font = "bold 20px sans-serif";
+    if (errors.length) {
+      ctx.fillStyle = "#ff0000";
+      errors.forEach((error, i) => ctx.fillText(error, 10, 30 + i * 30));
+    } else {
+      ctx.fillStyle = "#00ff00";
+      ctx.fillText("Correct Form", 10, 30);
+    }
+  };
+
+  return { canvasRef, drawOverlay, clearOverlay };
+}
@@ -0,0 +1,73 @@
+// Binary frame messages from the vision server (see Backend_Vision/protocol.py):
+// a 21-byte little-endian header (version, session id, seq, capture timestamp,
+// metadata length), then JSON metadata, then the raw JPEG bytes.
+const HEADER_SIZE = 21;
+const PROTOCOL_VERSION = 1;
+
+export type VisionMessage = Record<string, any>;
+
+export function decodeFrameMessage(buffer: ArrayBuffer): VisionMessage {
+  const view = new DataView(buffer);
+  const version = view.getUint8(0);
+  if (version !== PROTOCOL_VERSION) {
+    throw new Error(`Unsupported frame protocol version: ${version}`);
+  }
+  const sessionId = view.getUint32(1, true);
+  const seq = view.getUint32(5, true);
+  const timestamp = view.getFloat64(9, true);
+  const metaLength = view.getUint32(17, true);
+
+  const metaEnd = HEADER_SIZE + metaLength;
+  const metadata = JSON.parse(
+    new TextDecoder().decode(new Uint8Array(buffer, HEADER_SIZE, metaLength))
+  );
+  const jpeg = new Blob([new Uint8Array(buffer, metaEnd)], {
+    type: "image/jpeg",
+  });
+
+  return {
+    ...metadata,
+    session_id: sessionId,
+    seq,
+    timestamp,
+    captured_at: timestamp,
+    frameUrl: URL.createObjectURL(jpeg),
+  };
+}
+
+export function parseVisionMessage(data: string | ArrayBuffer): VisionMessage {
+  return typeof data === "string"
+    ? JSON.parse(data)
+    : decodeFrameMessage(data);
+}
+
+// Image source for a frame message, whichever transport it arrived on
+export function frameUrl(data: VisionMessage, key: string): string {
+  return data.frameUrl ?? `data:image/jpeg;base64,${data[key]}`;
+}
+
+// Use as setFrameSrc((prev) => swapFrameUrl(prev, next)) so Blob URLs are freed
+export function swapFrameUrl(prev: string | null, next: string | null) {
+  if (prev && prev.startsWith("blob:") && prev !== next) {
+    URL.revokeObjectURL(prev);
+  }
+  return next;
+}
+
+// Tell the server this frame reached the screen, so it can measure
+// capture-to-render latency and how many frames were actually rendered.
+// Sent on the next animation frame, i.e. once the update has been painted.
+export function ackFrame(ws: WebSocket, data: VisionMessage) {
+  if (data.seq === undefined) return;
+  requestAnimationFrame(() => {
+    if (ws.readyState !== WebSocket.OPEN) return;
+    ws.send(
+      JSON.stringify({
+        action: "ack",
+        session_id: data.session_id,
+        seq: data.seq,
+        rendered_at: Date.now() / 1000,
+      })
+    );
+  });
+}